@@ -10,15 +10,104 @@ class Settings:
 
     # Elasticsearch
     ES_HOST = os.getenv("ES_HOST", "http://localhost:9200")
+    # Alias over the versioned indices built by scripts/ingest_shanghai.py
     ES_INDEX = os.getenv("ES_INDEX", "poi_v1")
+    # Mapping built by ingestion: 2 = combined `search_text` + `.norm`
+    # category fields, 1 = per-field (older indices)
+    ES_SCHEMA_VERSION = int(os.getenv("ES_SCHEMA_VERSION", "2"))
+    # Mapping recall queries are built for: "auto" reads `_meta.schema_version`
+    # of the indices behind ES_INDEX (v1 until one is found), or pin 1 / 2
+    RECALL_SCHEMA_VERSION = os.getenv("RECALL_SCHEMA_VERSION", "auto")
+    RECALL_SCHEMA_CHECK_SECONDS = float(os.getenv("RECALL_SCHEMA_CHECK_SECONDS", "60"))
+    # Serving settings restored on a freshly loaded index before it is published
+    ES_REPLICAS = int(os.getenv("ES_REPLICAS", "0"))  # single-node docker-compose
+    ES_REFRESH_INTERVAL = os.getenv("ES_REFRESH_INTERVAL", "1s")
+
+    # Recall backend: "es" | "memory" (in-process engine, no ES round-trip)
+    RECALL_BACKEND = os.getenv("RECALL_BACKEND", "es")
+    # With RECALL_BACKEND=es, answer from the in-process engine while ES is down
+    RECALL_MEMORY_FALLBACK = (
+        os.getenv("RECALL_MEMORY_FALLBACK", "false").lower() == "true"
+    )
+    # NDJSON dump loaded by the in-process engine (falls back to an ES scroll)
+    RECALL_MEMORY_SNAPSHOT = os.getenv(
+        "RECALL_MEMORY_SNAPSHOT", "data/poi_snapshot.ndjson"
+    )
+    MEMORY_GRID_DEG = float(os.getenv("MEMORY_GRID_DEG", "0.01"))
+    # Queries scoring more candidate docs than this run in a worker thread
+    MEMORY_INLINE_SCAN_DOCS = int(os.getenv("MEMORY_INLINE_SCAN_DOCS", "2000"))
 
     # Qwen / LLM
     LLM_PORT = int(os.getenv("LLM_PORT", "8001"))
+    # Inference backend for llm_server.py: "mlx" (Apple silicon),
+    # "llama_cpp" (CPU / Linux, GGUF weights) or "fake" (tests & benchmarks)
+    LLM_BACKEND = os.getenv("LLM_BACKEND", "mlx")
     LLM_MODEL_PATH = os.getenv("LLM_MODEL_PATH", "data/models/Qwen3-0.6B-MLX-bf16")
+    LLM_GGUF_PATH = os.getenv("LLM_GGUF_PATH", "data/models/Qwen3-0.6B-Q8_0.gguf")
+    LLM_CONTEXT_SIZE = int(os.getenv("LLM_CONTEXT_SIZE", "4096"))
+    LLM_CPU_THREADS = int(os.getenv("LLM_CPU_THREADS", "0"))  # 0 = llama.cpp default
+    LLM_CPU_PROMPT_CACHE_MB = int(os.getenv("LLM_CPU_PROMPT_CACHE_MB", "256"))
+    LLM_FAKE_TTFT_MS = float(os.getenv("LLM_FAKE_TTFT_MS", "50"))
+    LLM_FAKE_TOKEN_MS = float(os.getenv("LLM_FAKE_TOKEN_MS", "5"))
     LLM_API_URL = os.getenv("LLM_API_URL", f"http://localhost:{LLM_PORT}/generate")
     LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "512"))
     LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.7"))
 
+    # Stream generations and stop once the JSON payload closes. Streamed
+    # requests bypass the server's micro-batcher (LLM_BATCH_WINDOW_MS), so
+    # this trades batched throughput for fewer generated tokens per request;
+    # worth it on an idle server or when batching is disabled
+    LLM_STREAMING = os.getenv("LLM_STREAMING", "false").lower() == "true"
+
+    # System-prompt prefix KV cache entries in the LLM server (0 disables)
+    LLM_PREFIX_CACHE_SIZE = int(os.getenv("LLM_PREFIX_CACHE_SIZE", "8"))
+
+    # Inference jobs allowed to wait for the LLM worker thread (0 = unbounded)
+    LLM_WORKER_MAX_QUEUE = int(os.getenv("LLM_WORKER_MAX_QUEUE", "64"))
+    # How long LLM server shutdown waits for the running inference
+    LLM_WORKER_STOP_TIMEOUT_SECONDS = float(
+        os.getenv("LLM_WORKER_STOP_TIMEOUT_SECONDS", "10")
+    )
+
+    # LLM Server Micro-Batching (window 0 disables)
+    LLM_BATCH_WINDOW_MS = float(os.getenv("LLM_BATCH_WINDOW_MS", "10"))
+    LLM_MAX_BATCH_SIZE = int(os.getenv("LLM_MAX_BATCH_SIZE", "8"))
+
+    # LLM Client Transport (pooled keep-alive session)
+    LLM_POOL_LIMIT = int(os.getenv("LLM_POOL_LIMIT", "32"))
+    LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))
+    LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "1.0"))
+    LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "30.0"))
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+    # Optional Unix domain socket to llm_server.py (empty = TCP)
+    LLM_UDS_PATH = os.getenv("LLM_UDS_PATH", "")
+
+    # NLP Phase
+    # "split": separate analyze + rewrite calls, "joint": one combined generation
+    NLP_MODE = os.getenv("NLP_MODE", "split")
+
+    # Latency budget per /search (ms, 0 disables) and the share NLP may use;
+    # past it the request degrades to recall on the original query
+    SEARCH_LATENCY_BUDGET_MS = float(os.getenv("SEARCH_LATENCY_BUDGET_MS", "1500"))
+    NLP_BUDGET_SHARE = float(os.getenv("NLP_BUDGET_SHARE", "0.6"))
+    # NLP calls left running past their budget to fill the cache; further
+    # late calls are cancelled so they release their LLM slot
+    NLP_MAX_BACKGROUND_TASKS = int(os.getenv("NLP_MAX_BACKGROUND_TASKS", "4"))
+
+    # Rule-based intent fast path (skips the LLM for bare category / POI names)
+    FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+    FAST_PATH_MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", "0.8"))
+    FAST_PATH_REFRESH_SECONDS = float(os.getenv("FAST_PATH_REFRESH_SECONDS", "600"))
+    FAST_PATH_MAX_TERMS = int(os.getenv("FAST_PATH_MAX_TERMS", "1000"))
+    FAST_PATH_MAX_NAMES = int(os.getenv("FAST_PATH_MAX_NAMES", "50000"))
+
+    # NLP Result Cache (size 0 disables)
+    NLP_CACHE_SIZE = int(os.getenv("NLP_CACHE_SIZE", "2048"))
+    NLP_CACHE_TTL_SECONDS = float(os.getenv("NLP_CACHE_TTL_SECONDS", "3600"))
+    NLP_CACHE_FALLBACK_TTL_SECONDS = float(
+        os.getenv("NLP_CACHE_FALLBACK_TTL_SECONDS", "10")
+    )
+
     # OpenAI compatible API (legacy support)
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "LOCAL")
     OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", f"http://localhost:{LLM_PORT}/v1")
@@ -36,6 +125,14 @@ class Settings:
     RANK_DIST_SIGMA = float(os.getenv("RANK_DIST_SIGMA", "2.0"))
     RANK_POP_MAX = int(os.getenv("RANK_POP_MAX", "100"))
     RANK_TOP_K = int(os.getenv("RANK_TOP_K", "10"))
+    # "numpy" (vectorised VectorRanker) | "python" (reference per-item Ranker)
+    RANK_ENGINE = os.getenv("RANK_ENGINE", "numpy")
+    # "python" (Ranker.rank over recalled hits) | "es" (function_score in the index)
+    RANK_MODE = os.getenv("RANK_MODE", "python")
+    # ES mode: hits per sub-queue (already ranked; more than RANK_TOP_K adds
+    # nothing, fewer can miss results) and relevance saturation pivot
+    RANK_ES_SEARCH_SIZE = int(os.getenv("RANK_ES_SEARCH_SIZE", str(RANK_TOP_K)))
+    RANK_ES_REL_PIVOT = float(os.getenv("RANK_ES_REL_PIVOT", "5.0"))
 
     # Ranking Weights
     WEIGHT_REL = float(os.getenv("WEIGHT_REL", "0.5"))
@@ -50,14 +147,58 @@ class Settings:
     BOOST_ADDR = float(os.getenv("BOOST_ADDR", "1.2"))
     BOOST_REWRITE = float(os.getenv("BOOST_REWRITE", "1.2"))
     BOOST_CATEGORY = float(os.getenv("BOOST_CATEGORY", "2.0"))
+    # Schema v2: query terms that must hit the combined `search_text` field
+    # (ES minimum_should_match syntax; "2<75%" = all of 1-2 terms, else 75%)
+    RECALL_TEXT_MIN_SHOULD_MATCH = os.getenv("RECALL_TEXT_MIN_SHOULD_MATCH", "2<75%")
 
     # Search & Dedup
     SEARCH_SIZE = int(os.getenv("SEARCH_SIZE", "10"))
     DEDUP_PRECISION = int(os.getenv("DEDUP_PRECISION", "3"))
+    # "parallel" (one ES request per sub-queue) | "msearch" (one _msearch round-trip)
+    # | "streaming" (merge as sub-queues finish, stop at RECALL_DEADLINE_MS)
+    RECALL_MODE = os.getenv("RECALL_MODE", "parallel")
+    RECALL_DEADLINE_MS = float(os.getenv("RECALL_DEADLINE_MS", "300"))
+    # Start the "original" sub-queue alongside NLP instead of after it
+    SPECULATIVE_RECALL = os.getenv("SPECULATIVE_RECALL", "true").lower() == "true"
+
+    # Recall cache: raw hits per sub-query, shared by users in one geohash tile
+    # (0 disables; e.g. 4096 for dense areas)
+    RECALL_CACHE_SIZE = int(os.getenv("RECALL_CACHE_SIZE", "0"))
+    RECALL_CACHE_TTL_SECONDS = float(os.getenv("RECALL_CACHE_TTL_SECONDS", "300"))
+    RECALL_CACHE_GEOHASH_PRECISION = int(os.getenv("RECALL_CACHE_GEOHASH_PRECISION", "6"))
+    RECALL_CACHE_RADIUS_BUCKET_KM = float(os.getenv("RECALL_CACHE_RADIUS_BUCKET_KM", "0.5"))
+    # How often the index alias target / doc count is checked for changes
+    RECALL_CACHE_VERSION_CHECK_SECONDS = float(
+        os.getenv("RECALL_CACHE_VERSION_CHECK_SECONDS", "30")
+    )
 
     # Ingestion
-    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "10"))
+    # Bulk request size: whichever of docs / bytes is reached first
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
+    INGEST_BULK_MAX_BYTES = int(os.getenv("INGEST_BULK_MAX_BYTES", str(10 * 1024 * 1024)))
+    INGEST_FORCEMERGE_SEGMENTS = int(os.getenv("INGEST_FORCEMERGE_SEGMENTS", "1"))
+    # Previously published index versions kept after an alias swap, for rollback
+    INGEST_KEEP_OLD_INDICES = int(os.getenv("INGEST_KEEP_OLD_INDICES", "1"))
+    # Publish gate: share of bulk items allowed to fail, and the doc count a
+    # new index needs relative to the one the alias serves now
+    INGEST_MAX_FAILED_RATIO = float(os.getenv("INGEST_MAX_FAILED_RATIO", "0"))
+    INGEST_MIN_DOC_RATIO = float(os.getenv("INGEST_MIN_DOC_RATIO", "0.9"))
     INGEST_LIMIT = int(os.getenv("INGEST_LIMIT", "5000"))
+    # Concurrent LLM enrichment workers and the bound of each pipeline queue
+    INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "8"))
+    INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "256"))
+    INGEST_BULK_MAX_RETRIES = int(os.getenv("INGEST_BULK_MAX_RETRIES", "3"))
+    INGEST_PROGRESS_SECONDS = float(os.getenv("INGEST_PROGRESS_SECONDS", "5"))
+    # POIs labelled per LLM prompt (1 = one prompt per POI); batches are also
+    # capped so prompt + TOKENS_PER_POI of output each fit LLM_CONTEXT_SIZE
+    INGEST_LABEL_BATCH_SIZE = int(os.getenv("INGEST_LABEL_BATCH_SIZE", "8"))
+    INGEST_LABEL_TOKENS_PER_POI = int(os.getenv("INGEST_LABEL_TOKENS_PER_POI", "160"))
+    # LLM labels keyed by prompt hash, enriched-POI artifact and resume checkpoint
+    INGEST_CACHE_PATH = os.getenv("INGEST_CACHE_PATH", "data/enrichment_cache.sqlite")
+    INGEST_ARTIFACT_PATH = os.getenv("INGEST_ARTIFACT_PATH", "data/poi_enriched.ndjson")
+    INGEST_CHECKPOINT_PATH = os.getenv(
+        "INGEST_CHECKPOINT_PATH", "data/ingest_checkpoint.json"
+    )
 
     # Orchestration & Infrastructure
     SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
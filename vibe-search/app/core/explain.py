@@ -0,0 +1,72 @@
+from contextvars import ContextVar
+
+# Hits listed per sub-queue in an explain trace
+EXPLAIN_MAX_HITS = 20
+
+
+class SearchExplain:
+    """Diagnostics of one /search execution, returned when `explain` is set.
+
+    Filled in by the code that does the work (recall sub-queues, ranking),
+    so nothing is re-run to produce it. `profile` also asks ES for its
+    query profile on each sub-queue.
+    """
+
+    def __init__(self, profile: bool = False):
+        self.profile = profile
+        self.sub_queues = []  # in completion order
+        self.candidates = 0
+        self.ranking = []
+
+    def add_sub_queue(self, entry: dict):
+        self.sub_queues.append(entry)
+
+    def to_dict(self, timings=None) -> dict:
+        return {
+            "sub_queues": self.sub_queues,
+            "candidates": self.candidates,
+            "ranking": self.ranking,
+            "timings_ms": {
+                name: round(seconds * 1000.0, 3)
+                for name, seconds in (timings.durations if timings else {}).items()
+            },
+        }
+
+
+# Set per /search request; None (the default) disables all explain bookkeeping
+_current = ContextVar("search_explain", default=None)
+
+
+def start_request(enabled: bool, profile: bool = False):
+    trace = SearchExplain(profile) if enabled else None
+    _current.set(trace)
+    return trace
+
+
+def current():
+    return _current.get()
+
+
+def hit_summary(results: list) -> list:
+    """Compact view of a sub-queue's parsed results."""
+    return [
+        {
+            "id": r["id"],
+            "name": r.get("name"),
+            "es_score": r.get("es_score"),
+            "distance_km": r.get("distance_km"),
+        }
+        for r in results[:EXPLAIN_MAX_HITS]
+    ]
+
+
+def ranking_row(item: dict, factors: dict = None) -> dict:
+    """One ranked result; `factors` maps name -> {"score", "weight"}."""
+    return {
+        "id": item["id"],
+        "name": item.get("name"),
+        "recall_source": item.get("recall_source"),
+        "es_score": item.get("es_score"),
+        "final_score": item.get("final_score"),
+        "factors": factors,
+    }
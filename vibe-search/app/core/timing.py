@@ -0,0 +1,81 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from app.core.metrics import registry
+
+# Candidate counts, not seconds
+COUNT_BUCKETS = (0, 1, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+STAGE_LATENCY = registry.histogram(
+    "search_stage_seconds",
+    "Time spent per /search pipeline stage",
+    labelnames=("stage",),
+)
+STAGE_CANDIDATES = registry.histogram(
+    "search_stage_candidates",
+    "Candidates leaving a /search pipeline stage",
+    labelnames=("stage",),
+    buckets=COUNT_BUCKETS,
+)
+RECALL_SUB_QUEUE_LATENCY = registry.histogram(
+    "recall_sub_queue_seconds",
+    "Time per recall sub-queue (cache lookup + ES request + parsing)",
+    labelnames=("source",),
+)
+RECALL_SUB_QUEUE_CANDIDATES = registry.histogram(
+    "recall_sub_queue_candidates",
+    "Candidates returned per recall sub-queue",
+    labelnames=("source",),
+    buckets=COUNT_BUCKETS,
+)
+
+
+class RequestTimings:
+    """Stage durations of one request, rendered as a Server-Timing header.
+
+    A stage recorded several times (concurrent sub-queues of one source)
+    keeps its slowest duration.
+    """
+
+    def __init__(self):
+        self.durations = {}  # stage -> seconds, in first-recorded order
+
+    def record(self, name: str, seconds: float):
+        self.durations[name] = max(seconds, self.durations.get(name, 0.0))
+
+    def header(self) -> str:
+        return ", ".join(
+            f"{name};dur={seconds * 1000.0:.1f}" for name, seconds in self.durations.items()
+        )
+
+
+# Set per /search request; tasks created inside it inherit the same object
+_current = ContextVar("request_timings", default=None)
+
+
+def start_request() -> RequestTimings:
+    timings = RequestTimings()
+    _current.set(timings)
+    return timings
+
+
+def record(name: str, seconds: float, histogram=STAGE_LATENCY, **labels):
+    """Observe a duration in `histogram` and the current request's timings."""
+    histogram.observe(seconds, **(labels or {"stage": name}))
+    timings = _current.get()
+    if timings is not None:
+        timings.record(name, seconds)
+
+
+@contextmanager
+def stage(name: str, histogram=STAGE_LATENCY, **labels):
+    """Time the block as stage `name` (labels default to stage=name)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start, histogram, **labels)
+
+
+def count_candidates(stage_name: str, n: int):
+    STAGE_CANDIDATES.observe(n, stage=stage_name)
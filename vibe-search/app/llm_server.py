@@ -1,9 +1,16 @@
+import asyncio
 import os
+import json
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from contextlib import aclosing
 from pydantic import BaseModel
 from app.nlp.local_qwen import local_llm as llm_client
+from app.nlp.batch_scheduler import MicroBatchScheduler, GenerateJob, apply_stop
+from app.nlp.inference_worker import WorkerBusyError
 from app.core.config import settings
+from app.core.metrics import registry
 
 app = FastAPI(title="Qwen LLM Standalone Service", version="1.0")
 
@@ -13,14 +20,28 @@ class GenerateRequest(BaseModel):
     system_prompt: str = "You are a helpful assistant."
     max_tokens: int = settings.LLM_MAX_TOKENS
     temperature: float = settings.LLM_TEMPERATURE
+    stop: list[str] = []
+    # Stream NDJSON lines {"delta": ...} and a final {"done": true}
+    stream: bool = False
 
 
 class GenerateResponse(BaseModel):
     response: str
 
 
+# Dynamic micro-batching (window 0 or batch size 1 keeps one call per request)
+scheduler = None
+if settings.LLM_BATCH_WINDOW_MS > 0 and settings.LLM_MAX_BATCH_SIZE > 1:
+    scheduler = MicroBatchScheduler(
+        llm_client.generate_batch,
+        window_ms=settings.LLM_BATCH_WINDOW_MS,
+        max_batch_size=settings.LLM_MAX_BATCH_SIZE,
+    )
+
+
 @app.on_event("startup")
 async def startup_event():
+    llm_client.worker.start()
     # Trigger model loading
     print("Pre-loading model...")
     # Using a dummy prompt to ensure model is loaded into memory
@@ -28,23 +49,115 @@ async def startup_event():
         "Verify", "System", settings.LLM_MAX_TOKENS, settings.LLM_TEMPERATURE
     )
     print("Model ready.")
+    if scheduler is not None:
+        await scheduler.start()
 
 
-@app.post("/generate", response_model=GenerateResponse)
-async def generate_text(req: GenerateRequest):
+@app.on_event("shutdown")
+async def shutdown_event():
+    if scheduler is not None:
+        await scheduler.stop()
+    # Joining the worker blocks until the running inference finishes
+    stopped = await asyncio.to_thread(
+        llm_client.worker.stop, settings.LLM_WORKER_STOP_TIMEOUT_SECONDS
+    )
+    if not stopped:
+        print("Inference worker still busy at shutdown; not waiting for it")
+
+
+def _delta_line(text: str) -> str:
+    return json.dumps({"delta": text}, ensure_ascii=False) + "\n"
+
+
+async def _stream_ndjson(request: Request, req: GenerateRequest):
+    text = ""
+    sent = 0  # length of `text` already emitted
+    # A stop sequence can span deltas: keep back the text that could be its
+    # beginning until the next delta settles it
+    holdback = max((len(s) for s in req.stop if s), default=1) - 1
     try:
-        response = await llm_client.generate(
-            req.prompt, req.system_prompt, req.max_tokens, req.temperature
+        async with aclosing(
+            llm_client.stream(
+                req.prompt, req.system_prompt, req.max_tokens, req.temperature
+            )
+        ) as tokens:
+            async for delta in tokens:
+                text += delta
+                cut = apply_stop(text, req.stop)
+                if cut != text:
+                    if len(cut) > sent:
+                        yield _delta_line(cut[sent:])
+                    break
+                ready = len(text) - holdback
+                if ready > sent:
+                    yield _delta_line(text[sent:ready])
+                    sent = ready
+
+                # Client cancelled (e.g. JSON payload already complete);
+                # leaving the block cancels generation at the next token
+                if await request.is_disconnected():
+                    return
+            else:
+                # Generation ended without a stop sequence: flush the rest
+                if len(text) > sent:
+                    yield _delta_line(text[sent:])
+        yield json.dumps({"done": True}) + "\n"
+    except Exception as e:
+        yield json.dumps({"error": str(e)}) + "\n"
+
+
+@app.post("/generate", response_model=GenerateResponse)
+async def generate_text(req: GenerateRequest, request: Request):
+    if req.stream:
+        # Admission control: refuse early instead of queueing without bound
+        if llm_client.worker.queue_depth >= settings.LLM_WORKER_MAX_QUEUE > 0:
+            raise HTTPException(status_code=503, detail="Inference queue full")
+        # Streaming bypasses the micro-batcher (one generation per request):
+        # it trades batched throughput for early stop, see LLM_STREAMING
+        return StreamingResponse(
+            _stream_ndjson(request, req), media_type="application/x-ndjson"
         )
+
+    try:
+        if scheduler is not None:
+            response = await scheduler.submit(
+                GenerateJob(
+                    prompt=req.prompt,
+                    system_prompt=req.system_prompt,
+                    max_tokens=req.max_tokens,
+                    temperature=req.temperature,
+                    stop=req.stop,
+                )
+            )
+        else:
+            response = await llm_client.generate(
+                req.prompt, req.system_prompt, req.max_tokens, req.temperature
+            )
+            response = apply_stop(response, req.stop)
         return GenerateResponse(response=response)
+    except WorkerBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/health")
 async def health():
-    return {"status": "ok", "model": llm_client.model_path}
+    # Served on the event loop, independent of any running generation
+    return {
+        "status": "ok",
+        "model": llm_client.model_path,
+        "queue_depth": llm_client.worker.queue_depth,
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return registry.render()
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=settings.LLM_PORT)
+    if settings.LLM_UDS_PATH:
+        uvicorn.run(app, uds=settings.LLM_UDS_PATH)
+    else:
+        uvicorn.run(app, host="127.0.0.1", port=settings.LLM_PORT)
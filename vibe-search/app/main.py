@@ -1,46 +1,284 @@
 import asyncio
-from fastapi import FastAPI, HTTPException
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import PlainTextResponse
+from app.core import explain, timing
+from app.core.metrics import registry
 from app.models import SearchRequest, SearchResponse, POIResult
 from app.nlp.analyzer import analyzer
 from app.nlp.rewriter import rewriter
+from app.nlp.joint import joint_processor
+from app.nlp.cache import intent_cache, rewrite_cache, joint_cache
+from app.nlp.remote_qwen import remote_llm
+from app.nlp.fast_path import fast_path
 from app.recall.es_client import es_client
 from app.ranking.ranker import ranker
+from app.ranking.vector_ranker import vector_ranker
 from app.core.config import settings
 
-app = FastAPI(title="LBS Search Service", version="1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled keep-alive LLM session for the process lifetime
+    await remote_llm.start()
+
+    # In-process recall engine (backend, or fallback while ES is down)
+    memory_backend = settings.RECALL_BACKEND == "memory"
+    if memory_backend or settings.RECALL_MEMORY_FALLBACK:
+        try:
+            await es_client.load_memory_engine()
+        except Exception as e:
+            print(f"Memory recall engine not loaded: {e}")
+
+    # Keep the fast-path gazetteer in sync with the index
+    refresh_task = None
+    if settings.FAST_PATH_ENABLED:
+        if memory_backend:
+            if es_client.memory.loaded:
+                fast_path.load(*es_client.memory.gazetteer())
+        else:
+            refresh_task = asyncio.create_task(
+                fast_path.run_refresh_loop(
+                    es_client.es, es_client.index, settings.FAST_PATH_REFRESH_SECONDS
+                )
+            )
+
+    # Build recall queries for the mapping of the index behind the alias
+    schema_task = None
+    if not memory_backend and settings.RECALL_SCHEMA_VERSION == "auto":
+        schema_task = asyncio.create_task(
+            es_client.run_schema_version_loop(settings.RECALL_SCHEMA_CHECK_SECONDS)
+        )
+
+    # Drop cached recall hits when the index alias or document count changes
+    cache_version_task = None
+    if es_client.cache.enabled and not memory_backend:
+        cache_version_task = asyncio.create_task(
+            es_client.cache.run_version_loop(
+                es_client.es,
+                es_client.index,
+                settings.RECALL_CACHE_VERSION_CHECK_SECONDS,
+            )
+        )
+
+    yield
+
+    # Let the loops unwind (e.g. a gazetteer scan closes its scroll) before
+    # the clients they use are closed
+    loops = [t for t in (refresh_task, cache_version_task, schema_task) if t]
+    for task in loops:
+        task.cancel()
+    await asyncio.gather(*loops, return_exceptions=True)
+    await remote_llm.close()
+
+
+app = FastAPI(title="LBS Search Service", version="1.0", lifespan=lifespan)
+
+
+def _is_intent_fallback(intent: dict) -> bool:
+    return intent == analyzer.fallback()
+
+
+def _is_rewrite_fallback(rewrites: list) -> bool:
+    return not rewrites
+
+
+def _is_joint_fallback(result: tuple) -> bool:
+    intent, rewrites = result
+    return _is_intent_fallback(intent) or _is_rewrite_fallback(rewrites)
+
+
+# NLP calls that miss their budget keep running so they still fill the cache,
+# up to NLP_MAX_BACKGROUND_TASKS at a time
+_background_tasks = set()
+
+
+async def _gather_within(tasks: list, fallbacks: list, timeout: float = None):
+    """Results of `tasks`, or the matching fallback for tasks still running
+    after `timeout` seconds. Returns (results, timed_out)."""
+    if timeout is None:
+        return list(await asyncio.gather(*tasks)), False
+
+    done, pending = await asyncio.wait(tasks, timeout=max(0.0, timeout))
+    for task in pending:
+        if len(_background_tasks) >= settings.NLP_MAX_BACKGROUND_TASKS:
+            # A slow / down LLM would otherwise pile up calls holding its slots
+            task.cancel()
+            continue
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    results = [
+        task.result() if task in done else fallback
+        for task, fallback in zip(tasks, fallbacks)
+    ]
+    return results, bool(pending)
+
+
+async def _timed(stage: str, coro):
+    with timing.stage(stage):
+        return await coro
+
+
+async def run_nlp(
+    query: str, timeout: float = None, trace: dict = None
+) -> tuple[dict, list[str]]:
+    """Intent and rewrites for a query.
+
+    With `timeout` (seconds), calls that miss it are replaced by their
+    fallback; trace["nlp_timed_out"] records whether that happened.
+    """
+    # Bare category / POI-name queries: deterministic intent, no LLM call
+    fast = fast_path.analyze(query) if settings.FAST_PATH_ENABLED else None
+    if fast is not None:
+        rewrite_task = asyncio.create_task(
+            _timed(
+                "nlp_rewrite",
+                rewrite_cache.get_or_load(
+                    query, rewriter.rewrite, is_fallback=_is_rewrite_fallback
+                ),
+            )
+        )
+        (rewrites,), timed_out = await _gather_within([rewrite_task], [[]], timeout)
+        result = fast.intent, rewrites
+
+    elif settings.NLP_MODE == "joint":
+        # Single generation returning both intent and rewrites
+        joint_task = asyncio.create_task(
+            _timed(
+                "nlp_joint",
+                joint_cache.get_or_load(
+                    query, joint_processor.process, is_fallback=_is_joint_fallback
+                ),
+            )
+        )
+        (result,), timed_out = await _gather_within(
+            [joint_task], [(analyzer.fallback(), [])], timeout
+        )
+
+    else:
+        # Run Intent Analysis and Query Rewriting concurrently (cached per query)
+        intent_task = asyncio.create_task(
+            _timed(
+                "nlp_analyze",
+                intent_cache.get_or_load(
+                    query, analyzer.analyze, is_fallback=_is_intent_fallback
+                ),
+            )
+        )
+        rewrite_task = asyncio.create_task(
+            _timed(
+                "nlp_rewrite",
+                rewrite_cache.get_or_load(
+                    query, rewriter.rewrite, is_fallback=_is_rewrite_fallback
+                ),
+            )
+        )
+        (intent, rewrites), timed_out = await _gather_within(
+            [intent_task, rewrite_task], [analyzer.fallback(), []], timeout
+        )
+        result = intent, rewrites
+
+    if trace is not None:
+        trace["nlp_timed_out"] = timed_out
+    return result
 
 
 @app.post("/search", response_model=SearchResponse)
-async def search(req: SearchRequest):
-    # 1. NLP Phase (Parallel)
-    # Run Intent Analysis and Query Rewriting concurrently
-    intent_task = asyncio.create_task(analyzer.analyze(req.query))
-    rewrite_task = asyncio.create_task(rewriter.rewrite(req.query))
+async def search(req: SearchRequest, response: Response):
+    timings = timing.start_request()
+    trace = explain.start_request(req.explain, profile=req.profile)
+    try:
+        with timing.stage("total"):
+            result = await _search(req)
+    finally:
+        response.headers["Server-Timing"] = timings.header()
+    if trace is not None:
+        result["explain"] = trace.to_dict(timings)
+    return result
+
+
+async def _search(req: SearchRequest):
+    start = time.perf_counter()
+    budget_ms = req.latency_budget_ms
+    if budget_ms is None:
+        budget_ms = settings.SEARCH_LATENCY_BUDGET_MS
+    nlp_timeout = None
+    if budget_ms > 0:
+        nlp_timeout = budget_ms * settings.NLP_BUDGET_SHARE / 1000.0
+
+    # 0. Speculative recall on the raw query, overlapped with the LLM calls
+    speculative = None
+    if settings.SPECULATIVE_RECALL:
+        speculative = asyncio.create_task(
+            es_client.search_original(req.query, req.lat, req.lon, req.radius_km)
+        )
 
-    intent, rewrites = await asyncio.gather(intent_task, rewrite_task)
+    # 1. NLP Phase (Parallel or Joint, see NLP_MODE), bounded by its budget share
+    nlp_trace = {}
+    try:
+        with timing.stage("nlp"):
+            intent, rewrites = await run_nlp(
+                req.query, timeout=nlp_timeout, trace=nlp_trace
+            )
+    except BaseException:
+        if speculative is not None:
+            speculative.cancel()
+        raise
+
+    # Slow or failed NLP: also recall on the raw query so results still come back
+    degraded = nlp_trace["nlp_timed_out"] or _is_joint_fallback((intent, rewrites))
+
+    recall_deadline_ms = None
+    if budget_ms > 0:
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        recall_deadline_ms = max(0.0, budget_ms - elapsed_ms)
 
     # 2. Recall Phase
     # Use extracted intent filters and rewritten queries to fetch candidates
-    candidates = await es_client.search(
-        original_query=req.query,
-        expansions=rewrites,
-        nlp_analysis=intent,
-        lat=req.lat,
-        lon=req.lon,
-        radius_km=req.radius_km,
-    )
+    recall_trace = {}
+    with timing.stage("recall"):
+        candidates = await es_client.search(
+            original_query=req.query,
+            expansions=rewrites,
+            nlp_analysis=intent,
+            lat=req.lat,
+            lon=req.lon,
+            radius_km=req.radius_km,
+            include_original=degraded,
+            deadline_ms=recall_deadline_ms,
+            trace=recall_trace,
+            prefetched=speculative,
+        )
+    dropped = recall_trace.get("dropped_sub_queues", [])
+    trace = explain.current()
+    if trace is not None:
+        trace.candidates = len(candidates)
 
     if not candidates:
-        return {"intent": intent, "rewrites": rewrites, "results": []}
+        return {
+            "intent": intent,
+            "rewrites": rewrites,
+            "results": [],
+            "dropped_sub_queues": dropped,
+            "degraded": degraded,
+        }
 
     # 3. Ranking Phase
     # Sort candidates based on user preference (from intent)
-    ranked_candidates = ranker.rank(
-        candidates,
-        user_lat=req.lat,
-        user_lon=req.lon,
-        sort_preference=intent.get("sort_preference", "relevance"),
-    )
+    with timing.stage("rank"):
+        if settings.RANK_MODE == "es":
+            # Already scored by function_score in the recall queries
+            ranked_candidates = ranker.rank_scored(candidates)
+        else:
+            active_ranker = vector_ranker if settings.RANK_ENGINE == "numpy" else ranker
+            ranked_candidates = active_ranker.rank(
+                candidates,
+                user_lat=req.lat,
+                user_lon=req.lon,
+                sort_preference=intent.get("sort_preference", "relevance"),
+            )
+    timing.count_candidates("ranked", len(ranked_candidates))
 
     # Format Response
     results = [
@@ -55,9 +293,31 @@ async def search(req: SearchRequest):
         for c in ranked_candidates
     ]
 
-    return {"intent": intent, "rewrites": rewrites, "results": results}
+    return {
+        "intent": intent,
+        "rewrites": rewrites,
+        "results": results,
+        "dropped_sub_queues": dropped,
+        "degraded": degraded,
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return registry.render()
 
 
 @app.get("/health")
 async def health():
-    return {"status": "ok", "elasticsearch": settings.ES_HOST}
+    return {
+        "status": "ok",
+        "elasticsearch": settings.ES_HOST,
+        "llm_client": remote_llm.stats(),
+        "fast_path": fast_path.stats(),
+        "recall_cache": es_client.cache.stats(),
+        "nlp_cache": {
+            "intent": intent_cache.stats(),
+            "rewrite": rewrite_cache.stats(),
+            "joint": joint_cache.stats(),
+        },
+    }
@@ -7,6 +7,12 @@ class SearchRequest(BaseModel):
     lat: float
     lon: float
     radius_km: Optional[float] = 5.0
+    # End-to-end latency budget; None uses SEARCH_LATENCY_BUDGET_MS, 0 disables
+    latency_budget_ms: Optional[float] = None
+    # Return an `explain` trace of this execution (sub-queues, ranking factors)
+    explain: bool = False
+    # With explain: also request the ES query profile of each sub-queue
+    profile: bool = False
 
 
 class POIResult(BaseModel):
@@ -22,3 +28,9 @@ class SearchResponse(BaseModel):
     intent: dict
     rewrites: List[str]
     results: List[POIResult]
+    # Recall sub-queues cut off by the recall deadline (any RECALL_MODE)
+    dropped_sub_queues: List[str] = []
+    # NLP missed its budget or failed; recall fell back to the original query
+    degraded: bool = False
+    # Only set when the request asked for `explain`
+    explain: Optional[dict] = None
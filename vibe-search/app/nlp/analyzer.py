@@ -49,30 +49,42 @@ class QueryAnalyzer:
         except json.JSONDecodeError:
             return None
 
+    def _normalize(self, data) -> dict | None:
+        """Validate a parsed intent object and fill in missing optional fields."""
+        if not isinstance(data, dict) or not data:
+            return None
+
+        # Ensure new fields exist even if LLM misses them
+        data.setdefault("keywords", [])
+        data.setdefault("key_phrases", [])
+        data.setdefault("key_info", "")
+        return data
+
+    def fallback(self) -> dict:
+        return {
+            "category": None,
+            "location_hint": None,
+            "sort_preference": "relevance",
+            "keywords": [],
+            "key_phrases": [],
+            "key_info": "",
+        }
+
     async def analyze(self, query: str) -> dict:
         try:
-            response = await llm_client.generate(query, self.SYSTEM_PROMPT)
-            data = self._extract_json(response)
+            response = await llm_client.generate_json(
+                query, self.SYSTEM_PROMPT, opener="{"
+            )
+            data = self._normalize(self._extract_json(response))
 
             if not data:
+                llm_client.record_parse_failure("analyzer", response)
                 raise ValueError("Failed to parse JSON")
 
-            # Ensure new fields exist even if LLM misses them
-            data.setdefault("keywords", [])
-            data.setdefault("key_phrases", [])
-            data.setdefault("key_info", "")
-
             return data
         except Exception:
             # Fallback
-            return {
-                "category": None,
-                "location_hint": None,
-                "sort_preference": "relevance",
-                "keywords": [],
-                "key_phrases": [],
-                "key_info": "",
-            }
+            return self.fallback()
 
 
 analyzer = QueryAnalyzer()
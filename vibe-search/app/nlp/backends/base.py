@@ -0,0 +1,36 @@
+class InferenceBackend:
+    """Engine that turns a (system prompt, user prompt) pair into text.
+
+    Backends are synchronous: LocalQwenAgent runs every call on its inference
+    worker thread. Heavy imports belong in `load()` so an unused backend
+    never slows startup.
+    """
+
+    name = "base"
+
+    def __init__(self, model_path: str):
+        self.model_path = model_path
+
+    def load(self):
+        """Load weights; must be idempotent."""
+        raise NotImplementedError
+
+    def stream_tokens(
+        self, prompt: str, system_prompt: str, max_tokens: int, temperature: float
+    ):
+        """Yield text deltas. Closing the generator must stop generation."""
+        raise NotImplementedError
+
+    def generate_batch(self, jobs: list) -> list[str]:
+        """Generate for several jobs (see batch_scheduler.GenerateJob).
+
+        Backends without native batching run the jobs back to back.
+        """
+        return [
+            "".join(
+                self.stream_tokens(
+                    j.prompt, j.system_prompt, j.max_tokens, j.temperature
+                )
+            )
+            for j in jobs
+        ]
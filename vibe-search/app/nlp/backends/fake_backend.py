@@ -0,0 +1,98 @@
+import json
+import re
+import time
+
+from app.core.config import settings
+from app.nlp.backends.base import InferenceBackend
+
+_WORD_RE = re.compile(r"[A-Za-z0-9]+|[一-鿿]+")
+
+
+def _words(text: str) -> list[str]:
+    return _WORD_RE.findall(text or "")
+
+
+class FakeBackend(InferenceBackend):
+    """Deterministic stand-in for tests, benchmarks and machines without a model.
+
+    The reply is derived from the prompt only, shaped after the system prompt
+    that asked for it (intent object, rewrite list, joint object, POI labels
+    or a batched array of POI labels). Latency is `ttft_ms` before the first
+    delta plus `token_ms` per delta.
+    """
+
+    name = "fake"
+    CHARS_PER_TOKEN = 4
+
+    def __init__(
+        self,
+        model_path: str = "fake",
+        ttft_ms: float = settings.LLM_FAKE_TTFT_MS,
+        token_ms: float = settings.LLM_FAKE_TOKEN_MS,
+    ):
+        super().__init__(model_path)
+        self.ttft_ms = ttft_ms
+        self.token_ms = token_ms
+
+    def load(self):
+        pass
+
+    def _intent(self, query: str) -> dict:
+        words = _words(query)
+        return {
+            "category": None,
+            "location_hint": None,
+            "sort_preference": "relevance",
+            "keywords": words[:5],
+            "key_phrases": [query.strip()] if len(words) > 1 else [],
+            "key_info": f"User is looking for {query.strip()}.",
+        }
+
+    def _rewrites(self, query: str) -> list[str]:
+        query = query.strip()
+        return [f"{query} nearby", f"best {query}", f"{query} recommendations"]
+
+    def _labels(self, prompt: str):
+        if "JSON array" in prompt:
+            # Batched labeling: one element per "Name:" line, keyed by index
+            names = [n.strip() for n in re.findall(r"Name:\s*(.+)", prompt)]
+            return [{"index": i, **self._poi_labels(n)} for i, n in enumerate(names)]
+        name = ""
+        match = re.search(r"Name:\s*(.+)", prompt)
+        if match:
+            name = match.group(1).strip()
+        return self._poi_labels(name)
+
+    def _poi_labels(self, name: str) -> dict:
+        words = _words(name) or [name]
+        return {
+            "keywords": words[:5],
+            "key_phrases": [name],
+            "key_info": f"{name} is a place in Shanghai.",
+            "rewrites": self._rewrites(name),
+        }
+
+    def respond(self, prompt: str, system_prompt: str) -> str:
+        """The full (deterministic) completion for a prompt."""
+        if "data labeling" in system_prompt:
+            payload = self._labels(prompt)
+        elif "Query Expander" in system_prompt and "Intent" in system_prompt:
+            payload = {"intent": self._intent(prompt), "rewrites": self._rewrites(prompt)}
+        elif "Query Expander" in system_prompt:
+            payload = self._rewrites(prompt)
+        elif "Intent" in system_prompt:
+            payload = self._intent(prompt)
+        else:
+            return f"Echo: {prompt}"
+        return json.dumps(payload, ensure_ascii=False)
+
+    def stream_tokens(self, prompt, system_prompt, max_tokens, temperature):
+        text = self.respond(prompt, system_prompt)
+        step = self.CHARS_PER_TOKEN
+        chunks = [text[i : i + step] for i in range(0, len(text), step)][:max_tokens]
+
+        time.sleep(self.ttft_ms / 1000.0)
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(self.token_ms / 1000.0)
+            yield chunk
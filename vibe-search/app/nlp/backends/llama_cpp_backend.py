@@ -0,0 +1,48 @@
+from llama_cpp import Llama, LlamaRAMCache
+
+from app.core.config import settings
+from app.nlp.backends.base import InferenceBackend
+
+
+class LlamaCppBackend(InferenceBackend):
+    """CPU backend (Linux fleet) on llama.cpp with a GGUF export of the model."""
+
+    name = "llama_cpp"
+
+    def __init__(self, model_path: str = settings.LLM_GGUF_PATH):
+        super().__init__(model_path)
+        self.llm = None
+
+    def load(self):
+        if self.llm is None:
+            print(f"Loading GGUF model: {self.model_path}...")
+            self.llm = Llama(
+                model_path=self.model_path,
+                n_ctx=settings.LLM_CONTEXT_SIZE,
+                n_threads=settings.LLM_CPU_THREADS or None,
+                verbose=False,
+            )
+            # Keeps KV state for recently used prompt prefixes (system prompts)
+            self.llm.set_cache(
+                LlamaRAMCache(capacity_bytes=settings.LLM_CPU_PROMPT_CACHE_MB << 20)
+            )
+            print("Model loaded.")
+
+    def stream_tokens(self, prompt, system_prompt, max_tokens, temperature):
+        self.load()
+        chunks = self.llm.create_chat_completion(
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt},
+            ],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+        )
+        try:
+            for chunk in chunks:
+                delta = chunk["choices"][0]["delta"].get("content")
+                if delta:
+                    yield delta
+        finally:
+            chunks.close()
@@ -0,0 +1,100 @@
+import copy
+import mlx.core as mx
+from mlx_lm import load, stream_generate
+from mlx_lm.models.cache import make_prompt_cache
+from mlx_lm.sample_utils import make_sampler
+
+try:
+    from mlx_lm import batch_generate
+except ImportError:
+    batch_generate = None
+
+from app.core.config import settings
+from app.nlp.backends.base import InferenceBackend
+from app.nlp.prefix_cache import PromptPrefixCache, PrefixEntry, split_chat_template
+
+
+class MLXBackend(InferenceBackend):
+    """Apple-silicon backend on mlx_lm with system-prompt KV reuse."""
+
+    name = "mlx"
+
+    def __init__(self, model_path: str = settings.LLM_MODEL_PATH):
+        super().__init__(model_path)
+        self.model = None
+        self.tokenizer = None
+        # System prompt -> prefilled KV state, so requests prefill only the query
+        self.prefix_cache = PromptPrefixCache(
+            self._build_prefix, settings.LLM_PREFIX_CACHE_SIZE
+        )
+
+    def load(self):
+        if self.model is None:
+            print(f"Loading local model: {self.model_path}...")
+            self.model, self.tokenizer = load(self.model_path)
+            print("Model loaded.")
+
+    def _apply_template(self, prompt: str, system_prompt: str, tokenize=False):
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt},
+        ]
+        return self.tokenizer.apply_chat_template(
+            messages, tokenize=tokenize, add_generation_prompt=True
+        )
+
+    def _build_prefix(self, system_prompt: str):
+        template = split_chat_template(self.tokenizer, system_prompt)
+        if template is None:
+            return None
+
+        tokens = self.tokenizer.encode(template.prefix, add_special_tokens=False)
+        cache = make_prompt_cache(self.model)
+        # Prefill the system turn once; later requests continue from here
+        self.model(mx.array(tokens)[None], cache=cache)
+        mx.eval([c.state for c in cache])
+        return PrefixEntry(template=template, tokens=tokens, state=cache)
+
+    def _prepare_prompt(self, prompt: str, system_prompt: str):
+        """Return (prompt, prompt_cache) for stream_generate."""
+        entry = self.prefix_cache.get(system_prompt)
+        if entry is None:
+            return self._apply_template(prompt, system_prompt), None
+
+        suffix = self.tokenizer.encode(
+            entry.template.suffix(prompt), add_special_tokens=False
+        )
+        # Generation appends to the cache, so each request works on a copy
+        return suffix, copy.deepcopy(entry.state)
+
+    def stream_tokens(self, prompt, system_prompt, max_tokens, temperature):
+        self.load()
+        prompt_input, prompt_cache = self._prepare_prompt(prompt, system_prompt)
+
+        for chunk in stream_generate(
+            self.model,
+            self.tokenizer,
+            prompt=prompt_input,
+            max_tokens=max_tokens,
+            sampler=make_sampler(temp=temperature),
+            prompt_cache=prompt_cache,
+        ):
+            if chunk.text:
+                yield chunk.text
+
+    def generate_batch(self, jobs: list) -> list[str]:
+        if len(jobs) == 1 or batch_generate is None:
+            # Older mlx_lm without batch support: run back to back
+            return super().generate_batch(jobs)
+
+        self.load()
+        prompts = [self._apply_template(j.prompt, j.system_prompt, True) for j in jobs]
+        response = batch_generate(
+            self.model,
+            self.tokenizer,
+            prompts,
+            max_tokens=[j.max_tokens for j in jobs],
+            sampler=make_sampler(temp=jobs[0].temperature),
+            verbose=False,
+        )
+        return list(response.texts)
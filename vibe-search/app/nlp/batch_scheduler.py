@@ -0,0 +1,135 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from app.core.metrics import registry
+
+BATCH_SIZE = registry.histogram(
+    "llm_batch_size",
+    "Requests per batched forward pass",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+BATCH_QUEUE_WAIT = registry.histogram(
+    "llm_batch_queue_wait_seconds",
+    "Time a /generate request waited before its batch started",
+)
+BATCH_LATENCY = registry.histogram(
+    "llm_batch_run_seconds", "Wall time of one batched generation"
+)
+
+
+@dataclass
+class GenerateJob:
+    prompt: str
+    system_prompt: str
+    max_tokens: int
+    temperature: float
+    stop: list = field(default_factory=list)
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    future: asyncio.Future = None
+
+
+def apply_stop(text: str, stop: list) -> str:
+    """Truncate `text` at the earliest stop sequence."""
+    cut = len(text)
+    for s in stop or []:
+        idx = text.find(s)
+        if s and idx != -1:
+            cut = min(cut, idx)
+    return text[:cut]
+
+
+class MicroBatchScheduler:
+    """Collects /generate requests for a short window and runs them together.
+
+    A batch closes when `window_ms` has passed since its first request or it
+    reaches `max_batch_size`. Requests in one batch share a sampler, so jobs
+    are grouped by temperature before calling `run_batch(jobs) -> list[str]`.
+    """
+
+    def __init__(self, run_batch, window_ms: float, max_batch_size: int):
+        self.run_batch = run_batch
+        self.window_s = window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self._queue = None
+        self._worker = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        if (
+            self._worker is None
+            or self._worker.done()
+            or self._worker.get_loop() is not loop
+        ):
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def submit(self, job: GenerateJob) -> str:
+        await self.start()
+        job.future = asyncio.get_running_loop().create_future()
+        job.enqueued_at = time.perf_counter()
+        await self._queue.put(job)
+        return await job.future
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.window_s
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Drop requests whose client already went away
+            batch = [job for job in batch if not job.future.done()]
+
+            groups = {}
+            for job in batch:
+                groups.setdefault(job.temperature, []).append(job)
+
+            for jobs in groups.values():
+                await self._run_group(jobs)
+
+    async def _run_group(self, jobs: list):
+        start = time.perf_counter()
+        BATCH_SIZE.observe(len(jobs))
+        for job in jobs:
+            BATCH_QUEUE_WAIT.observe(start - job.enqueued_at)
+
+        try:
+            texts = await self.run_batch(jobs)
+        except Exception as e:
+            for job in jobs:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            return
+        finally:
+            BATCH_LATENCY.observe(time.perf_counter() - start)
+
+        for job, text in zip(jobs, texts):
+            if not job.future.done():
+                job.future.set_result(apply_stop(text, job.stop))
+        if len(texts) != len(jobs):
+            # A short batch result must not leave requests waiting forever
+            error = RuntimeError(
+                f"Batch returned {len(texts)} outputs for {len(jobs)} requests"
+            )
+            for job in jobs[len(texts) :]:
+                if not job.future.done():
+                    job.future.set_exception(error)
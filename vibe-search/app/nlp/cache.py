@@ -0,0 +1,139 @@
+import asyncio
+import copy
+import time
+import unicodedata
+from collections import OrderedDict
+from app.core.config import settings
+
+
+def normalize_query(query: str) -> str:
+    """Cache key for a raw user query.
+
+    NFKC folds full-width characters to half-width ("ＣＯＦＦＥＥ" -> "COFFEE"),
+    then case and runs of whitespace are collapsed.
+    """
+    query = unicodedata.normalize("NFKC", query or "")
+    return " ".join(query.casefold().split())
+
+
+class QueryResultCache:
+    """LRU + TTL cache for NLP results keyed by normalized query.
+
+    Fallback results (LLM down, unparsable output) are cached with a much
+    shorter TTL so a transient failure does not stick to a head query.
+    Concurrent misses for the same key share a single in-flight load.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_size: int = settings.NLP_CACHE_SIZE,
+        ttl_seconds: float = settings.NLP_CACHE_TTL_SECONDS,
+        fallback_ttl_seconds: float = settings.NLP_CACHE_FALLBACK_TTL_SECONDS,
+    ):
+        self.name = name
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.fallback_ttl_seconds = fallback_ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}  # key -> asyncio.Future
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, query: str):
+        key = normalize_query(query)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            # Expired: drop lazily on read
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return copy.deepcopy(value)
+
+    def set(self, query: str, value, is_fallback: bool = False):
+        if not self.enabled:
+            return
+        ttl = self.fallback_ttl_seconds if is_fallback else self.ttl_seconds
+        if ttl <= 0:
+            return
+
+        key = normalize_query(query)
+        self._entries[key] = (time.monotonic() + ttl, copy.deepcopy(value))
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(self, query: str, loader, is_fallback=None):
+        """Return the cached value for `query`, calling `loader(query)` on a miss."""
+        if not self.enabled:
+            return await loader(query)
+
+        value = self.get(query)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        key = normalize_query(query)
+
+        # Single-flight: identical concurrent misses wait on the first load
+        pending = self._inflight.get(key)
+        if pending is not None:
+            try:
+                return copy.deepcopy(await asyncio.shield(pending))
+            except asyncio.CancelledError:
+                if not pending.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            # The first load was cancelled (its request gave up): lead a new one
+            return await self.get_or_load(query, loader, is_fallback)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader(query)
+            self.set(query, value, is_fallback=bool(is_fallback and is_fallback(value)))
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Avoid "exception was never retrieved" when nobody else waited
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+intent_cache = QueryResultCache("intent")
+rewrite_cache = QueryResultCache("rewrite")
+joint_cache = QueryResultCache("joint")
@@ -0,0 +1,231 @@
+import asyncio
+import bisect
+import logging
+import re
+from collections import Counter
+from contextlib import aclosing
+from dataclasses import dataclass
+from elasticsearch.helpers import async_scan
+from app.core.config import settings
+from app.core.metrics import registry
+from app.nlp.cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+FAST_PATH_LOOKUPS = registry.counter(
+    "nlp_fast_path_total",
+    "Intent lookups answered by the rule-based fast path",
+    labelnames=("result",),
+)
+
+# Everyday query words -> OSM amenity / shop / tourism values used at ingestion.
+# Only values actually present in the index are ever returned.
+CATEGORY_SYNONYMS = {
+    "咖啡": "cafe",
+    "咖啡馆": "cafe",
+    "咖啡店": "cafe",
+    "coffee": "cafe",
+    "餐厅": "restaurant",
+    "饭店": "restaurant",
+    "餐馆": "restaurant",
+    "快餐": "fast_food",
+    "酒吧": "bar",
+    "银行": "bank",
+    "取款机": "atm",
+    "医院": "hospital",
+    "诊所": "clinic",
+    "药店": "pharmacy",
+    "超市": "supermarket",
+    "便利店": "convenience",
+    "学校": "school",
+    "酒店": "hotel",
+    "宾馆": "hotel",
+    "博物馆": "museum",
+    "公园": "park",
+    "电影院": "cinema",
+    "加油站": "fuel",
+    "停车场": "parking",
+    "图书馆": "library",
+    "景点": "attraction",
+    "厕所": "toilets",
+    "洗手间": "toilets",
+}
+
+# Words that do not change the intent of a bare category / name query.
+# Only stripped at the start or end of the query; latin ones as whole words.
+FILLER_WORDS = ("上海市", "上海", "shanghai", "附近的", "附近", "nearby", "near me")
+_FILLER_RE = re.compile(
+    "|".join(
+        rf"^{w}(?:\s+|$)|(?:^|\s+){w}$" if w.isascii() else rf"^{w}|{w}$"
+        for w in (re.escape(w) for w in FILLER_WORDS)
+    )
+)
+
+CONFIDENCE_NAME = 0.95
+CONFIDENCE_CATEGORY = 0.9
+FILLER_PENALTY = 0.05
+
+
+@dataclass
+class FastPathResult:
+    intent: dict
+    confidence: float
+
+
+class FastPathAnalyzer:
+    """Deterministic intent extraction for bare category / POI-name queries.
+
+    The gazetteer (category values and POI names) is loaded from the index
+    by `refresh()`. `analyze()` returns a FastPathResult in the same intent
+    schema as QueryAnalyzer, or None when the query is not a plain lookup.
+    """
+
+    def __init__(self):
+        self.categories = set()
+        self.names = {}  # normalized POI name -> most common category
+        self._sorted_names = []  # for prefix lookups
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, categories, names: dict):
+        """Replace the gazetteer (category values, {name: category})."""
+        self.categories = {c for c in categories if c}
+        self.names = {normalize_query(n): c for n, c in names.items() if n}
+        self._sorted_names = sorted(self.names)
+        self.loaded = True
+
+    async def refresh(self, client, index: str):
+        """Rebuild the gazetteer from the category values and POI names in ES."""
+        resp = await client.search(
+            index=index,
+            size=0,
+            aggs={
+                "category": {
+                    "terms": {"field": "category", "size": settings.FAST_PATH_MAX_TERMS}
+                },
+                "amenity": {
+                    "terms": {"field": "amenity", "size": settings.FAST_PATH_MAX_TERMS}
+                },
+            },
+        )
+        categories = set()
+        for agg in resp["aggregations"].values():
+            categories.update(b["key"] for b in agg["buckets"])
+
+        name_categories = {}
+        count = 0
+        scan = async_scan(
+            client,
+            index=index,
+            query={"query": {"match_all": {}}},
+            _source=["name", "category"],
+        )
+        # aclosing: clear the scroll context even when stopping early
+        async with aclosing(scan) as hits:
+            async for hit in hits:
+                source = hit["_source"]
+                if source.get("name"):
+                    name_categories.setdefault(source["name"], Counter())[
+                        source.get("category")
+                    ] += 1
+                count += 1
+                if count >= settings.FAST_PATH_MAX_NAMES:
+                    break
+
+        names = {n: c.most_common(1)[0][0] for n, c in name_categories.items()}
+        self.load(categories, names)
+        logger.info(
+            f"Fast-path gazetteer loaded: {len(self.categories)} categories, {len(self.names)} names"
+        )
+
+    async def run_refresh_loop(self, client, index: str, interval_seconds: float):
+        while True:
+            try:
+                await self.refresh(client, index)
+            except Exception as e:
+                logger.error(f"Fast-path gazetteer refresh failed: {e}")
+            await asyncio.sleep(interval_seconds)
+
+    def _strip_fillers(self, query: str):
+        stripped = query
+        while True:
+            shorter = _FILLER_RE.sub("", stripped, count=1).strip()
+            if shorter == stripped:
+                break
+            stripped = shorter
+        stripped = " ".join(stripped.split())
+        return stripped, stripped != query
+
+    def _starts_a_name(self, key: str) -> bool:
+        i = bisect.bisect_left(self._sorted_names, key)
+        return i < len(self._sorted_names) and self._sorted_names[i].startswith(key)
+
+    def _match(self, query: str):
+        key = normalize_query(query)
+        if not key:
+            return None
+
+        # 1. Exact POI name ("田子坊")
+        if key in self.names:
+            return FastPathResult(
+                intent={
+                    "category": self.names[key],
+                    "location_hint": None,
+                    "sort_preference": "relevance",
+                    "keywords": [query.strip()],
+                    "key_phrases": [query.strip()],
+                    "key_info": f"User is looking for {query.strip()}.",
+                },
+                confidence=CONFIDENCE_NAME,
+            )
+
+        # 2. Bare category, optionally wrapped in filler ("上海公园", "咖啡"),
+        # unless the filler belongs to a POI name ("上海银行(人民广场支行)")
+        term, had_filler = self._strip_fillers(key)
+        if had_filler and self._starts_a_name(key):
+            return None
+        category = term if term in self.categories else CATEGORY_SYNONYMS.get(term)
+        if category in self.categories:
+            confidence = CONFIDENCE_CATEGORY - (FILLER_PENALTY if had_filler else 0)
+            return FastPathResult(
+                intent={
+                    "category": category,
+                    "location_hint": None,
+                    "sort_preference": "relevance",
+                    "keywords": [term],
+                    "key_phrases": [],
+                    "key_info": f"User is looking for a {category}.",
+                },
+                confidence=confidence,
+            )
+        return None
+
+    def analyze(self, query: str, min_confidence: float = None):
+        """Return a FastPathResult if confident enough, else None (use the LLM)."""
+        if min_confidence is None:
+            min_confidence = settings.FAST_PATH_MIN_CONFIDENCE
+        result = self._match(query) if self.loaded else None
+
+        if result is not None and result.confidence >= min_confidence:
+            self.hits += 1
+            FAST_PATH_LOOKUPS.inc(result="hit")
+            return result
+
+        self.misses += 1
+        FAST_PATH_LOOKUPS.inc(result="miss")
+        return None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "loaded": self.loaded,
+            "categories": len(self.categories),
+            "names": len(self.names),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+fast_path = FastPathAnalyzer()
@@ -0,0 +1,190 @@
+import asyncio
+import queue
+import threading
+from contextlib import aclosing
+from app.core.metrics import registry
+
+WORKER_QUEUE_DEPTH = registry.gauge(
+    "llm_worker_queue_depth", "Inference jobs waiting for the worker thread"
+)
+WORKER_ACTIVE = registry.gauge(
+    "llm_worker_active_requests", "Inference jobs currently running"
+)
+WORKER_REJECTED = registry.counter(
+    "llm_worker_rejected_total", "Jobs rejected because the queue was full"
+)
+WORKER_CANCELLED = registry.counter(
+    "llm_worker_cancelled_total", "Jobs cancelled before or during inference"
+)
+
+_DONE = object()
+
+
+class WorkerBusyError(RuntimeError):
+    """Raised when the inference queue is full (maps to HTTP 503)."""
+
+
+class _Job:
+    def __init__(self, fn, loop, streaming: bool):
+        self.fn = fn
+        self.loop = loop
+        self.streaming = streaming
+        self.cancelled = threading.Event()
+        self.future = loop.create_future()
+        self.out = asyncio.Queue() if streaming else None
+
+    def _deliver(self, setter, value):
+        # Called from the worker thread; hop back onto the owning loop
+        def _set():
+            if not self.future.done():
+                setter(value)
+
+        self._call_soon(_set)
+
+    def _call_soon(self, callback, *args):
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # Owning loop already closed (shutdown); nobody is waiting
+            self.cancelled.set()
+
+    def set_result(self, value):
+        self._deliver(self.future.set_result, value)
+
+    def set_exception(self, exc):
+        self._deliver(self.future.set_exception, exc)
+
+    def push(self, item):
+        self._call_soon(self.out.put_nowait, item)
+
+
+class InferenceWorker:
+    """Runs blocking model calls on one dedicated thread.
+
+    The event loop only enqueues jobs and awaits results, so /health and new
+    connections stay responsive while a prompt runs. A single thread also
+    keeps every MLX call on the same OS thread. Jobs are rejected with
+    WorkerBusyError once `max_queue` are waiting; cancelled jobs are skipped
+    if they have not started, and streaming jobs stop at the next token.
+    """
+
+    def __init__(self, max_queue: int, name: str = "llm-inference"):
+        self.max_queue = max_queue
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stopping = False  # end-of-queue marker sent to the thread
+        self._lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._loop, name=self.name, daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, timeout: float = None) -> bool:
+        """Stop the thread after the queued jobs; False if still busy at `timeout`.
+
+        Blocking: call it via `asyncio.to_thread` from a running loop.
+        """
+        with self._lock:
+            if self._thread is not None:
+                if not self._stopping:
+                    self._queue.put(None)
+                    self._stopping = True
+                self._thread.join(timeout)
+                if self._thread.is_alive():
+                    # Daemon thread: it does not hold up process exit
+                    return False
+                self._thread = None
+                self._stopping = False
+            return True
+
+    def _submit(self, fn, streaming: bool) -> _Job:
+        self.start()
+        if self.max_queue > 0 and self._queue.qsize() >= self.max_queue:
+            WORKER_REJECTED.inc()
+            raise WorkerBusyError(
+                f"Inference queue full ({self._queue.qsize()} waiting)"
+            )
+        job = _Job(fn, asyncio.get_running_loop(), streaming)
+        self._queue.put(job)
+        WORKER_QUEUE_DEPTH.set(self._queue.qsize())
+        return job
+
+    def _loop(self):
+        while True:
+            job = self._queue.get()
+            WORKER_QUEUE_DEPTH.set(self._queue.qsize())
+            if job is None:
+                return
+            if job.cancelled.is_set():
+                WORKER_CANCELLED.inc()
+                continue
+
+            WORKER_ACTIVE.inc()
+            try:
+                if job.streaming:
+                    self._run_stream(job)
+                else:
+                    job.set_result(job.fn())
+            except Exception as e:
+                if job.streaming:
+                    job.push(e)
+                else:
+                    job.set_exception(e)
+            finally:
+                WORKER_ACTIVE.dec()
+
+    def _run_stream(self, job: _Job):
+        tokens = job.fn()
+        try:
+            for item in tokens:
+                if job.cancelled.is_set():
+                    WORKER_CANCELLED.inc()
+                    return
+                job.push(item)
+            job.push(_DONE)
+        finally:
+            # Generators stop the model at the next token when closed
+            close = getattr(tokens, "close", None)
+            if close is not None:
+                close()
+
+    async def run(self, fn):
+        """Run `fn()` on the worker thread and return its result."""
+        job = self._submit(fn, streaming=False)
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            job.cancelled.set()
+            raise
+
+    async def stream(self, make_iter):
+        """Iterate `make_iter()` on the worker thread, yielding its items here.
+
+        Closing this async generator cancels the underlying iteration.
+        """
+        job = self._submit(make_iter, streaming=True)
+        try:
+            while True:
+                item = await job.out.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            job.cancelled.set()
+
+
+async def collect(stream) -> str:
+    """Join an async text stream, closing it on error or cancellation."""
+    async with aclosing(stream) as deltas:
+        return "".join([delta async for delta in deltas])
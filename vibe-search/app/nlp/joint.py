@@ -0,0 +1,57 @@
+from app.nlp.remote_qwen import remote_llm as llm_client
+from app.nlp.analyzer import analyzer
+
+
+class JointQueryProcessor:
+    """Intent extraction and query rewriting in a single LLM generation."""
+
+    SYSTEM_PROMPT = """
+    You are a Geo-Intent Extractor and Search Query Expander. Analyze the user's search query.
+    Return ONLY a JSON object with exactly two keys:
+    - intent (object): structured data extracted from the query, with these keys:
+        - category (str): The type of place (e.g., "cafe", "park", "restaurant"). If unknown, use null.
+        - location_hint (str): A specific location mentioned (e.g., "The Bund", "Pudong"). If none, use null.
+        - sort_preference (str): "popularity", "distance", or "relevance". Default to "relevance".
+        - keywords (list[str]): List of important single-word keywords from the query.
+        - key_phrases (list[str]): List of important multi-word phrases.
+        - key_info (str): A concise summary of the core user request.
+    - rewrites (list[str]): Exactly 3 semantically similar or related queries to improve search recall.
+
+    Example:
+    Query: "popular coffee near the bund with wifi"
+    Output: {
+        "intent": {
+            "category": "cafe",
+            "location_hint": "The Bund",
+            "sort_preference": "popularity",
+            "keywords": ["coffee", "wifi"],
+            "key_phrases": ["The Bund", "free wifi"],
+            "key_info": "User wants a popular cafe near The Bund with wifi."
+        },
+        "rewrites": ["popular cafe the bund", "coffee shop with wifi bund", "best espresso near the bund"]
+    }
+    """
+
+    async def process(self, query: str) -> tuple[dict, list[str]]:
+        """Return (intent, rewrites) with the same contract as analyze + rewrite."""
+        try:
+            response = await llm_client.generate_json(
+                query, self.SYSTEM_PROMPT, opener="{"
+            )
+            data = analyzer._extract_json(response)
+
+            if not isinstance(data, dict):
+                llm_client.record_parse_failure("joint", response)
+                raise ValueError("Failed to parse JSON")
+
+            intent = analyzer._normalize(data.get("intent")) or analyzer.fallback()
+            rewrites = data.get("rewrites")
+            if not isinstance(rewrites, list):
+                rewrites = []
+
+            return intent, rewrites
+        except Exception:
+            return analyzer.fallback(), []
+
+
+joint_processor = JointQueryProcessor()
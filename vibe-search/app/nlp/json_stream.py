@@ -0,0 +1,76 @@
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+CLOSERS = {"{": "}", "[": "]"}
+
+
+class JSONStreamExtractor:
+    """Incrementally finds the first balanced JSON object or list in a token stream.
+
+    Text inside a leading <think>...</think> block is ignored. Brackets inside
+    JSON strings are skipped, so `{"a": "}"}` closes at the right place.
+    `feed()` returns the JSON text as soon as it is complete, else None.
+    """
+
+    def __init__(self, opener: str = "{"):
+        if opener not in CLOSERS:
+            raise ValueError(f"Unsupported JSON opener: {opener!r}")
+        self.opener = opener
+        self.text = ""
+        self._visible_from = None  # index where post-<think> text starts
+        self._scan_pos = 0
+        self._start = -1
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+
+    def _locate_visible(self):
+        stripped = self.text.lstrip()
+        if stripped.startswith(THINK_OPEN):
+            end = self.text.find(THINK_CLOSE)
+            if end == -1:
+                return None  # still thinking
+            return end + len(THINK_CLOSE)
+        if THINK_OPEN.startswith(stripped):
+            return None  # could still become "<think>"
+        return len(self.text) - len(stripped)
+
+    def feed(self, chunk: str):
+        self.text += chunk
+
+        if self._visible_from is None:
+            self._visible_from = self._locate_visible()
+            if self._visible_from is None:
+                return None
+            self._scan_pos = self._visible_from
+
+        text = self.text
+        for i in range(self._scan_pos, len(text)):
+            ch = text[i]
+
+            if self._start == -1:
+                if ch == self.opener:
+                    self._start = i
+                    self._stack.append(CLOSERS[ch])
+                continue
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in CLOSERS:
+                self._stack.append(CLOSERS[ch])
+            elif self._stack and ch == self._stack[-1]:
+                self._stack.pop()
+                if not self._stack:
+                    self._scan_pos = i + 1
+                    return text[self._start : i + 1]
+
+        self._scan_pos = len(text)
+        return None
@@ -1,21 +1,50 @@
-import os
-from mlx_lm import load, generate
-
+import importlib
+import time
 
 from app.core.config import settings
+from app.core.metrics import registry
+from app.nlp.inference_worker import InferenceWorker, collect
+
+LLM_TTFT = registry.histogram(
+    "llm_time_to_first_token_seconds",
+    "Time from request start to the first generated token",
+    labelnames=("backend",),
+)
+
+# Backend name -> "module:Class"; imported only when selected (LLM_BACKEND)
+BACKENDS = {
+    "mlx": "app.nlp.backends.mlx_backend:MLXBackend",
+    "llama_cpp": "app.nlp.backends.llama_cpp_backend:LlamaCppBackend",
+    "fake": "app.nlp.backends.fake_backend:FakeBackend",
+}
+
+
+def load_backend(name: str):
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown LLM_BACKEND '{name}'. Choose one of: {', '.join(BACKENDS)}"
+        )
+    module_name, class_name = BACKENDS[name].split(":")
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)()
 
 
 class LocalQwenAgent:
-    def __init__(self):
-        self.model_path = settings.LLM_MODEL_PATH
-        self.model = None
-        self.tokenizer = None
+    def __init__(self, backend_name: str = settings.LLM_BACKEND):
+        self.backend_name = backend_name
+        self._backend = None
+        # All model calls run on this thread; the event loop never blocks
+        self.worker = InferenceWorker(max_queue=settings.LLM_WORKER_MAX_QUEUE)
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = load_backend(self.backend_name)
+        return self._backend
 
-    def _ensure_model(self):
-        if self.model is None:
-            print(f"Loading local model: {self.model_path}...")
-            self.model, self.tokenizer = load(self.model_path)
-            print("Model loaded.")
+    @property
+    def model_path(self) -> str:
+        return self.backend.model_path
 
     async def generate(
         self,
@@ -24,28 +53,64 @@ class LocalQwenAgent:
         max_tokens: int = 512,
         temperature: float = 0.7,
     ) -> str:
-        self._ensure_model()
+        return await collect(
+            self.stream(prompt, system_prompt, max_tokens, temperature)
+        )
 
-        # Apply chat template
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt},
-        ]
+    def stream(
+        self,
+        prompt: str,
+        system_prompt: str = "You are a helpful assistant.",
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+    ):
+        """Async iterator of text deltas, generated on the inference worker.
 
-        text = self.tokenizer.apply_chat_template(
-            messages, tokenize=False, add_generation_prompt=True
+        Closing the iterator stops generation at the next token.
+        """
+        start = time.perf_counter()
+        return self.worker.stream(
+            lambda: self._stream_tokens(
+                prompt, system_prompt, max_tokens, temperature, start
+            )
         )
 
-        # MLX generation
-        response = generate(
-            self.model,
-            self.tokenizer,
-            prompt=text,
-            max_tokens=max_tokens,
-            temp=temperature,
-            verbose=False,
-        )
-        return response
+    def _stream_tokens(self, prompt, system_prompt, max_tokens, temperature, start):
+        # Runs on the worker thread
+        backend = self.backend
+        backend.load()
+        tokens = backend.stream_tokens(prompt, system_prompt, max_tokens, temperature)
+
+        first_token = True
+        try:
+            for delta in tokens:
+                if first_token:
+                    LLM_TTFT.observe(time.perf_counter() - start, backend=backend.name)
+                    first_token = False
+                yield delta
+        finally:
+            tokens.close()
+
+    async def generate_batch(self, jobs: list) -> list[str]:
+        """Run several prompts in one batched forward pass.
+
+        `jobs` share a temperature (see MicroBatchScheduler); each keeps its
+        own max_tokens. Stop sequences are applied by the scheduler.
+        """
+        if len(jobs) == 1:
+            j = jobs[0]
+            return [
+                await self.generate(
+                    j.prompt, j.system_prompt, j.max_tokens, j.temperature
+                )
+            ]
+
+        def _run():
+            # Runs on the worker thread
+            self.backend.load()
+            return self.backend.generate_batch(jobs)
+
+        return await self.worker.run(_run)
 
 
 local_llm = LocalQwenAgent()
@@ -0,0 +1,94 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+# Placeholder user message used to locate the query inside the chat template
+USER_SENTINEL = "\x00__vibe_user_query__\x00"
+
+
+@dataclass
+class PromptTemplate:
+    """Chat template split around the user query.
+
+    prompt text == prefix + user_head + query + user_tail
+    """
+
+    prefix: str
+    user_head: str
+    user_tail: str
+
+    def suffix(self, query: str) -> str:
+        return self.user_head + query + self.user_tail
+
+
+def split_chat_template(tokenizer, system_prompt: str):
+    """Split the rendered template into a system prefix and a per-query suffix.
+
+    Returns None when the template does not render the system turn as a
+    clean prefix (the caller then falls back to full-prompt prefill).
+    """
+    system_only = tokenizer.apply_chat_template(
+        [{"role": "system", "content": system_prompt}], tokenize=False
+    )
+    full = tokenizer.apply_chat_template(
+        [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": USER_SENTINEL},
+        ],
+        tokenize=False,
+        add_generation_prompt=True,
+    )
+
+    if not full.startswith(system_only) or full.count(USER_SENTINEL) != 1:
+        return None
+
+    head, tail = full[len(system_only) :].split(USER_SENTINEL)
+    return PromptTemplate(prefix=system_only, user_head=head, user_tail=tail)
+
+
+@dataclass
+class PrefixEntry:
+    template: PromptTemplate
+    tokens: list
+    state: Any  # backend-specific prefilled KV state
+
+
+class PromptPrefixCache:
+    """LRU of prefilled system-prompt prefixes keyed by system prompt.
+
+    `build(system_prompt) -> PrefixEntry | None` runs the (expensive) prefill
+    on a miss. A None result is remembered so unsplittable templates are not
+    retried on every request.
+    """
+
+    def __init__(self, build, max_entries: int):
+        self.build = build
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, system_prompt: str):
+        if self.max_entries <= 0:
+            return None
+
+        with self._lock:
+            if system_prompt in self._entries:
+                self._entries.move_to_end(system_prompt)
+                self.hits += 1
+                return self._entries[system_prompt]
+            self.misses += 1
+
+        entry = self.build(system_prompt)
+
+        with self._lock:
+            self._entries[system_prompt] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -1,37 +1,278 @@
+import asyncio
+import json
+import time
 import aiohttp
 import logging
+from contextlib import asynccontextmanager
 from app.core.config import settings
+from app.core.metrics import registry
+from app.nlp.json_stream import JSONStreamExtractor
 
 logger = logging.getLogger(__name__)
 
+LLM_QUEUE_WAIT = registry.histogram(
+    "llm_client_queue_wait_seconds",
+    "Time a generation waited for an in-flight slot",
+)
+LLM_REQUEST_LATENCY = registry.histogram(
+    "llm_client_request_seconds",
+    "LLM service round-trip time (excluding queue wait)",
+    labelnames=("outcome",),
+)
+LLM_INFLIGHT = registry.gauge(
+    "llm_client_inflight", "Generations currently sent to the LLM service"
+)
+LLM_WAITING = registry.gauge(
+    "llm_client_waiting", "Generations waiting for an in-flight slot"
+)
+LLM_PARSE_FAILURES = registry.counter(
+    "llm_parse_failures_total",
+    "LLM replies that arrived but could not be parsed into the expected JSON",
+    labelnames=("component",),
+)
+
 
 class RemoteQwenAgent:
+    """Client for the standalone LLM service (app/llm_server.py).
+
+    One pooled keep-alive session is shared by every call. It is opened in
+    the app lifespan via `start()` / `close()`, or lazily on first use for
+    scripts that do not run a lifespan.
+    """
+
+    # Returned instead of raising so callers' JSON parsing falls through
+    HTTP_ERROR_RESPONSE = "FAILED"
+    CONNECT_ERROR_RESPONSE = "ERROR"
+
     def __init__(self):
         self.api_url = settings.LLM_API_URL
+        self.max_tokens = settings.LLM_MAX_TOKENS
+        self.temperature = settings.LLM_TEMPERATURE
+        self._session = None
+        self._session_loop = None
+        self._semaphore = None
+
+    def _make_connector(self):
+        if settings.LLM_UDS_PATH:
+            # Same-host llm_server.py listening on a Unix socket (no TCP/IP stack)
+            return aiohttp.UnixConnector(
+                path=settings.LLM_UDS_PATH, limit=settings.LLM_POOL_LIMIT
+            )
+        return aiohttp.TCPConnector(
+            limit=settings.LLM_POOL_LIMIT,
+            keepalive_timeout=settings.LLM_KEEPALIVE_SECONDS,
+        )
+
+    def _timeout(self, connect_timeout=None, read_timeout=None):
+        return aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=connect_timeout or settings.LLM_CONNECT_TIMEOUT,
+            sock_read=read_timeout or settings.LLM_READ_TIMEOUT,
+        )
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        if (
+            self._session is not None
+            and not self._session.closed
+            and self._session_loop is loop
+        ):
+            return
+
+        # A session is bound to the loop that created it (asyncio.run per call
+        # in scripts creates a fresh loop each time)
+        if self._session is not None and not self._session.closed:
+            await self._discard_session()
+        self._session = aiohttp.ClientSession(
+            connector=self._make_connector(), timeout=self._timeout()
+        )
+        self._session_loop = loop
+        self._semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+
+    async def _discard_session(self):
+        """Close a session opened on a previous event loop.
+
+        Its connector sees that loop is closed and only marks itself closed,
+        so this does not touch the dead loop; pooled sockets are released
+        with their transports.
+        """
+        try:
+            await self._session.close()
+        except RuntimeError as e:
+            # e.g. that loop is still open, its close futures belong to it
+            logger.warning(f"Discarding LLM session of a previous loop: {e}")
+        self._session = None
+        self._session_loop = None
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+
+    @asynccontextmanager
+    async def _inflight_slot(self):
+        """Wait for one of LLM_MAX_CONCURRENCY in-flight slots."""
+        await self.start()
+        semaphore = self._semaphore
+
+        # Bounded concurrency: queue locally instead of piling onto the server
+        LLM_WAITING.inc()
+        wait_start = time.perf_counter()
+        try:
+            await semaphore.acquire()
+        finally:
+            LLM_WAITING.dec()
+        LLM_QUEUE_WAIT.observe(time.perf_counter() - wait_start)
+
+        LLM_INFLIGHT.inc()
+        try:
+            yield
+        finally:
+            LLM_INFLIGHT.dec()
+            semaphore.release()
+
+    async def _post(self, payload: dict, connect_timeout=None, read_timeout=None):
+        """POST to the LLM service; returns the decoded JSON body or an error string."""
+        async with self._inflight_slot():
+            start = time.perf_counter()
+            outcome = "ok"
+            try:
+                async with self._session.post(
+                    self.api_url,
+                    json=payload,
+                    timeout=self._timeout(connect_timeout, read_timeout),
+                ) as resp:
+                    if resp.status == 200:
+                        return await resp.json()
+                    outcome = "http_error"
+                    error_text = await resp.text()
+                    logger.error(f"LLM Service Error: {resp.status} - {error_text}")
+                    return self.HTTP_ERROR_RESPONSE
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                logger.error("LLM Service timed out")
+                return self.CONNECT_ERROR_RESPONSE
+            except Exception as e:
+                outcome = "connect_error"
+                logger.error(f"Failed to connect to LLM Service: {e}")
+                return self.CONNECT_ERROR_RESPONSE
+            finally:
+                LLM_REQUEST_LATENCY.observe(
+                    time.perf_counter() - start, outcome=outcome
+                )
 
     async def generate(
-        self, prompt: str, system_prompt: str = "You are a helpful assistant."
+        self,
+        prompt: str,
+        system_prompt: str = "You are a helpful assistant.",
+        connect_timeout: float = None,
+        read_timeout: float = None,
+        max_tokens: int = None,
     ) -> str:
         payload = {
             "prompt": prompt,
             "system_prompt": system_prompt,
-            "max_tokens": settings.LLM_MAX_TOKENS,
-            "temperature": settings.LLM_TEMPERATURE,
+            "max_tokens": max_tokens or self.max_tokens,
+            "temperature": self.temperature,
         }
 
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.api_url, json=payload) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        return data.get("response", "")
-                    else:
+        data = await self._post(payload, connect_timeout, read_timeout)
+        if isinstance(data, dict):
+            return data.get("response", "")
+        return data
+
+    async def generate_json(
+        self,
+        prompt: str,
+        system_prompt: str = "You are a helpful assistant.",
+        opener: str = "{",
+        connect_timeout: float = None,
+        read_timeout: float = None,
+        max_tokens: int = None,
+    ) -> str:
+        """Generate until the first balanced JSON object/list (`opener`) closes.
+
+        Streams NDJSON deltas from /generate and drops the connection as soon
+        as the payload is complete, which cancels the rest of the generation
+        server-side. Returns the JSON text, or the full output if no complete
+        payload appeared. Falls back to `generate` when LLM_STREAMING is off.
+        """
+        if not settings.LLM_STREAMING:
+            return await self.generate(
+                prompt, system_prompt, connect_timeout, read_timeout, max_tokens
+            )
+
+        payload = {
+            "prompt": prompt,
+            "system_prompt": system_prompt,
+            "max_tokens": max_tokens or self.max_tokens,
+            "temperature": self.temperature,
+            "stream": True,
+        }
+        extractor = JSONStreamExtractor(opener)
+
+        async with self._inflight_slot():
+            start = time.perf_counter()
+            outcome = "ok"
+            try:
+                async with self._session.post(
+                    self.api_url,
+                    json=payload,
+                    timeout=self._timeout(connect_timeout, read_timeout),
+                ) as resp:
+                    if resp.status != 200:
+                        outcome = "http_error"
                         error_text = await resp.text()
-                        logger.error(f"LLM Service Error: {resp.status} - {error_text}")
-                        return "FAILED"
-        except Exception as e:
-            logger.error(f"Failed to connect to LLM Service: {e}")
-            return "ERROR"
+                        logger.error(
+                            f"LLM Service Error: {resp.status} - {error_text}"
+                        )
+                        return self.HTTP_ERROR_RESPONSE
+
+                    async for line in resp.content:
+                        if not line.strip():
+                            continue
+                        event = json.loads(line)
+                        if event.get("error"):
+                            outcome = "http_error"
+                            logger.error(f"LLM Service Error: {event['error']}")
+                            return self.HTTP_ERROR_RESPONSE
+
+                        result = extractor.feed(event.get("delta", ""))
+                        if result is not None:
+                            # Drop the connection: the server stops generating
+                            outcome = "early_stop"
+                            resp.close()
+                            return result
+
+                        if event.get("done"):
+                            break
+
+                    return extractor.text
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                logger.error("LLM Service timed out")
+                return self.CONNECT_ERROR_RESPONSE
+            except Exception as e:
+                outcome = "connect_error"
+                logger.error(f"Failed to connect to LLM Service: {e}")
+                return self.CONNECT_ERROR_RESPONSE
+            finally:
+                LLM_REQUEST_LATENCY.observe(
+                    time.perf_counter() - start, outcome=outcome
+                )
+
+    def record_parse_failure(self, component: str, response: str):
+        """Count an unparsable reply; transport errors are counted elsewhere."""
+        if response not in (self.HTTP_ERROR_RESPONSE, self.CONNECT_ERROR_RESPONSE):
+            LLM_PARSE_FAILURES.inc(component=component)
+
+    def stats(self) -> dict:
+        return {
+            "inflight": LLM_INFLIGHT.value(),
+            "waiting": LLM_WAITING.value(),
+            "queue_wait": LLM_QUEUE_WAIT.snapshot(),
+        }
 
 
 remote_llm = RemoteQwenAgent()
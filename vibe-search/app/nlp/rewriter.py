@@ -38,11 +38,14 @@ class QueryRewriter:
 
     async def rewrite(self, query: str) -> list[str]:
         try:
-            response = await llm_client.generate(query, self.SYSTEM_PROMPT)
+            response = await llm_client.generate_json(
+                query, self.SYSTEM_PROMPT, opener="["
+            )
             params = self._extract_json_list(response)
 
             if isinstance(params, list):
                 return params
+            llm_client.record_parse_failure("rewriter", response)
             return []
         except Exception:
             return []
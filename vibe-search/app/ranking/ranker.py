@@ -1,9 +1,31 @@
 from geopy.distance import geodesic
 import math
+from app.core import explain
 from app.core.config import settings
 
+# Bounded stand-in for max-normalisation, which ES cannot do per query
+REL_SATURATION_SCRIPT = "_score / (_score + params.pivot)"
+
+
+def factor_scores(weights, rel_score, dist_score, pop_score) -> dict:
+    """Per-factor scores of one result, as recorded in the explain trace."""
+    w_rel, w_dist, w_pop = weights
+    return {
+        "relevance": {"score": float(rel_score), "weight": w_rel},
+        "distance": {"score": float(dist_score), "weight": w_dist},
+        "popularity": {"score": float(pop_score), "weight": w_pop},
+    }
+
 
 class Ranker:
+    def weights_for(self, sort_preference: str = "relevance"):
+        """(w_rel, w_dist, w_pop), adjusted for the user's sort preference."""
+        if sort_preference == "distance":
+            return 0.1, 0.8, 0.1
+        if sort_preference == "popularity":
+            return 0.1, 0.1, 0.8
+        return settings.WEIGHT_REL, settings.WEIGHT_DIST, settings.WEIGHT_POP
+
     def rank(
         self,
         candidates: list,
@@ -12,6 +34,8 @@ class Ranker:
         sort_preference: str = "relevance",
     ):
         ranked_results = []
+        trace = explain.current()
+        factors = {}
 
         max_score = max((c.get("es_score", 0) for c in candidates), default=1.0)
         if max_score == 0:
@@ -39,28 +63,105 @@ class Ranker:
 
             # Final Weighted Score
             # Adjust weights based on user preference
-            w_rel = settings.WEIGHT_REL
-            w_dist = settings.WEIGHT_DIST
-            w_pop = settings.WEIGHT_POP
-
-            if sort_preference == "distance":
-                w_dist = 0.8
-                w_rel = 0.1
-                w_pop = 0.1
-            elif sort_preference == "popularity":
-                w_pop = 0.8
-                w_rel = 0.1
-                w_dist = 0.1
+            w_rel, w_dist, w_pop = self.weights_for(sort_preference)
 
             final_score = (
                 (w_rel * rel_score) + (w_dist * dist_score) + (w_pop * pop_score)
             )
             item["final_score"] = final_score
             ranked_results.append(item)
+            if trace is not None:
+                factors[item["id"]] = factor_scores(
+                    (w_rel, w_dist, w_pop), rel_score, dist_score, pop_score
+                )
 
         # Sort desc
         ranked_results.sort(key=lambda x: x["final_score"], reverse=True)
-        return ranked_results[: settings.RANK_TOP_K]
+        ranked_results = ranked_results[: settings.RANK_TOP_K]
+        if trace is not None:
+            trace.ranking = [
+                explain.ranking_row(item, factors[item["id"]]) for item in ranked_results
+            ]
+        return ranked_results
+
+    def function_score(
+        self,
+        query: dict,
+        user_lat: float,
+        user_lon: float,
+        sort_preference: str = "relevance",
+    ) -> dict:
+        """Wrap a recall query so ES computes the weighted ranking score.
+
+        Same formula as `rank()`: relevance (saturated, see
+        RANK_ES_REL_PIVOT), Gaussian distance decay with RANK_DIST_SIGMA and
+        log popularity over RANK_POP_MAX, summed with the preference weights.
+        """
+        w_rel, w_dist, w_pop = self.weights_for(sort_preference)
+        sigma = settings.RANK_DIST_SIGMA
+        # ES gauss hits `decay` at `scale`; exp(-d^2 / 2sigma^2) is 0.5 at sigma*sqrt(2 ln 2)
+        scale_km = sigma * math.sqrt(2 * math.log(2))
+
+        functions = []
+        if w_rel > 0:
+            functions.append(
+                {
+                    "script_score": {
+                        "script": {
+                            "source": REL_SATURATION_SCRIPT,
+                            "params": {"pivot": settings.RANK_ES_REL_PIVOT},
+                        }
+                    },
+                    "weight": w_rel,
+                }
+            )
+        if w_dist > 0:
+            functions.append(
+                {
+                    "gauss": {
+                        "location": {
+                            "origin": {"lat": user_lat, "lon": user_lon},
+                            "scale": f"{scale_km:.6f}km",
+                            "offset": "0km",
+                            "decay": 0.5,
+                        }
+                    },
+                    "weight": w_dist,
+                }
+            )
+        if w_pop > 0:
+            functions.append(
+                {
+                    "field_value_factor": {
+                        "field": "popularity",
+                        "modifier": "ln1p",
+                        "missing": 0,
+                    },
+                    "weight": w_pop / math.log1p(settings.RANK_POP_MAX),
+                }
+            )
+
+        return {
+            "function_score": {
+                "query": query,
+                "functions": functions,
+                "score_mode": "sum",
+                "boost_mode": "replace",
+            }
+        }
+
+    def rank_scored(self, candidates: list):
+        """Order candidates already scored by `function_score` (RANK_MODE=es)."""
+        for item in candidates:
+            item["final_score"] = item.get("es_score", 0)
+        ranked_results = sorted(
+            candidates, key=lambda x: x["final_score"], reverse=True
+        )[: settings.RANK_TOP_K]
+        trace = explain.current()
+        if trace is not None:
+            # Scored by function_score inside ES: see the sub-queue queries
+            trace.ranking = [explain.ranking_row(item) for item in ranked_results]
+        return ranked_results
 
 
 ranker = Ranker()
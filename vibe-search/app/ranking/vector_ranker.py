@@ -0,0 +1,119 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.core import explain
+from app.core.config import settings
+from app.core.geo import haversine_km_batch
+from app.ranking.ranker import Ranker, factor_scores
+
+
+@dataclass
+class CandidateColumns:
+    """Candidate fields needed for scoring, one array per field."""
+
+    lats: np.ndarray
+    lons: np.ndarray
+    es_scores: np.ndarray
+    popularity: np.ndarray
+
+    @classmethod
+    def from_candidates(cls, candidates: list):
+        n = len(candidates)
+        lats = np.empty(n)
+        lons = np.empty(n)
+        es_scores = np.empty(n)
+        popularity = np.empty(n)
+        for i, item in enumerate(candidates):
+            lats[i] = item["location"]["lat"]
+            lons[i] = item["location"]["lon"]
+            es_scores[i] = item.get("es_score", 0) or 0
+            popularity[i] = item.get("popularity", 0) or 0
+        return cls(lats, lons, es_scores, popularity)
+
+
+class VectorRanker(Ranker):
+    """NumPy implementation of `Ranker.rank`.
+
+    Same weighted formula, computed over columnar arrays: one batched
+    haversine for all distances and partial top-K selection instead of a
+    full sort. Distances differ from the geodesic ones by <0.5%.
+    """
+
+    def score_columns(
+        self,
+        cols: CandidateColumns,
+        user_lat: float,
+        user_lon: float,
+        sort_preference: str = "relevance",
+    ):
+        """Return (final_scores, distances_km) arrays for the candidates."""
+        final, dist_km, _ = self._score(cols, user_lat, user_lon, sort_preference)
+        return final, dist_km
+
+    def _score(self, cols, user_lat, user_lon, sort_preference):
+        """(final, distances_km, (weights, rel, dist, pop factor arrays))."""
+        max_score = cols.es_scores.max() if len(cols.es_scores) else 1.0
+        if max_score == 0:
+            max_score = 1.0
+        rel_score = cols.es_scores / max_score
+
+        dist_km = haversine_km_batch(user_lat, user_lon, cols.lats, cols.lons)
+        sigma = settings.RANK_DIST_SIGMA
+        dist_score = np.exp(-(dist_km**2) / (2 * (sigma**2)))
+
+        pop_score = np.log1p(cols.popularity) / np.log1p(settings.RANK_POP_MAX)
+
+        weights = self.weights_for(sort_preference)
+        w_rel, w_dist, w_pop = weights
+        final = (w_rel * rel_score) + (w_dist * dist_score) + (w_pop * pop_score)
+        return final, dist_km, (weights, rel_score, dist_score, pop_score)
+
+    def top_k(self, final: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the k best scores, best first (ties keep input order)."""
+        n = len(final)
+        if k <= 0 or n == 0:
+            return np.empty(0, dtype=int)
+        if k < n:
+            # k-th best score; ties on it go to the earliest candidates, like a stable sort
+            kth = final[np.argpartition(-final, k - 1)[k - 1]]
+            better = np.flatnonzero(final > kth)
+            ties = np.flatnonzero(final == kth)[: k - len(better)]
+            idx = np.concatenate((better, ties))
+        else:
+            idx = np.arange(n)
+        # lexsort: last key is primary
+        return idx[np.lexsort((idx, -final[idx]))]
+
+    def rank(
+        self,
+        candidates: list,
+        user_lat: float,
+        user_lon: float,
+        sort_preference: str = "relevance",
+    ):
+        if not candidates:
+            return []
+
+        cols = CandidateColumns.from_candidates(candidates)
+        final, dist_km, (weights, *factors) = self._score(
+            cols, user_lat, user_lon, sort_preference
+        )
+
+        trace = explain.current()
+        ranked_results = []
+        rows = []
+        for i in self.top_k(final, settings.RANK_TOP_K):
+            item = candidates[i]
+            item["distance_km"] = float(dist_km[i])
+            item["final_score"] = float(final[i])
+            ranked_results.append(item)
+            if trace is not None:
+                scores = factor_scores(weights, *(f[i] for f in factors))
+                rows.append(explain.ranking_row(item, scores))
+        if trace is not None:
+            trace.ranking = rows
+        return ranked_results
+
+
+vector_ranker = VectorRanker()
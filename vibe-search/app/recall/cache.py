@@ -0,0 +1,207 @@
+import asyncio
+import copy
+import json
+import logging
+import math
+import time
+from collections import OrderedDict
+from app.core.config import settings
+from app.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+RECALL_CACHE_LOOKUPS = registry.counter(
+    "recall_cache_lookups_total",
+    "Recall sub-query cache lookups",
+    labelnames=("result",),
+)
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+KM_PER_DEGREE_LAT = 111.32
+
+
+def geohash_encode(lat: float, lon: float, precision: int) -> str:
+    """Standard base32 geohash of a point."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coord = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_GEOHASH_BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def geohash_cell(lat: float, lon: float, precision: int):
+    """(center_lat, center_lon, half_height_deg, half_width_deg) of the cell."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for _ in range(precision * 5):
+        rng, coord = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if coord >= mid:
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+    return (
+        (lat_range[0] + lat_range[1]) / 2,
+        (lon_range[0] + lon_range[1]) / 2,
+        (lat_range[1] - lat_range[0]) / 2,
+        (lon_range[1] - lon_range[0]) / 2,
+    )
+
+
+class RecallCache:
+    """LRU + TTL cache of raw ES hits per recall sub-query, shared per geo tile.
+
+    The sub-query is built around the centre of the user's geohash cell with
+    the radius widened to cover the whole cell (and rounded up to a bucket),
+    so nearby users produce the same query body and share an entry. Cached
+    hits are re-parsed against each user's real position and filtered to
+    their real radius by the caller. The widened query fetches more hits
+    (`fetch_size()`), in proportion to the area it adds, so the trimmed
+    list still holds the user's top hits.
+
+    Entries are dropped when the index version (alias target + doc count)
+    changes, see `refresh_version()`.
+    """
+
+    def __init__(
+        self,
+        max_size: int = settings.RECALL_CACHE_SIZE,
+        ttl_seconds: float = settings.RECALL_CACHE_TTL_SECONDS,
+        geohash_precision: int = settings.RECALL_CACHE_GEOHASH_PRECISION,
+        radius_bucket_km: float = settings.RECALL_CACHE_RADIUS_BUCKET_KM,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.geohash_precision = geohash_precision
+        self.radius_bucket_km = radius_bucket_km
+        self._entries = OrderedDict()  # key -> (expires_at, hits)
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl_seconds > 0
+
+    def _half_diag_km(self, lat: float, lon: float):
+        """(cell centre lat, lon, half diagonal in km) of the tile at a position."""
+        c_lat, c_lon, half_h, half_w = geohash_cell(lat, lon, self.geohash_precision)
+        half_diag_km = math.hypot(
+            half_h * KM_PER_DEGREE_LAT,
+            half_w * KM_PER_DEGREE_LAT * math.cos(math.radians(c_lat)),
+        )
+        return c_lat, c_lon, half_diag_km
+
+    def snap(self, lat: float, lon: float, radius_km: float):
+        """(lat, lon, radius_km) to query with for a user position."""
+        c_lat, c_lon, half_diag_km = self._half_diag_km(lat, lon)
+        bucket = self.radius_bucket_km
+        radius = radius_km + half_diag_km
+        if bucket > 0:
+            radius = math.ceil(radius / bucket) * bucket
+        return round(c_lat, 6), round(c_lon, 6), round(radius, 3)
+
+    def fetch_size(self, size: int, lat: float, lon: float, radius_km: float) -> int:
+        """Hits to fetch for a snapped query so each user still gets `size`.
+
+        Scaled by the tile query's area over that of the smallest user
+        circle it stands for (radius minus the cell half-diagonal and the
+        bucket rounding). Depends on the snapped values only, so the cache
+        key stays shared.
+        """
+        _, _, half_diag_km = self._half_diag_km(lat, lon)
+        inner = radius_km - half_diag_km - max(self.radius_bucket_km, 0.0)
+        inner = max(inner, radius_km / 10)
+        return math.ceil(size * (radius_km / inner) ** 2)
+
+    def key(self, index: str, query: dict, size: int) -> str:
+        return json.dumps(
+            {"index": index, "query": query, "size": size},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            # Expired: drop lazily on read
+            del self._entries[key]
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            RECALL_CACHE_LOOKUPS.inc(result="miss")
+            return None
+
+        self.hits += 1
+        RECALL_CACHE_LOOKUPS.inc(result="hit")
+        self._entries.move_to_end(key)
+        return copy.deepcopy(entry[1])
+
+    def set(self, key: str, hits: list):
+        if not self.enabled:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(hits))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    async def refresh_version(self, client, index: str):
+        """Clear the cache if the alias target or document count changed."""
+        try:
+            aliases = await client.indices.get_alias(name=index)
+            targets = sorted(aliases.keys())
+        except Exception:
+            # `index` is a concrete index, not an alias
+            targets = [index]
+        count = (await client.count(index=index))["count"]
+
+        version = (tuple(targets), count)
+        if self.version is not None and version != self.version:
+            logger.info(f"Index version changed {self.version} -> {version}, clearing recall cache")
+            self.clear()
+            self.invalidations += 1
+        self.version = version
+
+    async def run_version_loop(self, client, index: str, interval_seconds: float):
+        while True:
+            try:
+                await self.refresh_version(client, index)
+            except Exception as e:
+                logger.error(f"Recall cache version check failed: {e}")
+            await asyncio.sleep(interval_seconds)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "version": self.version,
+        }
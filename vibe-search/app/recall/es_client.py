@@ -1,13 +1,89 @@
 import asyncio
+import os
+import time
 from elasticsearch import AsyncElasticsearch
-from geopy.distance import geodesic
+from app.core import explain, timing
 from app.core.config import settings
+from app.core.geo import haversine_km
+from app.core.metrics import registry
+from app.ranking.ranker import ranker
+from app.recall.cache import RecallCache
+from app.recall.memory_engine import memory_engine
+
+RECALL_DROPPED = registry.counter(
+    "recall_sub_queues_dropped_total",
+    "Recall sub-queues cancelled at the recall deadline",
+    labelnames=("source",),
+)
 
 
 class ESClient:
     def __init__(self):
-        self.client = AsyncElasticsearch(settings.ES_HOST)
+        self.es = AsyncElasticsearch(settings.ES_HOST)
         self.index = settings.ES_INDEX
+        self.cache = RecallCache()
+        # Same search / msearch contract as AsyncElasticsearch
+        self.memory = memory_engine
+        self.client = self.memory if settings.RECALL_BACKEND == "memory" else self.es
+        # Mapping the queries are built for, see refresh_schema_version()
+        self.schema_version = self._initial_schema_version()
+
+    @property
+    def fallback(self):
+        """The in-process engine, when it may answer for an unreachable ES."""
+        if (
+            settings.RECALL_MEMORY_FALLBACK
+            and self.client is not self.memory
+            and self.memory.loaded
+        ):
+            return self.memory
+        return None
+
+    def _initial_schema_version(self) -> int:
+        if settings.RECALL_SCHEMA_VERSION != "auto":
+            return int(settings.RECALL_SCHEMA_VERSION)
+        if self.client is self.memory:
+            # The in-process engine derives the v2 fields from any snapshot
+            return 2
+        # Until the mapping has been read, assume an index built before v2
+        return 1
+
+    async def refresh_schema_version(self) -> int:
+        """Target the mapping of the indices currently behind the alias.
+
+        Reads `_meta.schema_version` from each index mapping; indices
+        without it predate v2. If the alias spans several indices the
+        oldest schema wins, so the queries work on all of them.
+        """
+        if settings.RECALL_SCHEMA_VERSION != "auto" or self.client is self.memory:
+            return self.schema_version
+
+        mappings = await self.es.indices.get_mapping(index=self.index)
+        versions = []
+        for name in mappings:
+            meta = mappings[name].get("mappings", {}).get("_meta") or {}
+            versions.append(int(meta.get("schema_version", 1)))
+        version = min(versions, default=1)
+        if version != self.schema_version:
+            print(f"Recall schema version {self.schema_version} -> {version} ({self.index})")
+            self.schema_version = version
+        return version
+
+    async def run_schema_version_loop(self, interval_seconds: float):
+        while True:
+            try:
+                await self.refresh_schema_version()
+            except Exception as e:
+                print(f"Recall schema version check failed: {e}")
+            await asyncio.sleep(interval_seconds)
+
+    async def load_memory_engine(self):
+        """Load the in-process engine from the snapshot, else from an ES scroll."""
+        path = settings.RECALL_MEMORY_SNAPSHOT
+        if path and os.path.exists(path):
+            await asyncio.to_thread(self.memory.load_ndjson, path)
+        else:
+            await self.memory.load_from_es(self.es, self.index)
 
     async def search(
         self,
@@ -17,98 +93,392 @@ class ESClient:
         lat: float,
         lon: float,
         radius_km: float = None,
+        include_original: bool = False,
+        deadline_ms: float = None,
+        trace: dict = None,
+        prefetched: asyncio.Task = None,
     ):
+        """Recall candidates for a query.
+
+        `include_original` adds a sub-queue on the raw query (degraded mode,
+        when the NLP output is missing). `prefetched` is an already running
+        `search_original` task, merged like any other sub-queue.
+        `deadline_ms` bounds recall in every mode (in streaming mode it
+        tightens RECALL_DEADLINE_MS); sub-queues still running then are
+        cancelled. If `trace` is given it receives recall diagnostics
+        (currently "dropped_sub_queues" for sub-queues cut off by the
+        deadline).
+        """
         if radius_km is None:
             radius_km = settings.DEFAULT_RADIUS_KM
-        # Parallel Execution of Sub-Queues
-        # 1. Prepare parallel tasks
-        tasks = []
+        if prefetched is not None and not self._prefetch_comparable(
+            original_query, nlp_analysis, lat, lon, radius_km
+        ):
+            # Its scores come from a query built without the intent; run the
+            # original sub-queue with the intent alongside the others instead
+            prefetched.cancel()
+            prefetched = None
+            include_original = True
+        # 1. Prepare sub-queue plan
+        plan = self._plan_sub_queues(original_query, expansions, nlp_analysis)
+        if include_original and prefetched is None:
+            plan.insert(0, self._original_sub_queue(original_query))
+
+        # 2. Execute all sub-queues: streamed, one concurrent ES request each
+        # (parallel) or one _msearch round-trip, per RECALL_MODE
+        if settings.RECALL_MODE == "streaming":
+            # Merged incrementally, bounded by the recall deadline
+            if deadline_ms is None:
+                deadline_ms = settings.RECALL_DEADLINE_MS
+            else:
+                deadline_ms = min(deadline_ms, settings.RECALL_DEADLINE_MS)
+            speculative = None
+            if prefetched is not None:
+                speculative = (prefetched, self._original_sub_queue(original_query))
+            return await self._search_streaming(
+                plan, nlp_analysis, lat, lon, radius_km, deadline_ms, trace, speculative
+            )
+
+        # (task, sub-queues it answers, whether it returns one list per
+        # sub-queue); the speculative recall leads the merge order
+        jobs = []
+        if prefetched is not None:
+            jobs.append((prefetched, [self._original_sub_queue(original_query)], False))
+        if settings.RECALL_MODE == "msearch":
+            if plan:
+                task = asyncio.create_task(
+                    self._search_msearch(plan, nlp_analysis, lat, lon, radius_km)
+                )
+                jobs.append((task, plan, True))
+        else:
+            for sq in plan:
+                task = asyncio.create_task(
+                    self._search_sub_queue(
+                        query_content=sq["query_content"],
+                        query_type=sq["query_type"],
+                        nlp_analysis=nlp_analysis,
+                        lat=lat,
+                        lon=lon,
+                        radius_km=radius_km,
+                        source_tag=sq["source_tag"],
+                    )
+                )
+                jobs.append((task, [sq], False))
+
+        # Bounded by the caller's deadline (the request's latency budget)
+        timeout = None if deadline_ms is None else max(0.0, deadline_ms / 1000.0)
+        pending = set()
+        if jobs:
+            _, pending = await asyncio.wait([job[0] for job in jobs], timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        all_results_lists = []
+        dropped = []
+        for task, sqs, per_sub_queue in jobs:
+            if task in pending:
+                dropped.extend(sqs)
+            elif per_sub_queue:
+                all_results_lists.extend(task.result())
+            else:
+                all_results_lists.append(task.result())
+        self._record_dropped(dropped, trace)
+
+        # 3. Merge & Dedup
+        return self._merge(all_results_lists)
+
+    async def search_original(self, original_query, lat, lon, radius_km=None):
+        """Recall on the raw query alone (no NLP needed).
+
+        Started alongside the NLP calls and handed to `search(prefetched=...)`,
+        so its ES round-trip overlaps LLM latency.
+        """
+        if radius_km is None:
+            radius_km = settings.DEFAULT_RADIUS_KM
+        sq = self._original_sub_queue(original_query)
+        return await self._search_sub_queue(
+            query_content=sq["query_content"],
+            query_type=sq["query_type"],
+            nlp_analysis={},
+            lat=lat,
+            lon=lon,
+            radius_km=radius_km,
+            source_tag=sq["source_tag"],
+        )
+
+    def _prefetch_comparable(self, original_query, nlp_analysis, lat, lon, radius_km):
+        """Whether `search_original` hits can be merged with the intent's.
+
+        With RANK_MODE=es each hit's es_score is the final ranking score,
+        so the speculative query (built for an empty intent: relevance
+        weights, no category boost) must equal the intent-aware one.
+        """
+        if settings.RANK_MODE != "es":
+            return True
+        sq = self._original_sub_queue(original_query)
+        return self._build_query(
+            sq["query_content"], sq["query_type"], {}, lat, lon, radius_km
+        ) == self._build_query(
+            sq["query_content"], sq["query_type"], nlp_analysis, lat, lon, radius_km
+        )
+
+    def _original_sub_queue(self, original_query):
+        return {
+            "query_content": original_query,
+            "query_type": "original",
+            "source_tag": "original",
+        }
+
+    def _plan_sub_queues(self, original_query, expansions, nlp_analysis):
+        """List the sub-queues (content, type, recall_source tag) for a search."""
+        plan = []
 
         # A. Analysis Sub-Queues
         # A1. Key Phrases (Aggregated)
         if nlp_analysis.get("key_phrases"):
-            tasks.append(
-                self._search_sub_queue(
-                    query_content=nlp_analysis["key_phrases"],
-                    query_type="phrases_agg",
-                    nlp_analysis=nlp_analysis,
-                    lat=lat,
-                    lon=lon,
-                    radius_km=radius_km,
-                    source_tag="analysis_phrases",
-                )
+            plan.append(
+                {
+                    "query_content": nlp_analysis["key_phrases"],
+                    "query_type": "phrases_agg",
+                    "source_tag": "analysis_phrases",
+                }
             )
 
         # A2. Keywords (Aggregated)
         if nlp_analysis.get("keywords"):
-            tasks.append(
-                self._search_sub_queue(
-                    query_content=nlp_analysis["keywords"],
-                    query_type="keywords_agg",
-                    nlp_analysis=nlp_analysis,
-                    lat=lat,
-                    lon=lon,
-                    radius_km=radius_km,
-                    source_tag="analysis_keywords",
-                )
+            plan.append(
+                {
+                    "query_content": nlp_analysis["keywords"],
+                    "query_type": "keywords_agg",
+                    "source_tag": "analysis_keywords",
+                }
             )
 
         # A3. Key Info (Semantic Summary)
         if nlp_analysis.get("key_info"):
-            tasks.append(
-                self._search_sub_queue(
-                    query_content=nlp_analysis["key_info"],
-                    query_type="key_info",
-                    nlp_analysis=nlp_analysis,
-                    lat=lat,
-                    lon=lon,
-                    radius_km=radius_km,
-                    source_tag="analysis_info",
-                )
+            plan.append(
+                {
+                    "query_content": nlp_analysis["key_info"],
+                    "query_type": "key_info",
+                    "source_tag": "analysis_info",
+                }
             )
 
         # B. Rewriting Queues (N tasks)
         for exp in expansions:
-            tasks.append(
+            plan.append(
+                {
+                    "query_content": exp,
+                    "query_type": "rewrite",
+                    "source_tag": "rewriting",
+                }
+            )
+
+        return plan
+
+    def _merge(self, all_results_lists):
+        merged_candidates = []
+        mapped_candidates = {}
+
+        # Flatten results
+        with timing.stage("recall_merge"):
+            for sub_queue_results in all_results_lists:
+                self._merge_into(mapped_candidates, merged_candidates, sub_queue_results)
+
+        timing.count_candidates("merged", len(merged_candidates))
+        return merged_candidates
+
+    def _merge_into(self, mapped_candidates, merged_candidates, sub_queue_results):
+        """Merge one sub-queue's results into the running candidate list."""
+        for candidate in sub_queue_results:
+            cid = candidate["id"]
+            if cid not in mapped_candidates:
+                mapped_candidates[cid] = candidate
+                merged_candidates.append(candidate)  # Preserve order
+            else:
+                # ES-ranked scores differ per sub-queue; keep the best
+                existing = mapped_candidates[cid]
+                score = candidate.get("es_score", 0)
+                if settings.RANK_MODE == "es" and score > existing.get("es_score", 0):
+                    existing["es_score"] = score
+
+                # Append source if already exists
+                prev_source = existing.get("recall_source", "")
+                curr_source = candidate.get("recall_source", "")
+
+                # Merge sources
+                if curr_source not in prev_source:
+                    existing["recall_source"] = f"{prev_source}, {curr_source}"
+
+    async def _search_streaming(
+        self, plan, nlp_analysis, lat, lon, radius_km, deadline_ms, trace, speculative=None
+    ):
+        """Merge sub-queues as they complete, up to `deadline_ms`.
+
+        Sub-queues still running at the deadline are cancelled (aborting
+        their ES requests) and listed in trace["dropped_sub_queues"].
+        """
+        merged_candidates = []
+        mapped_candidates = {}
+        if not plan and speculative is None:
+            if trace is not None:
+                trace["dropped_sub_queues"] = []
+            return merged_candidates
+
+        tasks = {
+            asyncio.create_task(
                 self._search_sub_queue(
-                    query_content=exp,
-                    query_type="rewrite",
+                    query_content=sq["query_content"],
+                    query_type=sq["query_type"],
                     nlp_analysis=nlp_analysis,
                     lat=lat,
                     lon=lon,
                     radius_km=radius_km,
-                    source_tag="rewriting",
+                    source_tag=sq["source_tag"],
                 )
-            )
+            ): sq
+            for sq in plan
+        }
+        if speculative is not None:
+            # (task, sub-queue spec) started before NLP finished
+            task, sq = speculative
+            tasks[task] = sq
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + deadline_ms / 1000.0
+        pending = set(tasks)
+        merge_seconds = 0.0
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                merge_start = time.perf_counter()
+                for task in done:
+                    self._merge_into(
+                        mapped_candidates, merged_candidates, task.result()
+                    )
+                merge_seconds += time.perf_counter() - merge_start
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        self._record_dropped([tasks[task] for task in pending], trace)
+        # Merged incrementally between completions: one total per search
+        timing.record("recall_merge", merge_seconds)
+        timing.count_candidates("merged", len(merged_candidates))
+        return merged_candidates
 
-        # Execute all sub-queues
-        all_results_lists = await asyncio.gather(*tasks)
+    def _record_dropped(self, sub_queues, trace):
+        """Count sub-queues cut off by the deadline and list them in `trace`."""
+        dropped = [self._sub_queue_label(sq) for sq in sub_queues]
+        if dropped:
+            print(f"Recall deadline hit, dropped sub-queues: {dropped}")
+            for sq in sub_queues:
+                RECALL_DROPPED.inc(source=sq["source_tag"])
+        if trace is not None:
+            trace["dropped_sub_queues"] = dropped
+
+    def _sub_queue_label(self, sq):
+        # Rewrites share one source tag; name them by their text
+        if sq["query_type"] == "rewrite":
+            return f"{sq['source_tag']}:{sq['query_content']}"
+        return sq["source_tag"]
+
+    async def _search_msearch(self, plan, nlp_analysis, lat, lon, radius_km):
+        """Run every sub-queue in a single _msearch round-trip.
+
+        Each response is parsed and deduplicated on its own, so attribution
+        and per-sub-queue dedup match the parallel mode, and one failing
+        sub-queue only empties its own result list.
+        """
+        if not plan:
+            return []
 
-        # Merge & Dedup
-        seen_ids = set()
-        merged_candidates = []
-        mapped_candidates = {}
+        trace = explain.current()
+        profile = trace is not None and trace.profile
 
-        # Flatten results
-        for sub_queue_results in all_results_lists:
-            for candidate in sub_queue_results:
-                cid = candidate["id"]
-                if cid not in mapped_candidates:
-                    mapped_candidates[cid] = candidate
-                    merged_candidates.append(candidate)  # Preserve order
-                    seen_ids.add(cid)
+        # Cached sub-queues are answered locally; only misses go to _msearch
+        prepared = []
+        searches = []
+        for sq in plan:
+            query, key, size = self._prepare_query(
+                sq["query_content"], sq["query_type"], nlp_analysis, lat, lon, radius_km
+            )
+            hits = self.cache.get(key) if key and not profile else None
+            prepared.append((query, key, hits))
+            if hits is None:
+                body = {"query": query, "size": size}
+                if profile:
+                    body["profile"] = True
+                searches.append({"index": self.index})
+                searches.append(body)
+
+        responses = []
+        start = time.perf_counter()
+        if searches:
+            # One round-trip for all sub-queues: timed as a whole
+            with timing.stage("recall_msearch"):
+                try:
+                    resp = await self.client.msearch(searches=searches)
+                except Exception as e:
+                    print(f"ES Search Context Error: {e}")
+                    if self.fallback is None:
+                        return [[] for _ in plan]
+                    resp = await self.fallback.msearch(searches=searches)
+            responses = resp["responses"]
+
+        # Shared by every sub-queue of the round-trip
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+
+        all_results_lists = []
+        responses = iter(responses)
+        for sq, (query, key, hits) in zip(plan, prepared):
+            cached = hits is not None
+            sub_resp = None
+            if hits is None:
+                sub_resp = next(responses)
+                if "error" in sub_resp:
+                    print(f"ES Sub-Queue Error ({sq['source_tag']}): {sub_resp['error']}")
+                    hits = None
                 else:
-                    # Append source if already exists
-                    prev_source = mapped_candidates[cid].get("recall_source", "")
-                    curr_source = candidate.get("recall_source", "")
+                    hits = sub_resp["hits"]["hits"]
+                    if key:
+                        self.cache.set(key, hits)
 
-                    # Merge sources
-                    if curr_source not in prev_source:
-                        mapped_candidates[cid][
-                            "recall_source"
-                        ] = f"{prev_source}, {curr_source}"
+            results = []
+            if hits is not None:
+                results = self._hits_for_user(hits, key, lat, lon, radius_km)
+                for r in results:
+                    r["recall_source"] = sq["source_tag"]
+                timing.RECALL_SUB_QUEUE_CANDIDATES.observe(
+                    len(results), source=sq["source_tag"]
+                )
+            all_results_lists.append(results)
 
-        return merged_candidates
+            if trace is not None:
+                trace.add_sub_queue(
+                    {
+                        "source": sq["source_tag"],
+                        "query_type": sq["query_type"],
+                        "query_content": sq["query_content"],
+                        "query": query,
+                        "cached": cached,
+                        "failed": hits is None,
+                        "elapsed_ms": 0.0 if cached else elapsed_ms,
+                        "es_took_ms": sub_resp.get("took") if sub_resp else None,
+                        "hits": explain.hit_summary(results),
+                        "profile": sub_resp.get("profile") if sub_resp else None,
+                    }
+                )
+        return all_results_lists
 
     async def _search_sub_queue(
         self, query_content, query_type, nlp_analysis, lat, lon, radius_km, source_tag
@@ -118,6 +488,86 @@ class ESClient:
         query_type: 'phrases_agg', 'keywords_agg', 'key_info', 'rewrite'
         query_content: string or list of strings
         """
+        trace = explain.current()
+        with timing.stage(
+            f"recall_{source_tag}", timing.RECALL_SUB_QUEUE_LATENCY, source=source_tag
+        ):
+            start = time.perf_counter()
+            query, key, size = self._prepare_query(
+                query_content, query_type, nlp_analysis, lat, lon, radius_km
+            )
+
+            # A profiled request has to reach ES, so it skips the cache read
+            profile = trace is not None and trace.profile
+            hits = self.cache.get(key) if key and not profile else None
+            cached = hits is not None
+            resp = None
+            if hits is None:
+                params = {"profile": True} if profile else {}
+                resp = await self._fetch_response(query, size, **params)
+                if resp is None:
+                    hits = []
+                else:
+                    hits = resp["hits"]["hits"]
+                    if key:
+                        self.cache.set(key, hits)
+
+            results = self._hits_for_user(hits, key, lat, lon, radius_km)
+        for r in results:
+            r["recall_source"] = source_tag
+        timing.RECALL_SUB_QUEUE_CANDIDATES.observe(len(results), source=source_tag)
+        if trace is not None:
+            trace.add_sub_queue(
+                {
+                    "source": source_tag,
+                    "query_type": query_type,
+                    "query_content": query_content,
+                    "query": query,
+                    "cached": cached,
+                    "failed": not cached and resp is None,
+                    "elapsed_ms": (time.perf_counter() - start) * 1000.0,
+                    "es_took_ms": resp.get("took") if resp else None,
+                    "hits": explain.hit_summary(results),
+                    "profile": resp.get("profile") if resp else None,
+                }
+            )
+        return results
+
+    def _prepare_query(self, query_content, query_type, nlp_analysis, lat, lon, radius_km):
+        """(query, cache_key, size); cache_key is None when the cache is off.
+
+        With the cache on, the query targets the user's geo tile rather than
+        the exact position, so neighbours share the cache entry. Not under
+        RANK_MODE=es: the gauss origin would be the tile centre, and the
+        cached es_score is the final score, so the query stays exact there.
+        """
+        if not self.cache.enabled or settings.RANK_MODE == "es":
+            query = self._build_query(
+                query_content, query_type, nlp_analysis, lat, lon, radius_km
+            )
+            return query, None, self._search_size()
+
+        t_lat, t_lon, t_radius = self.cache.snap(lat, lon, radius_km)
+        query = self._build_query(
+            query_content, query_type, nlp_analysis, t_lat, t_lon, t_radius
+        )
+        size = self.cache.fetch_size(self._search_size(), t_lat, t_lon, t_radius)
+        return query, self.cache.key(self.index, query, size), size
+
+    def _hits_for_user(self, hits, key, lat, lon, radius_km):
+        results = self._process_hits(hits, lat, lon, trim=bool(key))
+        if key:
+            # Tile queries cover more than the user's circle: trim to it, and
+            # to the page the exact query would have returned
+            results = [
+                r
+                for r in results
+                if r["distance_km"] is None or r["distance_km"] <= radius_km
+            ][: self._search_size()]
+        return results
+
+    def _build_query(self, query_content, query_type, nlp_analysis, lat, lon, radius_km):
+        """Build the bool query body for one sub-queue."""
         must_clauses = [
             {
                 "geo_distance": {
@@ -172,6 +622,36 @@ class ESClient:
             )
             min_should_match = 1  # Single clause, keep at 1
 
+        elif query_type in ("rewrite", "original") and self.schema_version >= 2:
+            # The combined name / address / rewrites / category field replaces
+            # the per-field clauses. A term-level minimum_should_match takes
+            # over from v1's two-clause agreement, and the name clause tops
+            # the base boost up so name hits keep BOOST_NAME
+            base_boost = min(settings.BOOST_ADDR, settings.BOOST_REWRITE)
+            must_clauses.append(
+                {
+                    "match": {
+                        "search_text": {
+                            "query": query_content,
+                            "boost": base_boost,
+                            "minimum_should_match": settings.RECALL_TEXT_MIN_SHOULD_MATCH,
+                        }
+                    }
+                }
+            )
+            if settings.BOOST_NAME > base_boost:
+                should_clauses.append(
+                    {
+                        "match": {
+                            "name": {
+                                "query": query_content,
+                                "boost": settings.BOOST_NAME - base_boost,
+                            }
+                        }
+                    }
+                )
+            min_should_match = 0
+
         elif query_type == "rewrite":
             # Loose Match on multiple text fields including AI rewrites
             should_clauses.append(
@@ -243,12 +723,22 @@ class ESClient:
         # Global Category Boost (Apply to all)
         if nlp_analysis.get("category"):
             cat = nlp_analysis["category"]
-            should_clauses.append(
-                {"match": {"amenity": {"query": cat, "boost": settings.BOOST_CATEGORY}}}
-            )
-            if query_type == "keyword" or query_type == "original":
-                # For broad queries, category match helps
-                pass
+            if self.schema_version >= 2:
+                # Exact term on the normalized keyword (amenity / shop / tourism)
+                should_clauses.append(
+                    {
+                        "term": {
+                            "category.norm": {
+                                "value": str(cat).lower(),
+                                "boost": settings.BOOST_CATEGORY,
+                            }
+                        }
+                    }
+                )
+            else:
+                should_clauses.append(
+                    {"match": {"amenity": {"query": cat, "boost": settings.BOOST_CATEGORY}}}
+                )
 
         query = {
             "bool": {
@@ -257,58 +747,88 @@ class ESClient:
                 "minimum_should_match": min_should_match,
             }
         }
+        if settings.RANK_MODE == "es":
+            query = ranker.function_score(
+                query, lat, lon, nlp_analysis.get("sort_preference") or "relevance"
+            )
+        return query
 
-        results = await self._execute_query(
-            query, size=settings.SEARCH_SIZE, lat=lat, lon=lon
-        )
-        for r in results:
-            r["recall_source"] = source_tag
-        return results
+    def _search_size(self):
+        # ES-side ranking orders each sub-queue by the final score: no hit
+        # past its RANK_TOP_K can make the merged top-K. Not below that, as
+        # one sub-queue may hold the whole top-K.
+        if settings.RANK_MODE == "es":
+            return settings.RANK_ES_SEARCH_SIZE
+        return settings.SEARCH_SIZE
 
-    async def _execute_query(self, query, size, lat, lon):
+    async def _fetch_response(self, query, size, **params):
+        """Search response for a query, or None if the search failed.
+
+        `params` go to the search call as-is (e.g. profile=True).
+        """
         try:
-            # Debug: Check for index existence before searching?
-            # No, just let it fail or succeed.
-            # Note: The index name used is self.index (poi_v1).
-            resp = await self.client.search(index=self.index, query=query, size=size)
+            return await self.client.search(
+                index=self.index, query=query, size=size, **params
+            )
+        except Exception as e:
+            print(f"ES Search Context Error: {e}")
+            if self.fallback is None:
+                return None
 
-            results = []
-            seen_ids = set()
-            seen_content = set()
+        try:
+            return await self.fallback.search(
+                index=self.index, query=query, size=size, **params
+            )
+        except Exception as e:
+            print(f"Memory Recall Error: {e}")
+            return None
 
-            for hit in resp["hits"]["hits"]:
-                parsed = self._parse_hit(hit, lat, lon)
+    def _needs_distance(self, trim: bool) -> bool:
+        """Whether recall computes `distance_km` itself.
 
-                # 1. ID Dedup
-                if parsed["id"] in seen_ids:
-                    continue
-                seen_ids.add(parsed["id"])
-
-                # 2. Content Dedup (Handle dirty data with unique IDs but same content)
-                # Use name + approx location (100m precision)
-                name = parsed.get("name")
-                loc = parsed.get("location")
-
-                if name and loc:
-                    p_lat = loc["lat"]
-                    p_lon = loc["lon"]
-                    # Round based on dedup precision (default 3 decimals ~100m)
-                    precision = settings.DEDUP_PRECISION
-                    content_key = (
-                        name,
-                        round(p_lat, precision),
-                        round(p_lon, precision),
-                    )
+        The local rankers set it on the results they return, so recall only
+        needs it to trim tile queries, for RANK_MODE=es and for explain.
+        """
+        return trim or settings.RANK_MODE == "es" or explain.current() is not None
 
-                    if content_key in seen_content:
-                        continue
-                    seen_content.add(content_key)
+    def _process_hits(self, hits, lat, lon, trim: bool = False):
+        """Parse raw hits and drop duplicates within one sub-queue."""
+        results = []
+        seen_ids = set()
+        seen_content = set()
+        if not self._needs_distance(trim):
+            lat = lon = None
+
+        for hit in hits:
+            parsed = self._parse_hit(hit, lat, lon)
+
+            # 1. ID Dedup
+            if parsed["id"] in seen_ids:
+                continue
+            seen_ids.add(parsed["id"])
+
+            # 2. Content Dedup (Handle dirty data with unique IDs but same content)
+            # Use name + approx location (100m precision)
+            name = parsed.get("name")
+            loc = parsed.get("location")
+
+            if name and loc:
+                p_lat = loc["lat"]
+                p_lon = loc["lon"]
+                # Round based on dedup precision (default 3 decimals ~100m)
+                precision = settings.DEDUP_PRECISION
+                content_key = (
+                    name,
+                    round(p_lat, precision),
+                    round(p_lon, precision),
+                )
 
-                results.append(parsed)
-            return results
-        except Exception as e:
-            print(f"ES Search Context Error: {e}")
-            return []
+                if content_key in seen_content:
+                    continue
+                seen_content.add(content_key)
+
+            results.append(parsed)
+        return results
 
     def _parse_hit(self, hit, lat, lon):
         source = hit["_source"]
@@ -318,7 +838,7 @@ class ESClient:
             try:
                 item_lat = source["location"]["lat"]
                 item_lon = source["location"]["lon"]
-                dist_km = geodesic((lat, lon), (item_lat, item_lon)).km
+                dist_km = haversine_km(lat, lon, item_lat, item_lon)
             except Exception:
                 pass
 
@@ -0,0 +1,513 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+from collections import defaultdict
+from contextlib import aclosing
+from elasticsearch.helpers import async_scan
+from app.core.config import settings
+from app.core.geo import haversine_km
+from app.ranking.ranker import REL_SATURATION_SCRIPT
+
+logger = logging.getLogger(__name__)
+
+# Mapped like the ingestion index: analysed text vs exact-value keyword fields
+TEXT_FIELDS = (
+    "name", "address", "keywords", "key_phrases", "key_info", "rewrites", "search_text",
+)
+KEYWORD_FIELDS = ("category", "amenity", "category.norm", "amenity.norm")
+# Schema v2 `copy_to` sources of the combined `search_text` field
+COPY_TO_SEARCH_TEXT = ("name", "category", "amenity", "address", "rewrites")
+# `.norm` subfields: the parent keyword through the lowercase normalizer
+NORMALIZED_FIELDS = {"category.norm": "category", "amenity.norm": "amenity"}
+
+# Lucene BM25 defaults
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Position gap between values of an array field, as in ES
+POSITION_GAP = 100
+
+_CJK = "぀-ヿ㐀-䶿一-鿿豈-﫿"
+# Standard-analyzer approximation: one token per CJK character, words otherwise
+_TOKEN_RE = re.compile(rf"[{_CJK}]|[^\W_{_CJK}]+")
+
+
+def tokenize(text) -> list[str]:
+    return _TOKEN_RE.findall(str(text).lower())
+
+
+def _values(value) -> list:
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [v for v in value if v is not None]
+    return [value]
+
+
+def _parse_distance_km(distance) -> float:
+    text = str(distance).strip().lower()
+    for unit, factor in (("km", 1.0), ("m", 0.001)):
+        if text.endswith(unit):
+            return float(text[: -len(unit)]) * factor
+    return float(text) * 0.001  # ES default unit is metres
+
+
+def _field_query(spec):
+    """(query, boost) from a match / match_phrase field body."""
+    if isinstance(spec, dict):
+        return spec.get("query", ""), float(spec.get("boost", 1.0))
+    return spec, 1.0
+
+
+def required_terms(spec, n: int) -> int:
+    """Terms a match needs under an ES `minimum_should_match` spec.
+
+    Supports integers and percentages (negative = that many may be
+    missing) and conditional specs like "2<75%" or "2<-25% 9<-3".
+    """
+    if spec is None:
+        return 1
+    spec = str(spec).strip()
+    if "<" in spec:
+        required = n  # at or below the first threshold every term counts
+        for part in spec.split():
+            threshold, value = part.split("<")
+            if n > int(threshold):
+                required = required_terms(value, n)
+        return required
+    if spec.endswith("%"):
+        pct = float(spec[:-1])
+        count = int(n * abs(pct) / 100)
+        required = count if pct >= 0 else n - count
+    else:
+        value = int(spec)
+        required = value if value >= 0 else n + value
+    return max(1, required)
+
+
+class MemoryRecallEngine:
+    """In-process POI recall with the ES client's search / msearch contract.
+
+    Holds the corpus with a grid index over `location`, BM25 inverted
+    indexes over the text fields and exact-value indexes over the keyword
+    fields (including the schema v2 `search_text` / `.norm` fields that ES
+    derives at index time), and evaluates the query DSL subset ESClient emits (bool,
+    geo_distance, match, match_phrase, term, match_all, function_score).
+    Used as the recall backend (RECALL_BACKEND=memory) or as a fallback
+    while ES is unreachable.
+    """
+
+    def __init__(self, grid_deg: float = settings.MEMORY_GRID_DEG):
+        self.grid_deg = grid_deg
+        self.loaded = False
+        self._reset()
+
+    def _reset(self):
+        self.ids = []
+        self.sources = []
+        self.id_to_doc = {}
+        self.grid = defaultdict(list)  # (row, col) -> [doc]
+        self.postings = {f: defaultdict(dict) for f in TEXT_FIELDS}  # term -> {doc: [pos]}
+        self.field_lengths = {f: [] for f in TEXT_FIELDS}
+        self.avg_lengths = {f: 1.0 for f in TEXT_FIELDS}
+        self.idf = {f: {} for f in TEXT_FIELDS}  # term -> BM25 idf, set by load()
+        self.exact = {f: defaultdict(set) for f in KEYWORD_FIELDS}  # value -> {doc}
+
+    # ----------------------------------------------------------------- loading
+    def load(self, docs):
+        """Build the indexes from (id, source) pairs, replacing the corpus."""
+        self._reset()
+        for doc_id, source in docs:
+            self._add(str(doc_id), source)
+
+        for field in TEXT_FIELDS:
+            lengths = self.field_lengths[field]
+            non_empty = [n for n in lengths if n]
+            self.avg_lengths[field] = (sum(non_empty) / len(non_empty)) if non_empty else 1.0
+            # Corpus statistics only: computed once, not per scored doc
+            self.idf[field] = {
+                term: self._bm25_idf(len(docs)) for term, docs in self.postings[field].items()
+            }
+        self.loaded = True
+        logger.info(f"Memory recall engine loaded {len(self.ids)} POIs")
+
+    def _add(self, doc_id: str, source: dict):
+        doc = len(self.ids)
+        self.ids.append(doc_id)
+        self.sources.append(source)
+        self.id_to_doc[doc_id] = doc
+
+        location = source.get("location")
+        if location and location.get("lat") is not None:
+            self.grid[self._cell(location["lat"], location["lon"])].append(doc)
+
+        for field in TEXT_FIELDS:
+            position = 0
+            length = 0
+            for value in self._field_values(source, field):
+                for token in tokenize(value):
+                    self.postings[field][token].setdefault(doc, []).append(position)
+                    position += 1
+                    length += 1
+                position += POSITION_GAP
+            self.field_lengths[field].append(length)
+
+        for field in KEYWORD_FIELDS:
+            for value in self._field_values(source, field):
+                self.exact[field][str(value)].add(doc)
+
+    def _field_values(self, source: dict, field: str) -> list:
+        """Indexed values of a field, including ones ES derives at index time."""
+        if field == "search_text":
+            return [v for f in COPY_TO_SEARCH_TEXT for v in _values(source.get(f))]
+        if field in NORMALIZED_FIELDS:
+            return [str(v).lower() for v in _values(source.get(NORMALIZED_FIELDS[field]))]
+        return _values(source.get(field))
+
+    def load_ndjson(self, path: str):
+        """Load a dump of `{"_id": ..., "_source": {...}}` lines (see write_ndjson)."""
+        docs = []
+        with open(path, encoding="utf-8") as f:
+            for i, line in enumerate(f):
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                if "_source" in record:
+                    docs.append((record.get("_id", i), record["_source"]))
+                else:
+                    docs.append((record.pop("id", i), record))
+        self.load(docs)
+
+    def write_ndjson(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for doc_id, source in zip(self.ids, self.sources):
+                f.write(json.dumps({"_id": doc_id, "_source": source}, ensure_ascii=False))
+                f.write("\n")
+
+    async def load_from_es(self, client, index: str):
+        """Load the corpus with a scroll over the ES index."""
+        docs = []
+        scan = async_scan(client, index=index, query={"query": {"match_all": {}}})
+        async with aclosing(scan) as hits:
+            async for hit in hits:
+                docs.append((hit["_id"], hit["_source"]))
+        self.load(docs)
+
+    def gazetteer(self):
+        """(category values, {name: category}) for the intent fast path."""
+        categories = set(self.exact["category"]) | set(self.exact["amenity"])
+        names = {s["name"]: s.get("category") for s in self.sources if s.get("name")}
+        return categories, names
+
+    # ------------------------------------------------------------ ES contract
+    async def search(self, index=None, query=None, size=10, **kwargs):
+        return await self._search_async(query or {"match_all": {}}, size)
+
+    async def msearch(self, searches=None, **kwargs):
+        responses = []
+        for body in (searches or [])[1::2]:
+            try:
+                responses.append(
+                    await self._search_async(
+                        body.get("query") or {"match_all": {}}, body.get("size", 10)
+                    )
+                )
+            except Exception as e:
+                responses.append({"error": {"type": type(e).__name__, "reason": str(e)}, "status": 400})
+        return {"responses": responses}
+
+    async def count(self, index=None, **kwargs):
+        return {"count": len(self.ids)}
+
+    async def _search_async(self, query: dict, size: int) -> dict:
+        candidates = self._candidate_docs(query)
+        if len(candidates) > settings.MEMORY_INLINE_SCAN_DOCS:
+            # A wide scan (e.g. no geo filter) would stall every other request
+            return await asyncio.to_thread(self._scan, query, candidates, size)
+        return self._scan(query, candidates, size)
+
+    def _candidate_docs(self, query: dict):
+        if not self.loaded:
+            raise RuntimeError("Memory recall engine is not loaded")
+        candidates = self._candidates(query)
+        return range(len(self.ids)) if candidates is None else candidates
+
+    def _scan(self, query: dict, candidates, size: int) -> dict:
+        scored = []
+        for doc in candidates:
+            score = self._score(query, doc)
+            if score is not None:
+                scored.append((score, doc))
+        scored.sort(key=lambda x: (-x[0], x[1]))
+
+        hits = [
+            {
+                "_index": settings.ES_INDEX,
+                "_id": self.ids[doc],
+                "_score": score,
+                "_source": self.sources[doc],
+            }
+            for score, doc in scored[:size]
+        ]
+        return {
+            "hits": {
+                "total": {"value": len(scored), "relation": "eq"},
+                "max_score": scored[0][0] if scored else None,
+                "hits": hits,
+            },
+            "status": 200,
+        }
+
+    # ---------------------------------------------------- candidate generation
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.grid_deg), math.floor(lon / self.grid_deg))
+
+    def _geo_candidates(self, spec: dict) -> set:
+        radius_km = _parse_distance_km(spec["distance"])
+        lat, lon = spec["location"]["lat"], spec["location"]["lon"]
+        dlat = radius_km / 111.32
+        dlon = radius_km / max(1e-6, 111.32 * math.cos(math.radians(lat)))
+        row0, col0 = self._cell(lat - dlat, lon - dlon)
+        row1, col1 = self._cell(lat + dlat, lon + dlon)
+        docs = set()
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                docs.update(self.grid.get((row, col), ()))
+        return docs
+
+    def _candidates(self, query: dict):
+        """Superset of matching docs, or None when it would be every doc."""
+        (kind, body), = query.items()
+        if kind == "geo_distance":
+            return self._geo_candidates(body)
+        if kind in ("match", "match_phrase"):
+            (field, spec), = body.items()
+            text, _ = _field_query(spec)
+            if field in KEYWORD_FIELDS:
+                return set(self.exact[field].get(str(text), ()))
+            if field not in self.postings:
+                return set()
+            tokens = tokenize(text)
+            sets = [set(self.postings[field].get(t, ())) for t in tokens]
+            if not sets:
+                return set()
+            if kind == "match_phrase":
+                return set.intersection(*sets)
+            return set.union(*sets)
+        if kind == "term":
+            (field, spec), = body.items()
+            value = self._term_value(field, spec)
+            return set(self.exact.get(field, {}).get(value, ()))
+        if kind == "function_score":
+            return self._candidates(body.get("query") or {"match_all": {}})
+        if kind == "bool":
+            result = None
+            for clause in body.get("must", []) + body.get("filter", []):
+                docs = self._candidates(clause)
+                if docs is not None:
+                    result = docs if result is None else result & docs
+            should = body.get("should", [])
+            if should and self._min_should_match(body) > 0:
+                union = set()
+                for clause in should:
+                    docs = self._candidates(clause)
+                    if docs is None:
+                        union = None
+                        break
+                    union |= docs
+                if union is not None:
+                    result = union if result is None else result & union
+            return result
+        return None
+
+    def _term_value(self, field: str, spec) -> str:
+        value = str(spec.get("value") if isinstance(spec, dict) else spec)
+        # ES runs term values through the field's normalizer
+        return value.lower() if field in NORMALIZED_FIELDS else value
+
+    # ----------------------------------------------------------------- scoring
+    def _min_should_match(self, body: dict) -> int:
+        if "minimum_should_match" in body:
+            return int(body["minimum_should_match"])
+        return 0 if (body.get("must") or body.get("filter")) else 1
+
+    def _score(self, query: dict, doc: int):
+        """Score of `doc` for `query`, or None if it does not match."""
+        (kind, body), = query.items()
+
+        if kind == "match_all":
+            return float(body.get("boost", 1.0)) if body else 1.0
+
+        if kind == "geo_distance":
+            location = self.sources[doc].get("location")
+            if not location:
+                return None
+            dist = haversine_km(
+                body["location"]["lat"], body["location"]["lon"],
+                location["lat"], location["lon"],
+            )
+            return 1.0 if dist <= _parse_distance_km(body["distance"]) else None
+
+        if kind == "term":
+            (field, spec), = body.items()
+            value = self._term_value(field, spec)
+            boost = float(spec.get("boost", 1.0)) if isinstance(spec, dict) else 1.0
+            matched = doc in self.exact.get(field, {}).get(value, ())
+            return boost if matched else None
+
+        if kind == "match":
+            (field, spec), = body.items()
+            text, boost = _field_query(spec)
+            if field in KEYWORD_FIELDS:
+                # Keyword fields match the whole value (constant score)
+                return boost if doc in self.exact[field].get(str(text), ()) else None
+            min_match = spec.get("minimum_should_match") if isinstance(spec, dict) else None
+            return self._bm25_terms(field, tokenize(text), doc, boost, min_match)
+
+        if kind == "match_phrase":
+            (field, spec), = body.items()
+            text, boost = _field_query(spec)
+            return self._bm25_phrase(field, tokenize(text), doc, boost)
+
+        if kind == "bool":
+            return self._score_bool(body, doc)
+
+        if kind == "function_score":
+            return self._score_function(body, doc)
+
+        raise ValueError(f"Unsupported query type for memory recall: {kind}")
+
+    def _bm25_idf(self, df: int) -> float:
+        n = len(self.ids)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _idf(self, field, term):
+        idf = self.idf[field].get(term)
+        return self._bm25_idf(0) if idf is None else idf
+
+    def _tf_norm(self, field, doc, freq):
+        dl = self.field_lengths[field][doc]
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * dl / self.avg_lengths[field])
+        return freq / (freq + norm)
+
+    def _bm25_terms(self, field, tokens, doc, boost, min_match=None):
+        if field not in self.postings:
+            return None
+        score = 0.0
+        matched = 0
+        for token in tokens:
+            positions = self.postings[field].get(token, {}).get(doc)
+            if positions:
+                matched += 1
+                score += self._idf(field, token) * self._tf_norm(field, doc, len(positions))
+        if not matched or matched < required_terms(min_match, len(tokens)):
+            return None
+        return boost * score
+
+    def _bm25_phrase(self, field, tokens, doc, boost):
+        if field not in self.postings or not tokens:
+            return None
+        postings = [self.postings[field].get(t, {}).get(doc) for t in tokens]
+        if not all(postings):
+            return None
+        following = [set(p) for p in postings[1:]]
+        freq = sum(
+            1
+            for start in postings[0]
+            if all(start + i + 1 in pos for i, pos in enumerate(following))
+        )
+        if not freq:
+            return None
+        idf = sum(self._idf(field, t) for t in tokens)
+        return boost * idf * self._tf_norm(field, doc, freq)
+
+    def _score_bool(self, body, doc):
+        score = 0.0
+        for clause in body.get("must", []):
+            s = self._score(clause, doc)
+            if s is None:
+                return None
+            score += s
+        for clause in body.get("filter", []):
+            if self._score(clause, doc) is None:
+                return None
+        for clause in body.get("must_not", []):
+            if self._score(clause, doc) is not None:
+                return None
+
+        matched_should = 0
+        for clause in body.get("should", []):
+            s = self._score(clause, doc)
+            if s is not None:
+                matched_should += 1
+                score += s
+        if matched_should < self._min_should_match(body):
+            return None
+        return score * float(body.get("boost", 1.0))
+
+    def _score_function(self, body, doc):
+        query_score = self._score(body.get("query") or {"match_all": {}}, doc)
+        if query_score is None:
+            return None
+
+        source = self.sources[doc]
+        values = []
+        for fn in body.get("functions", []):
+            weight = float(fn.get("weight", 1.0))
+            if "script_score" in fn:
+                script = fn["script_score"]["script"]
+                if script.get("source") != REL_SATURATION_SCRIPT:
+                    raise ValueError("Unsupported script for memory recall")
+                pivot = script["params"]["pivot"]
+                value = query_score / (query_score + pivot)
+            elif "gauss" in fn:
+                (field, spec), = fn["gauss"].items()
+                location = source.get(field)
+                if not location:
+                    value = 1.0  # ES treats a missing field as no decay
+                else:
+                    origin = spec["origin"]
+                    dist = haversine_km(origin["lat"], origin["lon"], location["lat"], location["lon"])
+                    dist = max(0.0, dist - _parse_distance_km(spec.get("offset", "0km")))
+                    scale = _parse_distance_km(spec["scale"])
+                    decay = float(spec.get("decay", 0.5))
+                    sigma2 = -(scale**2) / (2 * math.log(decay))
+                    value = math.exp(-(dist**2) / (2 * sigma2))
+            elif "field_value_factor" in fn:
+                spec = fn["field_value_factor"]
+                raw = source.get(spec["field"])
+                raw = spec.get("missing", 0) if raw is None else raw
+                raw *= float(spec.get("factor", 1.0))
+                modifier = spec.get("modifier", "none")
+                if modifier == "ln1p":
+                    value = math.log1p(raw)
+                elif modifier == "log1p":
+                    value = math.log10(1 + raw)
+                elif modifier == "none":
+                    value = raw
+                else:
+                    raise ValueError(f"Unsupported modifier for memory recall: {modifier}")
+            else:
+                raise ValueError(f"Unsupported function for memory recall: {fn}")
+            values.append(weight * value)
+
+        if not values:
+            combined = 1.0
+        elif body.get("score_mode", "multiply") == "sum":
+            combined = sum(values)
+        else:
+            combined = math.prod(values)
+
+        boost_mode = body.get("boost_mode", "multiply")
+        if boost_mode == "replace":
+            return combined
+        if boost_mode == "sum":
+            return query_score + combined
+        return query_score * combined
+
+
+memory_engine = MemoryRecallEngine()
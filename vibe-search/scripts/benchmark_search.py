@@ -0,0 +1,436 @@
+"""End-to-end /search load test with local stubs.
+
+Drives the FastAPI app in-process with a concurrent query mix, backed by
+the in-memory recall engine (a synthetic corpus, an NDJSON snapshot or a
+real ES with --es) and a fake LLM server with jittered latency. Reports
+p50/p95/p99 per pipeline stage (from each response's Server-Timing
+header) plus overall QPS and writes the results as
+JSON so runs can be compared across commits.
+
+    python scripts/benchmark_search.py --requests 500 --concurrency 16
+    python scripts/benchmark_search.py --compare benchmarks/<previous>.json
+
+Any other setting (NLP_MODE, RECALL_MODE, NLP_CACHE_SIZE=0, ...) can be
+overridden through the environment as usual.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+# Add the project root directory to the python path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+
+CENTER = (31.2304, 121.4737)  # People's Square
+
+# (category, name stems) of the synthetic corpus
+SYNTHETIC_CATEGORIES = {
+    "cafe": ["星巴克", "Manner Coffee", "瑞幸咖啡", "Seesaw", "Costa"],
+    "restaurant": ["小杨生煎", "南翔馒头店", "外婆家", "鼎泰丰", "老吉士"],
+    "fast_food": ["麦当劳", "肯德基", "汉堡王"],
+    "bar": ["Bar Rouge", "精酿酒吧", "Speak Low"],
+    "bank": ["工商银行", "招商银行", "建设银行"],
+    "pharmacy": ["华氏大药房", "雷允上药房"],
+    "convenience": ["全家", "罗森", "7-Eleven"],
+    "park": ["人民公园", "复兴公园", "中山公园"],
+    "museum": ["上海博物馆", "当代艺术博物馆"],
+    "hotel": ["和平饭店", "锦江饭店", "全季酒店"],
+}
+
+# (query, weight): bare categories / names hit the fast path, the rest need the LLM
+DEFAULT_QUERY_MIX = [
+    ("咖啡", 4),
+    ("星巴克", 2),
+    ("附近的餐厅", 3),
+    ("药店", 1),
+    ("人民公园", 1),
+    ("适合办公的安静咖啡馆", 3),
+    ("周末带孩子去的博物馆", 2),
+    ("评分高的生煎包", 2),
+    ("深夜还开着的酒吧", 1),
+    ("cheap coffee near me", 1),
+]
+
+# Reported first, in pipeline order; any other Server-Timing entries follow
+STAGES = ("total", "nlp", "nlp_analyze", "nlp_rewrite", "nlp_joint", "recall", "recall_merge", "rank")
+
+
+# ------------------------------------------------------------------ corpus
+def synthetic_corpus(n: int, seed: int = 7, radius_deg: float = 0.08):
+    """(id, source) POIs scattered around the city centre."""
+    rng = random.Random(seed)
+    categories = list(SYNTHETIC_CATEGORIES)
+    docs = []
+    for i in range(n):
+        category = categories[i % len(categories)]
+        stem = rng.choice(SYNTHETIC_CATEGORIES[category])
+        name = f"{stem}({rng.choice(['人民广场', '南京西路', '新天地', '外滩', '静安寺'])}店)"
+        docs.append(
+            (
+                f"bench/{i}",
+                {
+                    "name": name,
+                    "location": {
+                        "lat": CENTER[0] + rng.uniform(-radius_deg, radius_deg),
+                        "lon": CENTER[1] + rng.uniform(-radius_deg, radius_deg),
+                    },
+                    "category": category,
+                    "amenity": category,
+                    "tags": {"amenity": category},
+                    "popularity": rng.randint(0, 100),
+                    "address": "上海市黄浦区",
+                    "keywords": [stem, category],
+                    "key_phrases": [stem],
+                    "key_info": f"{name} is a {category} in Shanghai.",
+                    "rewrites": [f"{stem} nearby", f"best {category}"],
+                },
+            )
+        )
+    return docs
+
+
+def write_corpus(docs, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        for doc_id, source in docs:
+            f.write(json.dumps({"_id": doc_id, "_source": source}, ensure_ascii=False) + "\n")
+
+
+def load_query_mix(path: str = None):
+    """[(query, weight)] from a `query<TAB>weight` file, or the default mix."""
+    if not path:
+        return DEFAULT_QUERY_MIX
+    mix = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip():
+                continue
+            query, _, weight = line.partition("\t")
+            mix.append((query, float(weight or 1)))
+    return mix
+
+
+# ------------------------------------------------------------------- stats
+def percentile(sorted_values: list, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(values_ms: list) -> dict:
+    values = sorted(values_ms)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": values[-1],
+    }
+
+
+def parse_server_timing(header: str) -> dict:
+    """{stage: ms} from a `name;dur=12.3, ...` Server-Timing header."""
+    stages = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if name and key == "dur":
+                stages[name] = float(value)
+    return stages
+
+
+# ---------------------------------------------------------------- fake LLM
+def start_fake_llm_server(port: int, ttft_ms: float, token_ms: float, jitter: float, seed: int):
+    """Run app/llm_server.py with a jittered FakeBackend on a background thread."""
+    import uvicorn
+    from app.nlp.backends.fake_backend import FakeBackend
+    from app.llm_server import app as llm_app, llm_client
+
+    class JitteredFakeBackend(FakeBackend):
+        """FakeBackend with log-normally distributed first-token / per-token latency."""
+
+        def __init__(self):
+            super().__init__(ttft_ms=ttft_ms, token_ms=token_ms)
+            self.rng = random.Random(seed)
+
+        def _sample(self, ms: float) -> float:
+            return ms * self.rng.lognormvariate(0.0, jitter) if jitter > 0 else ms
+
+        def stream_tokens(self, prompt, system_prompt, max_tokens, temperature):
+            text = self.respond(prompt, system_prompt)
+            step = self.CHARS_PER_TOKEN
+            chunks = [text[i : i + step] for i in range(0, len(text), step)][:max_tokens]
+            time.sleep(self._sample(self.ttft_ms) / 1000.0)
+            for i, chunk in enumerate(chunks):
+                if i:
+                    time.sleep(self._sample(self.token_ms) / 1000.0)
+                yield chunk
+
+    llm_client._backend = JitteredFakeBackend()
+    server = uvicorn.Server(
+        uvicorn.Config(llm_app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline or not thread.is_alive():
+            raise RuntimeError("Fake LLM server did not start")
+        time.sleep(0.05)
+    return server, thread
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ------------------------------------------------------------------ driver
+async def drive(app, mix, n_requests: int, concurrency: int, seed: int, radius_km: float):
+    """Send `n_requests` searches with `concurrency` in flight; returns per-request records."""
+    import httpx
+
+    rng = random.Random(seed)
+    queries = [q for q, _ in mix]
+    weights = [w for _, w in mix]
+    plan = [
+        (
+            rng.choices(queries, weights)[0],
+            CENTER[0] + rng.uniform(-0.03, 0.03),
+            CENTER[1] + rng.uniform(-0.03, 0.03),
+        )
+        for _ in range(n_requests)
+    ]
+    records = []
+    cursor = iter(plan)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", timeout=60.0
+    ) as client:
+
+        async def worker():
+            for query, lat, lon in cursor:
+                body = {"query": query, "lat": lat, "lon": lon, "radius_km": radius_km}
+                start = time.perf_counter()
+                try:
+                    resp = await client.post("/search", json=body)
+                    ok = resp.status_code == 200
+                    data = resp.json() if ok else {}
+                    stages = parse_server_timing(resp.headers.get("server-timing"))
+                except Exception:
+                    ok, data, stages = False, {}, {}
+                records.append(
+                    {
+                        "query": query,
+                        "ok": ok,
+                        "ms": (time.perf_counter() - start) * 1000.0,
+                        "results": len(data.get("results", [])),
+                        "degraded": bool(data.get("degraded")),
+                        "stages": stages,
+                    }
+                )
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return records
+
+
+async def run_benchmark(args) -> dict:
+    import app.main as main
+    from app.core.config import settings
+
+    async with main.app.router.lifespan_context(main.app):
+        mix = load_query_mix(args.queries)
+        if args.warmup:
+            await drive(main.app, mix, args.warmup, args.concurrency, args.seed + 1, args.radius_km)
+
+        start = time.perf_counter()
+        records = await drive(
+            main.app, mix, args.requests, args.concurrency, args.seed, args.radius_km
+        )
+        wall = time.perf_counter() - start
+
+    ok = [r for r in records if r["ok"]]
+    per_query = defaultdict(list)
+    per_stage = defaultdict(list)
+    for r in ok:
+        per_query[r["query"]].append(r["ms"])
+        for name, ms in r["stages"].items():
+            per_stage[name].append(ms)
+    stage_order = [s for s in STAGES if s in per_stage]
+    stage_order += sorted(set(per_stage) - set(STAGES))
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "recall_backend": "es" if args.es else "memory",
+            "corpus": args.snapshot or f"synthetic:{args.pois}",
+            "llm": args.llm_url or {
+                "ttft_ms": args.llm_ttft_ms,
+                "token_ms": args.llm_token_ms,
+                "jitter": args.llm_jitter,
+            },
+            "settings": {
+                name: getattr(settings, name)
+                for name in (
+                    "NLP_MODE",
+                    "RECALL_MODE",
+                    "RANK_MODE",
+                    "RANK_ENGINE",
+                    "SPECULATIVE_RECALL",
+                    "FAST_PATH_ENABLED",
+                    "SEARCH_LATENCY_BUDGET_MS",
+                    "RECALL_CACHE_SIZE",
+                    "RECALL_SCHEMA_VERSION",
+                )
+            },
+        },
+        "overall": {
+            "requests": len(records),
+            "errors": len(records) - len(ok),
+            "degraded": sum(r["degraded"] for r in ok),
+            "empty": sum(r["results"] == 0 for r in ok),
+            "wall_seconds": wall,
+            "qps": len(ok) / wall if wall > 0 else 0.0,
+            "latency_ms": summarize([r["ms"] for r in ok]),
+        },
+        # Server-Timing of each response (sub-queue stages: slowest per source)
+        "stages": {name: summarize(per_stage[name]) for name in stage_order},
+        "queries": {q: summarize(v) for q, v in sorted(per_query.items())},
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+# ------------------------------------------------------------------ report
+def print_report(result: dict, baseline: dict = None):
+    def row(name, stats, base=None):
+        if not stats.get("count"):
+            print(f"  {name:<26} -")
+            return
+        line = f"  {name:<26} n={stats['count']:<6}"
+        for key in ("p50", "p95", "p99"):
+            line += f" {key}={stats[key]:8.1f}ms"
+            if base and base.get("count"):
+                delta = (stats[key] - base[key]) / base[key] * 100 if base[key] else 0.0
+                line += f" ({delta:+5.1f}%)"
+        print(line)
+
+    overall = result["overall"]
+    print(
+        f"\ncommit {result['commit']}: {overall['requests']} requests, "
+        f"{overall['errors']} errors, {overall['degraded']} degraded, "
+        f"{overall['qps']:.1f} QPS"
+    )
+    if baseline:
+        base_qps = baseline["overall"]["qps"]
+        print(f"  vs {baseline['commit']}: {base_qps:.1f} QPS")
+    row("end-to-end", overall["latency_ms"], baseline and baseline["overall"]["latency_ms"])
+    for stage, stats in result["stages"].items():
+        row(stage, stats, baseline and baseline["stages"].get(stage))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="/search load test and latency benchmark")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=20, help="untimed requests first")
+    parser.add_argument("--queries", help="query mix file: query<TAB>weight per line")
+    parser.add_argument("--radius-km", type=float, default=3.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--pois", type=int, default=5000, help="synthetic corpus size")
+    parser.add_argument("--snapshot", help="NDJSON corpus instead of the synthetic one")
+    parser.add_argument("--es", action="store_true", help="recall from the real ES_INDEX")
+    parser.add_argument("--llm-url", help="real LLM service instead of the fake one")
+    parser.add_argument("--llm-ttft-ms", type=float, default=80.0)
+    parser.add_argument("--llm-token-ms", type=float, default=4.0)
+    parser.add_argument(
+        "--llm-jitter", type=float, default=0.4, help="log-normal sigma of fake LLM latency"
+    )
+    parser.add_argument("--out", help="result JSON (default benchmarks/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="previous result JSON to diff against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Stubs are selected through the environment, before the app reads its settings
+    tmpdir = tempfile.mkdtemp(prefix="bench-")
+    if not args.es:
+        snapshot = args.snapshot
+        if not snapshot:
+            snapshot = os.path.join(tmpdir, "corpus.ndjson")
+            write_corpus(synthetic_corpus(args.pois, args.seed), snapshot)
+        os.environ["RECALL_BACKEND"] = "memory"
+        os.environ["RECALL_MEMORY_SNAPSHOT"] = snapshot
+
+    server = None
+    if args.llm_url:
+        os.environ["LLM_API_URL"] = args.llm_url
+    else:
+        port = _free_port()
+        os.environ["LLM_API_URL"] = f"http://127.0.0.1:{port}/generate"
+        os.environ["LLM_UDS_PATH"] = ""
+        os.environ["LLM_BACKEND"] = "fake"
+        server, _ = start_fake_llm_server(
+            port, args.llm_ttft_ms, args.llm_token_ms, args.llm_jitter, args.seed
+        )
+
+    try:
+        result = asyncio.run(run_benchmark(args))
+    finally:
+        if server is not None:
+            server.should_exit = True
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    out = args.out or os.path.join(
+        ROOT, "benchmarks", f"{time.strftime('%Y%m%d-%H%M%S')}-{result['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f"\nSaved {out}")
+    return result
+
+
+if __name__ == "__main__":
+    main()
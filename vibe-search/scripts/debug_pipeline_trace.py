@@ -1,16 +1,34 @@
+"""Trace queries through the search pipeline.
+
+Sends each query to /search with `explain` set (in-process, app lifespan
+included) and prints the trace of that single execution: NLP output,
+every recall sub-queue with its query body, hits and timing, and the
+ranking factors of the results. Nothing is re-run on the side, so the ES
+load is that of one normal search.
+
+Usage:
+    python scripts/debug_pipeline_trace.py                  # default queries
+    python scripts/debug_pipeline_trace.py 田子坊 --profile  # + ES query profile
+"""
+
+import argparse
 import asyncio
 import json
 import os
 import sys
 
+import httpx
+
 # Add the project root directory to the python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from app.nlp.analyzer import analyzer
-from app.nlp.rewriter import rewriter
-from app.recall.es_client import es_client
 from app.core.config import settings
 
+DEFAULT_QUERIES = ["田子坊", "上海公园"]
+# People's Square
+DEFAULT_LAT = 31.2304
+DEFAULT_LON = 121.4737
+
 
 # Setup logging to file and console
 class Tee(object):
@@ -27,165 +45,111 @@ class Tee(object):
             f.flush()
 
 
-LOG_FILE = settings.TRACE_LOG_PATH
-os.makedirs(settings.LOG_DIR, exist_ok=True)
-f = open(LOG_FILE, "a")
-sys.stdout = Tee(sys.stdout, f)
+def _dumps(obj):
+    return json.dumps(obj, indent=2, ensure_ascii=False)
+
 
+def _fmt_dist(value):
+    return "N/A" if value is None else f"{value:.2f}km"
 
-async def trace_query(query: str, lat: float, lon: float):
-    # radius from settings
-    radius_km = settings.DEFAULT_RADIUS_KM
+
+def print_trace(query: str, data: dict):
+    trace = data.get("explain") or {}
     print(f"\n{'='*60}", flush=True)
     print(f"QUERY: {query}", flush=True)
     print(f"{'='*60}", flush=True)
 
     # 1. NLP Phase
     print("\n--- [Phase 1] NLP Module ---", flush=True)
-    # Sequential execution to avoid blocking the single-threaded LLM server
-    print("Running Analyzer...", flush=True)
-    intent = await analyzer.analyze(query)
-    print("Running Rewriter...", flush=True)
-    rewrites = await rewriter.rewrite(query)
-
-    print(
-        f"Intent Analysis:\n{json.dumps(intent, indent=2, ensure_ascii=False)}",
-        flush=True,
-    )
-    print(
-        f"Rewrites:\n{json.dumps(rewrites, indent=2, ensure_ascii=False)}", flush=True
-    )
+    print(f"Intent Analysis:\n{_dumps(data['intent'])}", flush=True)
+    print(f"Rewrites:\n{_dumps(data['rewrites'])}", flush=True)
+    if data.get("degraded"):
+        print("NLP degraded: recall also ran on the original query", flush=True)
 
     # 2. Recall Phase
-    print("\n--- [Phase 2] Recall Module (Parallel Queues) ---", flush=True)
-    # Using generic center of Shanghai if no specific lat/lon provided for the user,
-    # but for this test we simulate a user at People's Square (31.2304, 121.4737)
-    radius_km = 10.0
-
-    # A. Analysis Sub-Queues
-    print(f"\n[Sub-Queue A] Analysis Sub-Queues:", flush=True)
-
-    # A. Analysis Sub-Queues
-    print(f"\n[Sub-Queue A] Analysis Sub-Queues:", flush=True)
-
-    # A1. Key Phrases (Aggregated)
-    if intent.get("key_phrases"):
+    print("\n--- [Phase 2] Recall Module (Sub-Queues) ---", flush=True)
+    for sq in trace.get("sub_queues", []):
+        took = sq["es_took_ms"]
+        status = "cached" if sq["cached"] else ("FAILED" if sq["failed"] else "ES")
         print(
-            f"  > [A-1] Key Phrases (Aggregated): {intent['key_phrases']}", flush=True
-        )
-        results_ph = await es_client._search_sub_queue(
-            intent["key_phrases"],
-            "phrases_agg",
-            intent,
-            lat,
-            lon,
-            radius_km,
-            "analysis_phrases",
-        )
-        for j, c in enumerate(results_ph[:3]):
-            print(
-                f"    [{j+1}] ID: {c['id']} | {c['name']} (Score: {c['es_score']:.2f}, Dist: {c.get('distance_km', 'N/A'):.2f}km)",
-                flush=True,
-            )
-
-    # A2. Keywords (Aggregated)
-    if intent.get("keywords"):
-        print(f"  > [A-2] Keywords (Aggregated): {intent['keywords']}", flush=True)
-        results_kw = await es_client._search_sub_queue(
-            intent["keywords"],
-            "keywords_agg",
-            intent,
-            lat,
-            lon,
-            radius_km,
-            "analysis_keywords",
-        )
-        for j, c in enumerate(results_kw[:3]):
-            print(
-                f"    [{j+1}] ID: {c['id']} | {c['name']} (Score: {c['es_score']:.2f}, Dist: {c.get('distance_km', 'N/A'):.2f}km)",
-                flush=True,
-            )
-
-    # A3. Key Info
-    if intent.get("key_info"):
-        print(f"  > [A-3] Key Info: {intent['key_info']}", flush=True)
-        results_info = await es_client._search_sub_queue(
-            intent["key_info"],
-            "key_info",
-            intent,
-            lat,
-            lon,
-            radius_km,
-            "analysis_info",
+            f"  > [{sq['source']}] {sq['query_content']} "
+            f"({status}, {sq['elapsed_ms']:.1f}ms"
+            + (f", ES took {took}ms" if took is not None else "")
+            + ")",
+            flush=True,
         )
-        for j, c in enumerate(results_info[:3]):
+        print(f"    Query: {json.dumps(sq['query'], ensure_ascii=False)}", flush=True)
+        for j, h in enumerate(sq["hits"][:3]):
             print(
-                f"    [{j+1}] ID: {c['id']} | {c['name']} (Score: {c['es_score']:.2f}, Dist: {c.get('distance_km', 'N/A'):.2f}km)",
+                f"    [{j+1}] ID: {h['id']} | {h['name']} "
+                f"(Score: {h['es_score']:.2f}, Dist: {_fmt_dist(h['distance_km'])})",
                 flush=True,
             )
+        if sq.get("profile"):
+            print(f"    Profile:\n{_dumps(sq['profile'])}", flush=True)
+    for label in data.get("dropped_sub_queues", []):
+        print(f"  > [{label}] dropped at the recall deadline", flush=True)
+    print(f"\nMerged & Deduplicated Candidates: {trace.get('candidates', 0)}", flush=True)
 
-    # B. Rewriting Queues
-    print(f"\n[Sub-Queue B] Rewriting Queues:", flush=True)
-    for i, exp in enumerate(rewrites):
-        print(f"  > [B] Rewrite [{i+1}]: {exp}", flush=True)
-        results_rw = await es_client._search_sub_queue(
-            exp, "rewrite", intent, lat, lon, radius_km, "rewriting"
-        )
-        for j, c in enumerate(results_rw[:3]):
+    # 3. Ranking Phase
+    print("\n--- [Phase 3] Ranking Module ---", flush=True)
+    for i, r in enumerate(trace.get("ranking", [])):
+        print(f"#{i+1} ID: {r['id']} | {r['name']}", flush=True)
+        print(f"    Source: {r.get('recall_source')}", flush=True)
+        print(f"    Score: {r['final_score']:.4f} (ES: {r['es_score']:.2f})", flush=True)
+        for name, f in (r.get("factors") or {}).items():
             print(
-                f"    [{j+1}] ID: {c['id']} | {c['name']} (Score: {c['es_score']:.2f}, Dist: {c.get('distance_km', 'N/A'):.2f}km)",
+                f"      {name:<10} {f['score']:.4f} x {f['weight']:.2f} "
+                f"= {f['score'] * f['weight']:.4f}",
                 flush=True,
             )
 
-    # Merged Results (Simulating es_client.search logic or calling it)
-    print(f"\n[Merged & Deduplicated] Final Candidates:", flush=True)
-    candidates = await es_client.search(
-        original_query=query,
-        expansions=rewrites,
-        nlp_analysis=intent,
-        lat=lat,
-        lon=lon,
-        radius_km=radius_km,
-    )
-
-    print(f"Total Candidates: {len(candidates)}", flush=True)
-    for i, c in enumerate(candidates[:10]):  # Show top 10 candidates raw
-        print(
-            f"[{i+1}] ID: {c['id']} | {c['name']} (Score: {c['es_score']:.2f}, Dist: {c.get('distance_km', 'N/A'):.2f}km, Source: {c.get('recall_source')})",
-            flush=True,
-        )
-
-    # 3. Ranking Phase
-    print("\n--- [Phase 3] Ranking Module (Top 10) ---", flush=True)
-    ranked_results = ranker.rank(
-        candidates,
-        user_lat=lat,
-        user_lon=lon,
-        sort_preference=intent.get("sort_preference", "relevance"),
+    print("\n--- Timings (ms) ---", flush=True)
+    for name, ms in trace.get("timings_ms", {}).items():
+        print(f"  {name:<26} {ms:8.1f}", flush=True)
+
+
+async def trace_queries(args):
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://trace", timeout=120.0
+        ) as client:
+            for query in args.queries:
+                resp = await client.post(
+                    "/search",
+                    json={
+                        "query": query,
+                        "lat": args.lat,
+                        "lon": args.lon,
+                        "radius_km": args.radius_km,
+                        "explain": True,
+                        "profile": args.profile,
+                    },
+                )
+                resp.raise_for_status()
+                data = resp.json()
+                print_trace(query, data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trace /search executions")
+    parser.add_argument("queries", nargs="*", default=DEFAULT_QUERIES)
+    parser.add_argument("--lat", type=float, default=DEFAULT_LAT)
+    parser.add_argument("--lon", type=float, default=DEFAULT_LON)
+    parser.add_argument("--radius-km", type=float, default=10.0)
+    parser.add_argument(
+        "--profile", action="store_true", help="include the ES query profile"
     )
+    args = parser.parse_args()
 
-    for i, r in enumerate(ranked_results):
-        print(f"#{i+1} ID: {r['id']} | {r['name']}", flush=True)
-        print(f"    Source: {r.get('recall_source')}", flush=True)
-        print(f"    Category: {r.get('category')}", flush=True)
-        print(f"    Location: {r.get('location')}", flush=True)
-        print(
-            f"    Score: {r['final_score']:.4f} (ES: {r['es_score']:.2f}, Pop: {r['popularity']})",
-            flush=True,
-        )
-
-
-async def main():
-    # User at People's Square
-    user_lat = 31.2304
-    user_lon = 121.4737
-
-    # Test Case 1
-    await trace_query("田子坊", user_lat, user_lon)
-
-    # Test Case 2
-    await trace_query("上海公园", user_lat, user_lon)
+    os.makedirs(settings.LOG_DIR, exist_ok=True)
+    log = open(settings.TRACE_LOG_PATH, "a")
+    sys.stdout = Tee(sys.stdout, log)
+    asyncio.run(trace_queries(args))
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
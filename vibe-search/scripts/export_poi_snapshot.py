@@ -0,0 +1,27 @@
+import asyncio
+import os
+import sys
+
+# Add the project root directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from elasticsearch import AsyncElasticsearch
+from app.recall.memory_engine import MemoryRecallEngine
+from app.core.config import settings
+
+
+async def export_snapshot(path: str):
+    """Scroll the POI index into the NDJSON snapshot used by RECALL_BACKEND=memory."""
+    es = AsyncElasticsearch(settings.ES_HOST)
+    try:
+        engine = MemoryRecallEngine()
+        await engine.load_from_es(es, settings.ES_INDEX)
+        engine.write_ndjson(path)
+        print(f"Wrote {len(engine.ids)} POIs to {path}")
+    finally:
+        await es.close()
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else settings.RECALL_MEMORY_SNAPSHOT
+    asyncio.run(export_snapshot(target))
@@ -1,11 +1,22 @@
+import argparse
 import asyncio
+import concurrent.futures
+import hashlib
 import os
 import sys
 import random
 import json
 import logging
+import sqlite3
+import threading
+import time
 import osmium
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_streaming_bulk
+
+# Add the project root directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
 from app.nlp.remote_qwen import remote_llm
 from app.core.config import settings
 
@@ -15,47 +26,177 @@ INDEX_NAME = settings.ES_INDEX
 OSM_FILE = settings.OSM_DATA_PATH
 BATCH_SIZE = settings.INGEST_BATCH_SIZE
 LIMIT = settings.INGEST_LIMIT
+CACHE_PATH = settings.INGEST_CACHE_PATH
+ARTIFACT_PATH = settings.INGEST_ARTIFACT_PATH
+CHECKPOINT_PATH = settings.INGEST_CHECKPOINT_PATH
+
+LABELING_SYSTEM_PROMPT = "You are a data labeling expert. Output JSON ONLY."
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+POI_MAPPINGS_V1 = {
+    "properties": {
+        "name": {"type": "text", "analyzer": "standard"},
+        "location": {"type": "geo_point"},
+        "category": {"type": "keyword"},
+        "amenity": {"type": "keyword"},
+        "tags": {"type": "object", "enabled": False},
+        "popularity": {"type": "integer"},
+        # New Semantic Fields (AI Generated)
+        "address": {"type": "text", "analyzer": "standard"},
+        "keywords": {"type": "text", "analyzer": "standard"},
+        "key_phrases": {"type": "text", "analyzer": "standard"},
+        "key_info": {"type": "text", "analyzer": "standard"},
+        "rewrites": {"type": "text", "analyzer": "standard"},
+    }
+}
+
+# Category-like keyword: exact value plus a lowercased `.norm` for term hits
+_KEYWORD_NORM = {
+    "type": "keyword",
+    "copy_to": "search_text",
+    "fields": {"norm": {"type": "keyword", "normalizer": "lowercase_norm"}},
+}
+
+# v2: `search_text` combines the fields the rewrite / original sub-queues
+# used to match one by one, so each needs a single clause
+POI_MAPPINGS_V2 = {
+    "_meta": {"schema_version": 2},
+    "properties": {
+        "name": {"type": "text", "analyzer": "standard", "copy_to": "search_text"},
+        "location": {"type": "geo_point"},
+        "category": _KEYWORD_NORM,
+        "amenity": _KEYWORD_NORM,
+        "tags": {"type": "object", "enabled": False},
+        # Only read by ranking (field_value_factor): doc values, no index
+        "popularity": {"type": "integer", "index": False},
+        "address": {"type": "text", "analyzer": "standard", "copy_to": "search_text"},
+        "keywords": {"type": "text", "analyzer": "standard"},
+        "key_phrases": {"type": "text", "analyzer": "standard"},
+        "key_info": {"type": "text", "analyzer": "standard"},
+        "rewrites": {"type": "text", "analyzer": "standard", "copy_to": "search_text"},
+        "search_text": {"type": "text", "analyzer": "standard"},
+    },
+}
+
+POI_ANALYSIS_V2 = {
+    "normalizer": {
+        "lowercase_norm": {"type": "custom", "filter": ["lowercase"]}
+    }
+}
+
+
+def index_schema(version: int = settings.ES_SCHEMA_VERSION):
+    """(mappings, analysis settings) for an index schema version."""
+    if version >= 2:
+        return POI_MAPPINGS_V2, POI_ANALYSIS_V2
+    return POI_MAPPINGS_V1, {}
+
+
+# Applied while loading a fresh index, replaced by `serving_index_settings()`
+BULK_LOAD_SETTINGS = {
+    "refresh_interval": "-1",
+    "number_of_replicas": 0,
+    "translog": {"durability": "async"},
+}
+
+# Run against a new index before it takes traffic (loads segments, global
+# ordinals and the geo / text structures into the caches)
+WARMUP_QUERIES = [
+    {"query": {"match": {"name": "咖啡"}}, "size": 10},
+    {
+        "query": {
+            "bool": {
+                "must": [{"match": {"rewrites": "附近 餐厅"}}],
+                "filter": [
+                    {
+                        "geo_distance": {
+                            "distance": "5km",
+                            "location": {"lat": 31.2304, "lon": 121.4737},
+                        }
+                    }
+                ],
+            }
+        },
+        "size": 10,
+    },
+    {
+        "size": 0,
+        "aggs": {
+            "category": {"terms": {"field": "category", "size": 100}},
+            "amenity": {"terms": {"field": "amenity", "size": 100}},
+        },
+    },
+]
+
+# End-of-stream marker passed through the queues
+_DONE = object()
+
+# How long a worker waits for more POIs before labeling a partial batch
+LABEL_BATCH_LINGER_SECONDS = 0.05
+
+# How often a parser thread blocked on a full queue checks the pipeline is alive
+EMIT_POLL_SECONDS = 0.5
+
+
+class PipelineClosed(Exception):
+    """Raised in the parser thread once the pipeline stopped consuming."""
+
+
+async def _get_within(queue: asyncio.Queue, timeout: float):
+    """`queue.get()`, raising asyncio.TimeoutError after `timeout` seconds.
+
+    Not `wait_for`: before Python 3.12 it drops a cancellation that lands
+    as the item arrives, and the cancelled worker keeps running.
+    """
+    getter = asyncio.ensure_future(queue.get())
+    try:
+        done, _ = await asyncio.wait({getter}, timeout=timeout)
+    finally:
+        if not getter.done():
+            getter.cancel()
+    if not done:
+        raise asyncio.TimeoutError()
+    return getter.result()
+
+
+async def _run_all(*coros):
+    """Await the coroutines concurrently; the first failure cancels the rest.
+
+    Unlike a bare `gather`, a stage that fails does not leave its siblings
+    blocked on queues nobody reads any more.
+    """
+    tasks = [asyncio.create_task(c) for c in coros]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
 
 class POIHandler(osmium.SimpleHandler):
-    def __init__(self):
+    """Extracts named amenity / shop / tourism nodes and hands them to `emit`.
+
+    Runs on a parser thread; `emit` blocks while the pipeline queue is full.
+    """
+
+    def __init__(self, emit, limit: int = LIMIT):
         super(POIHandler, self).__init__()
-        self.buffer = []
+        self.emit = emit
+        self.limit = limit
         self.count = 0
-        self.es = Elasticsearch(ES_HOST)
-        self.create_index()
-
-    def create_index(self):
-        if not self.es.indices.exists(index=INDEX_NAME):
-            mappings = {
-                "properties": {
-                    "name": {"type": "text", "analyzer": "standard"},
-                    "location": {"type": "geo_point"},
-                    "category": {"type": "keyword"},
-                    "amenity": {"type": "keyword"},
-                    "tags": {"type": "object", "enabled": False},
-                    "popularity": {"type": "integer"},
-                    # New Semantic Fields (AI Generated)
-                    "address": {"type": "text", "analyzer": "standard"},
-                    "keywords": {"type": "text", "analyzer": "standard"},
-                    "key_phrases": {"type": "text", "analyzer": "standard"},
-                    "key_info": {"type": "text", "analyzer": "standard"},
-                    "rewrites": {"type": "text", "analyzer": "standard"},
-                }
-            }
-            self.es.indices.create(index=INDEX_NAME, mappings=mappings)
-            logger.info(f"Created index {INDEX_NAME}")
 
     def node(self, n):
-        if self.count >= LIMIT:
+        if self.count >= self.limit:
             return
         self.process_feature(n, "node")
 
     def process_feature(self, feature, feature_type):
-        if self.count >= LIMIT:
+        if self.count >= self.limit:
             return
 
         if (
@@ -88,12 +229,6 @@ class POIHandler(osmium.SimpleHandler):
                 addr_parts.append(feature.tags.get("addr:housenumber"))
             address = "".join(addr_parts) if addr_parts else "上海市"
 
-            # AI Metadata Generation (Synchronous wrapper for async call)
-            # In a real environment, we would use an async ingestion pipeline
-            llm_data = asyncio.run(
-                self.generate_ai_metadata(name, address, category, feature.tags)
-            )
-
             # Location
             try:
                 if feature_type == "node":
@@ -108,9 +243,11 @@ class POIHandler(osmium.SimpleHandler):
             if "coffee" in name.lower() or "starbucks" in name.lower():
                 pop_score += 40
 
-            doc = {
-                "_index": INDEX_NAME,
-                "_source": {
+            self.count += 1
+            # osmium objects are only valid inside the callback: copy out
+            self.emit(
+                {
+                    "id": f"node/{feature.id}",
                     "name": name,
                     "location": {"lat": lat, "lon": lon},
                     "category": category,
@@ -118,23 +255,17 @@ class POIHandler(osmium.SimpleHandler):
                     "tags": {k: v for k, v in feature.tags},
                     "popularity": min(100, pop_score),
                     "address": address,
-                    # AI Fields
-                    "keywords": llm_data.get("keywords", []),
-                    "key_phrases": llm_data.get("key_phrases", []),
-                    "key_info": llm_data.get("key_info", ""),
-                    "rewrites": llm_data.get("rewrites", []),
-                },
-            }
-            self.buffer.append(doc)
-            self.count += 1
-            logger.info(f"[{self.count}/{LIMIT}] Processed AI metadata for: {name}")
+                }
+            )
+
+
+def _format_tags(tags: dict) -> str:
+    return ", ".join([f"{k}={v}" for k, v in sorted(tags.items())])
 
-            if len(self.buffer) >= BATCH_SIZE:
-                self.flush()
 
-    async def generate_ai_metadata(self, name, address, category, tags):
-        tags_str = ", ".join([f"{k}={v}" for k, v in tags])
-        prompt = f"""
+def build_prompt(name, address, category, tags: dict) -> str:
+    tags_str = _format_tags(tags)
+    return f"""
 Analyze this POI in Shanghai:
 Name: {name}
 Category: {category}
@@ -147,28 +278,784 @@ Return ONLY a JSON object (no markdown, no explanation) with these fields:
 "key_info": "a concise one-sentence description",
 "rewrites": [3 search queries users might use to find this POI]
 """
-        response = await remote_llm.generate(
-            prompt, system_prompt="You are a data labeling expert. Output JSON ONLY."
+
+
+def labeling_model() -> str:
+    """The LLM backend and the weights it loads (part of the cache key)."""
+    weights = {
+        "mlx": settings.LLM_MODEL_PATH,
+        "llama_cpp": settings.LLM_GGUF_PATH,
+    }.get(settings.LLM_BACKEND, "")
+    return f"{settings.LLM_BACKEND}:{weights}"
+
+
+def enrichment_key(name, address, category, tags: dict) -> str:
+    """Content address of a labeling call: the exact prompts and the model."""
+    payload = json.dumps(
+        [
+            labeling_model(),
+            LABELING_SYSTEM_PROMPT,
+            build_prompt(name, address, category, tags),
+        ],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def generate_ai_metadata(name, address, category, tags: dict):
+    prompt = build_prompt(name, address, category, tags)
+    response = await remote_llm.generate_json(
+        prompt,
+        system_prompt=LABELING_SYSTEM_PROMPT,
+        opener="{",
+    )
+    labeling_stats.record(prompt, response, 1)
+    try:
+        # Simple JSON extraction in case there is some junk
+        start = response.find("{")
+        end = response.rfind("}") + 1
+        if start != -1 and end != -1:
+            return json.loads(response[start:end])
+    except Exception:
+        logger.error(f"Failed to parse LLM response for {name}: {response}")
+
+    return {}
+
+
+def build_batch_prompt(pois: list) -> str:
+    """One prompt labeling several (name, address, category, tags) POIs."""
+    blocks = "\n".join(
+        f"""[{i}]
+Name: {name}
+Category: {category}
+Address: {address}
+Tags: {_format_tags(tags)}"""
+        for i, (name, address, category, tags) in enumerate(pois)
+    )
+    return f"""
+Analyze these {len(pois)} POIs in Shanghai:
+{blocks}
+
+Return ONLY a JSON array (no markdown, no explanation) with one object per POI.
+Each object has these fields:
+"index": the POI number in brackets,
+"keywords": [3-5 specific words],
+"key_phrases": [2-3 meaningful phrases],
+"key_info": "a concise one-sentence description",
+"rewrites": [3 search queries users might use to find this POI]
+"""
+
+
+def validate_labels(data):
+    """The labels in `data` if they have the expected shape, else None."""
+    if not isinstance(data, dict):
+        return None
+    labels = {}
+    for field in ("keywords", "key_phrases", "rewrites"):
+        value = data.get(field, [])
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            return None
+        labels[field] = value
+    key_info = data.get("key_info", "")
+    if not isinstance(key_info, str):
+        return None
+    labels["key_info"] = key_info
+    if not any(labels.values()):
+        return None
+    return labels
+
+
+def parse_batch_labels(response: str, n: int) -> list:
+    """Validated labels per POI index; None where the element is missing or bad."""
+    labels = [None] * n
+    start = response.find("[")
+    end = response.rfind("]") + 1
+    if start == -1 or end == 0:
+        return labels
+    try:
+        elements = json.loads(response[start:end])
+    except json.JSONDecodeError:
+        return labels
+    if not isinstance(elements, list):
+        return labels
+
+    for element in elements:
+        if not isinstance(element, dict):
+            continue
+        index = element.get("index")
+        if isinstance(index, int) and 0 <= index < n and labels[index] is None:
+            labels[index] = validate_labels(element)
+    return labels
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: one per CJK character, one per 4 other characters."""
+    cjk = sum(1 for ch in text if "\u4e00" <= ch <= "\u9fff")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class LabelingStats:
+    """Estimated LLM token usage of the labeling calls."""
+
+    def __init__(self):
+        self.calls = 0
+        self.pois = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def record(self, prompt: str, response: str, pois: int):
+        self.calls += 1
+        self.pois += pois
+        self.prompt_tokens += estimate_tokens(LABELING_SYSTEM_PROMPT + prompt)
+        self.completion_tokens += estimate_tokens(response or "")
+
+
+labeling_stats = LabelingStats()
+
+
+def plan_label_batches(pois: list, max_k: int) -> list:
+    """Group POI positions into batches of at most `max_k` that fit the context.
+
+    Each batch's prompt plus INGEST_LABEL_TOKENS_PER_POI of output per POI
+    must stay within LLM_CONTEXT_SIZE.
+    """
+    budget = settings.LLM_CONTEXT_SIZE
+    per_poi_output = settings.INGEST_LABEL_TOKENS_PER_POI
+    overhead = estimate_tokens(LABELING_SYSTEM_PROMPT + build_batch_prompt([]))
+
+    batches = []
+    batch = []
+    used = overhead
+    for i, poi in enumerate(pois):
+        cost = estimate_tokens(build_batch_prompt([poi])) - overhead + per_poi_output
+        if batch and (len(batch) >= max_k or used + cost > budget):
+            batches.append(batch)
+            batch = []
+            used = overhead
+        batch.append(i)
+        used += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+async def generate_ai_metadata_batch(pois: list) -> list:
+    """Label (name, address, category, tags) POIs in one call; None per failure."""
+    prompt = build_batch_prompt(pois)
+    response = await remote_llm.generate_json(
+        prompt,
+        system_prompt=LABELING_SYSTEM_PROMPT,
+        opener="[",
+        max_tokens=len(pois) * settings.INGEST_LABEL_TOKENS_PER_POI,
+    )
+    labeling_stats.record(prompt, response, len(pois))
+    return parse_batch_labels(response, len(pois))
+
+
+class EnrichmentCache:
+    """On-disk LLM labeling results keyed by `enrichment_key` (sqlite)."""
+
+    def __init__(self, path: str = CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS enrichment "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        row = self.conn.execute(
+            "SELECT value FROM enrichment WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value: dict):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO enrichment (key, value, created_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), time.time()),
         )
+
+    def close(self):
+        self.conn.close()
+
+
+def read_artifact(path: str) -> list:
+    """Bulk actions from an enriched-POI artifact; a torn last line is skipped."""
+    docs = []
+    if not os.path.exists(path):
+        return docs
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning("Skipping incomplete artifact line")
+                continue
+            docs.append({"_index": INDEX_NAME, **record})
+    return docs
+
+
+def _truncate_torn_line(path: str):
+    """Drop a partially written last line so appended records start cleanly."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+class IngestPipeline:
+    """OSM parsing -> N concurrent LLM enrichment workers -> streaming bulk indexer.
+
+    Stages are connected by bounded queues, so a slow stage throttles the
+    ones before it. Everything but the osmium parser (on its own thread)
+    runs on one event loop with one pooled LLM session.
+    """
+
+    def __init__(
+        self,
+        es,
+        index: str = INDEX_NAME,
+        concurrency: int = settings.INGEST_CONCURRENCY,
+        queue_size: int = settings.INGEST_QUEUE_SIZE,
+        enrich=generate_ai_metadata,
+        enrich_batch=None,
+        batch_size: int = settings.INGEST_LABEL_BATCH_SIZE,
+        cache: EnrichmentCache = None,
+        artifact_path: str = None,
+        checkpoint_path: str = None,
+    ):
+        self.es = es
+        self.index = index
+        self.concurrency = max(1, concurrency)
+        self.queue_size = queue_size
+        self.enrich = enrich
+        # Labels several POIs per LLM call; None labels one POI per call
+        self.enrich_batch = enrich_batch
+        self.batch_size = max(1, batch_size)
+        self.cache = cache
+        self.artifact_path = artifact_path
+        self.checkpoint_path = checkpoint_path
+        self._artifact = None
+        self.label_fallbacks = 0
+        self.parsed = 0
+        self.enriched = 0
+        self.indexed = 0
+        self.failed = 0
+
+    async def run(self, produce, preloaded=(), resume: bool = False):
+        """Ingest the POIs that `produce(emit)` passes to `emit` (blocking, threaded).
+
+        `preloaded` bulk actions (e.g. from the artifact) are indexed without
+        enrichment, and POIs with their ids are skipped. Enriched documents
+        are appended to the artifact, which is truncated unless `resume`.
+        """
+        loop = asyncio.get_running_loop()
+        self.skip_ids = {doc.get("_id") for doc in preloaded if doc.get("_id")}
+        if self.artifact_path:
+            os.makedirs(os.path.dirname(self.artifact_path) or ".", exist_ok=True)
+            if resume:
+                _truncate_torn_line(self.artifact_path)
+            self._artifact = open(
+                self.artifact_path, "a" if resume else "w", encoding="utf-8"
+            )
+        self.raw_queue = asyncio.Queue(maxsize=self.queue_size)
+        self.doc_queue = asyncio.Queue(maxsize=self.queue_size)
+        self.started = time.perf_counter()
+        closed = threading.Event()
+
+        def emit(poi):
+            if poi.get("id") in self.skip_ids:
+                return
+            # Parser thread: wait for room in the queue (backpressure), but
+            # stop parsing once the pipeline is closed (a stage failed)
+            put = asyncio.run_coroutine_threadsafe(self.raw_queue.put(poi), loop)
+            while True:
+                try:
+                    return put.result(timeout=EMIT_POLL_SECONDS)
+                except concurrent.futures.TimeoutError:
+                    if closed.is_set():
+                        put.cancel()
+                        raise PipelineClosed()
+
+        async def parse():
+            await asyncio.to_thread(produce, emit)
+            for _ in range(self.concurrency):
+                await self.raw_queue.put(_DONE)
+
+        async def feed_preloaded():
+            for doc in preloaded:
+                await self.doc_queue.put({**doc, "_index": self.index})
+
+        async def enrich_all():
+            await _run_all(
+                feed_preloaded(),
+                *(self._enrich_worker() for _ in range(self.concurrency)),
+            )
+            await self.doc_queue.put(_DONE)
+
+        await remote_llm.start()
+        reporter = asyncio.create_task(self._report_progress())
+        completed = False
+        try:
+            await _run_all(parse(), enrich_all(), self._index_all())
+            completed = True
+        finally:
+            closed.set()
+            reporter.cancel()
+            await remote_llm.close()
+            if self._artifact is not None:
+                self._artifact.close()
+                self._artifact = None
+            self._write_checkpoint(completed)
+        self._log_progress()
+        self._log_labeling_summary()
+
+    async def _enrich_worker(self):
+        done = False
+        while not done:
+            # Fill one labeling batch, waiting briefly for the parser
+            pois = []
+            while len(pois) < self.batch_size:
+                if pois:
+                    try:
+                        poi = await _get_within(
+                            self.raw_queue, LABEL_BATCH_LINGER_SECONDS
+                        )
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    poi = await self.raw_queue.get()
+                if poi is _DONE:
+                    done = True
+                    break
+                pois.append(poi)
+            if not pois:
+                continue
+
+            self.parsed += len(pois)
+            pois = [dict(poi) for poi in pois]
+            poi_ids = [poi.pop("id", None) for poi in pois]
+            labels = await self._label(pois)
+            for poi, poi_id, llm_data in zip(pois, poi_ids, labels):
+                await self._emit_doc(poi, poi_id, llm_data)
+
+    async def _emit_doc(self, poi, poi_id, llm_data):
+        doc = {
+            "_index": self.index,
+            "_source": {
+                **poi,
+                # AI Fields
+                "keywords": llm_data.get("keywords", []),
+                "key_phrases": llm_data.get("key_phrases", []),
+                "key_info": llm_data.get("key_info", ""),
+                "rewrites": llm_data.get("rewrites", []),
+            },
+        }
+        if poi_id is not None:
+            # Stable ids make re-runs and resumes overwrite, not duplicate
+            doc["_id"] = poi_id
+        if self._artifact is not None:
+            record = {"_id": poi_id, "_source": doc["_source"]}
+            self._artifact.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._artifact.flush()
+
+        await self.doc_queue.put(doc)
+        self.enriched += 1
+
+    async def _label(self, pois) -> list:
+        """LLM labels for each POI: cache, then batched prompts, then single prompts."""
+        args = [(p["name"], p["address"], p["category"], p["tags"]) for p in pois]
+        keys = [None] * len(pois)
+        labels = [None] * len(pois)
+        if self.cache is not None:
+            for i, a in enumerate(args):
+                keys[i] = enrichment_key(*a)
+                labels[i] = self.cache.get(keys[i])
+
+        misses = [i for i, label in enumerate(labels) if label is None]
+        batched = set()
+        if self.enrich_batch is not None and len(misses) > 1:
+            miss_args = [args[i] for i in misses]
+            for positions in plan_label_batches(miss_args, self.batch_size):
+                if len(positions) == 1:
+                    continue
+                batch = [misses[p] for p in positions]
+                batched.update(batch)
+                try:
+                    results = await self.enrich_batch([args[i] for i in batch])
+                except Exception as e:
+                    logger.error(f"Batched AI metadata failed for {len(batch)} POIs: {e}")
+                    results = [None] * len(batch)
+                for i, result in zip(batch, results):
+                    labels[i] = result
+
+        for i in misses:
+            if labels[i] is None:
+                if i in batched:
+                    # Only the POIs whose array element was missing or invalid
+                    self.label_fallbacks += 1
+                labels[i] = await self._label_single(args[i])
+            # Failed / unparsable labels are retried on the next run
+            if keys[i] is not None and labels[i]:
+                self.cache.put(keys[i], labels[i])
+        return labels
+
+    async def _label_single(self, args) -> dict:
         try:
-            # Simple JSON extraction in case there is some junk
-            start = response.find("{")
-            end = response.rfind("}") + 1
-            if start != -1 and end != -1:
-                return json.loads(response[start:end])
-        except Exception:
-            logger.error(f"Failed to parse LLM response for {name}: {response}")
+            return await self.enrich(*args) or {}
+        except Exception as e:
+            logger.error(f"AI metadata failed for {args[0]}: {e}")
+            return {}
+
+    async def _actions(self):
+        while True:
+            doc = await self.doc_queue.get()
+            if doc is _DONE:
+                return
+            yield doc
+
+    async def _index_all(self):
+        async for ok, item in async_streaming_bulk(
+            self.es,
+            self._actions(),
+            chunk_size=BATCH_SIZE,
+            max_chunk_bytes=settings.INGEST_BULK_MAX_BYTES,
+            max_retries=settings.INGEST_BULK_MAX_RETRIES,
+            initial_backoff=1,
+            raise_on_error=False,
+            raise_on_exception=False,
+        ):
+            if ok:
+                self.indexed += 1
+            else:
+                self.failed += 1
+                logger.error(f"Failed to index document: {item}")
+
+    def _write_checkpoint(self, completed: bool):
+        if not self.checkpoint_path:
+            return
+        state = {
+            "completed": completed,
+            "index": self.index,
+            "artifact": self.artifact_path,
+            "parsed": self.parsed,
+            "enriched": self.enriched,
+            "indexed": self.indexed,
+            "failed": self.failed,
+            "updated_at": time.time(),
+        }
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    async def _report_progress(self):
+        while True:
+            await asyncio.sleep(settings.INGEST_PROGRESS_SECONDS)
+            self._log_progress()
+            self._write_checkpoint(False)
+
+    def _log_labeling_summary(self):
+        elapsed = max(1e-9, time.perf_counter() - self.started)
+        stats = labeling_stats
+        summary = (
+            f"Labeling: {self.enriched} POIs in {elapsed:.1f}s "
+            f"({self.enriched / elapsed:.2f} POI/s), batch size {self.batch_size}, "
+            f"{self.label_fallbacks} single-POI fallbacks"
+        )
+        if stats.pois:
+            summary += (
+                f" | {stats.calls} LLM calls, ~{stats.prompt_tokens / stats.pois:.0f} prompt "
+                f"+ ~{stats.completion_tokens / stats.pois:.0f} completion tokens/POI"
+            )
+        logger.info(summary)
+
+    def _log_progress(self):
+        elapsed = max(1e-9, time.perf_counter() - self.started)
+        cache = ""
+        if self.cache is not None:
+            cache = f" | cache hits={self.cache.hits} misses={self.cache.misses}"
+        logger.info(
+            f"parsed={self.parsed} enriched={self.enriched} indexed={self.indexed} "
+            f"failed={self.failed}{cache} | {self.enriched / elapsed:.1f} POI/s enriched, "
+            f"{self.indexed / elapsed:.1f} docs/s indexed | "
+            f"queues raw={self.raw_queue.qsize()} docs={self.doc_queue.qsize()}"
+        )
+
 
+def serving_index_settings() -> dict:
+    return {
+        "refresh_interval": settings.ES_REFRESH_INTERVAL,
+        "number_of_replicas": settings.ES_REPLICAS,
+        "translog": {"durability": "request"},
+    }
+
+
+class BlueGreenIndex:
+    """Versioned indices behind the `alias` that search reads (ES_INDEX).
+
+    Each ingestion loads a new `<alias>_<timestamp>` index with bulk-load
+    settings while the current one keeps serving; `publish()` makes it
+    search-ready and swaps the alias in one atomic `update_aliases` call.
+    """
+
+    def __init__(
+        self, es, alias: str = INDEX_NAME, schema_version: int = settings.ES_SCHEMA_VERSION
+    ):
+        self.es = es
+        self.alias = alias
+        self.schema_version = schema_version
+
+    def new_index_name(self) -> str:
+        return f"{self.alias}_{time.strftime('%Y%m%d%H%M%S')}"
+
+    async def create(self, index: str):
+        if await self.es.indices.exists(index=index):
+            logger.info(f"Continuing into existing index {index}")
+            return
+        mappings, analysis = index_schema(self.schema_version)
+        index_settings = {"index": BULK_LOAD_SETTINGS}
+        if analysis:
+            index_settings["analysis"] = analysis
+        await self.es.indices.create(index=index, mappings=mappings, settings=index_settings)
+        logger.info(
+            f"Created index {index} (schema v{self.schema_version}) with bulk-load settings"
+        )
+
+    async def publish_blocker(self, index: str, indexed: int, failed: int):
+        """Why `index` must not replace what the alias serves, or None.
+
+        Refused when more than INGEST_MAX_FAILED_RATIO of the bulk items
+        failed, or when the new index holds fewer than INGEST_MIN_DOC_RATIO
+        of the docs behind the alias (publishing also prunes old versions).
+        """
+        if indexed == 0:
+            return "nothing indexed"
+        if failed / (indexed + failed) > settings.INGEST_MAX_FAILED_RATIO:
+            return f"{failed} of {indexed + failed} documents failed to index"
+
+        if not (
+            await self.es.indices.exists_alias(name=self.alias)
+            or await self.es.indices.exists(index=self.alias)
+        ):
+            return None
+        current = (await self.es.count(index=self.alias))["count"]
+        # The bulk-load settings disable refresh: make the new docs countable
+        await self.es.indices.refresh(index=index)
+        new = (await self.es.count(index=index))["count"]
+        if new < current * settings.INGEST_MIN_DOC_RATIO:
+            return f"{new} documents vs {current} behind alias {self.alias}"
+        return None
+
+    async def publish(self, index: str):
+        """Restore serving settings, force-merge, warm up and point the alias at `index`."""
+        await self.es.indices.put_settings(
+            index=index, settings={"index": serving_index_settings()}
+        )
+        await self.es.indices.refresh(index=index)
+        await self.es.indices.forcemerge(
+            index=index, max_num_segments=settings.INGEST_FORCEMERGE_SEGMENTS
+        )
+        await self.es.cluster.health(
+            index=index, wait_for_status="yellow", timeout="60s"
+        )
+        for body in WARMUP_QUERIES:
+            await self.es.search(index=index, **body)
+
+        await self.mark_published(index)
+        previous = await self.swap_alias(index)
+        logger.info(f"Alias {self.alias} -> {index} (was {previous or 'unset'})")
+        await self.prune(index, previous)
+
+    async def mark_published(self, index: str):
+        """Record in `_meta.published_at` that `index` has served the alias."""
+        mapping = await self.es.indices.get_mapping(index=index)
+        meta = mapping[index]["mappings"].get("_meta") or {}
+        # `_meta` is replaced as a whole: keep schema_version
+        await self.es.indices.put_mapping(
+            index=index, meta={**meta, "published_at": int(time.time())}
+        )
+
+    async def swap_alias(self, index: str) -> list:
+        """Atomically move the alias to `index`; returns the indices it left."""
+        actions = []
+        previous = await self.alias_targets()
+        if previous:
+            actions += [
+                {"remove": {"index": old, "alias": self.alias}}
+                for old in previous
+                if old != index
+            ]
+        elif await self.es.indices.exists(index=self.alias):
+            # Legacy concrete index with the alias's name: it must go in the
+            # same call, an alias cannot be added while it exists
+            actions.append({"remove_index": {"index": self.alias}})
+        actions.append({"add": {"index": index, "alias": self.alias}})
+
+        await self.es.indices.update_aliases(actions=actions)
+        return [old for old in previous if old != index]
+
+    async def alias_targets(self) -> list:
+        """Indices the alias points to now (empty if it is not an alias)."""
+        if not await self.es.indices.exists_alias(name=self.alias):
+            return []
+        return sorted((await self.es.indices.get_alias(name=self.alias)).keys())
+
+    async def prune(self, published: str, previous=()):
+        """Delete published versions beyond the INGEST_KEEP_OLD_INDICES newest.
+
+        Only indices that served the alias (`_meta.published_at`, or the
+        `previous` targets it just left) are rollback versions and count
+        toward the quota. Builds that were never published (blocked by
+        `publish_blocker`, abandoned) are reported, not deleted: one may be
+        the index an interrupted run resumes into.
+        """
+        versions = await self.es.indices.get(index=f"{self.alias}_*")
+        rollback = []
+        for name, info in sorted(versions.items(), reverse=True):
+            if name == published:
+                continue
+            meta = (info.get("mappings") or {}).get("_meta") or {}
+            if name in previous or "published_at" in meta:
+                rollback.append(name)
+            else:
+                logger.warning(
+                    f"Unpublished build {name} left in place; delete it if unused"
+                )
+        for index in rollback[settings.INGEST_KEEP_OLD_INDICES :]:
+            await self.es.indices.delete(index=index)
+            logger.info(f"Deleted old index {index}")
+
+
+def _read_checkpoint(path: str) -> dict:
+    if not os.path.exists(path):
         return {}
+    with open(path) as f:
+        return json.load(f)
 
-    def flush(self):
-        if self.buffer:
-            success, _ = helpers.bulk(self.es, self.buffer)
-            logger.info(f"Indexed {success} documents")
-            self.buffer = []
+
+def _checkpoint_incomplete(path: str) -> bool:
+    state = _read_checkpoint(path)
+    return bool(state) and not state.get("completed", False)
+
+
+async def ingest(
+    osm_file: str = OSM_FILE,
+    resume: bool = False,
+    from_artifact: bool = False,
+    use_cache: bool = True,
+    batch_size: int = settings.INGEST_LABEL_BATCH_SIZE,
+    force_publish: bool = False,
+):
+    es = AsyncElasticsearch(ES_HOST)
+    cache = EnrichmentCache(CACHE_PATH) if use_cache else None
+    try:
+        target = BlueGreenIndex(es, INDEX_NAME)
+        index = target.new_index_name()
+        if resume:
+            # Keep loading the unpublished index of the interrupted run, never
+            # a finished build or the index serving the alias
+            state = _read_checkpoint(CHECKPOINT_PATH)
+            previous = state.get("index")
+            if state.get("completed") or previous in await target.alias_targets():
+                logger.error(
+                    f"Checkpoint index {previous} is complete or serving "
+                    f"{INDEX_NAME}; not resuming into it (run with --fresh)"
+                )
+                return
+            index = previous or index
+        await target.create(index)
+
+        pipeline = IngestPipeline(
+            es,
+            index=index,
+            enrich_batch=generate_ai_metadata_batch if batch_size > 1 else None,
+            batch_size=batch_size,
+            cache=cache,
+            artifact_path=ARTIFACT_PATH,
+            checkpoint_path=CHECKPOINT_PATH,
+        )
+
+        if from_artifact:
+            # Reload ES from the artifact only: no OSM parsing, no LLM
+            docs = read_artifact(ARTIFACT_PATH)
+            logger.info(f"Reloading {len(docs)} documents from {ARTIFACT_PATH}")
+            pipeline.artifact_path = None
+            pipeline.checkpoint_path = None
+            await pipeline.run(lambda emit: None, preloaded=docs)
+        else:
+            preloaded = []
+            if resume:
+                # Re-index what the interrupted run enriched (idempotent by _id)
+                preloaded = read_artifact(ARTIFACT_PATH)
+                logger.info(f"Resuming after {len(preloaded)} enriched POIs")
+            await pipeline.run(
+                lambda emit: POIHandler(emit).apply_file(osm_file),
+                preloaded=preloaded,
+                resume=resume,
+            )
+
+        reason = await target.publish_blocker(index, pipeline.indexed, pipeline.failed)
+        if reason and not force_publish:
+            logger.error(
+                f"Not publishing {index}: {reason}; alias {INDEX_NAME} left as is "
+                "(--force-publish to publish anyway)"
+            )
+            return
+        await target.publish(index)
+    finally:
+        if cache is not None:
+            cache.close()
+        await es.close()
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Shanghai OSM -> AI enrichment -> ES")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue an interrupted run from its artifact (default if the checkpoint is incomplete)",
+    )
+    parser.add_argument(
+        "--fresh", action="store_true", help="ignore an incomplete checkpoint"
+    )
+    parser.add_argument(
+        "--from-artifact",
+        action="store_true",
+        help="reload ES from the enriched artifact without the LLM",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="do not use the enrichment cache"
+    )
+    parser.add_argument(
+        "--label-batch-size",
+        type=int,
+        default=settings.INGEST_LABEL_BATCH_SIZE,
+        help="POIs labelled per LLM prompt (1 = one prompt per POI)",
+    )
+    parser.add_argument(
+        "--force-publish",
+        action="store_true",
+        help="swap the alias even if bulk items failed or the index shrank",
+    )
+    args = parser.parse_args()
+
+    if args.from_artifact:
+        logger.info("Reloading from artifact...")
+        asyncio.run(ingest(from_artifact=True, force_publish=args.force_publish))
+        logger.info("Reload complete.")
+        return
+
     if not os.path.exists(OSM_FILE):
         logger.error(f"File {OSM_FILE} not found. Please download it from Geofabrik.")
         logger.info(
@@ -176,10 +1063,18 @@ def main():
         )
         return
 
-    handler = POIHandler()
-    logger.info("Starting ingestion...")
-    handler.apply_file(OSM_FILE)
-    handler.flush()
+    resume = args.resume or (
+        not args.fresh and _checkpoint_incomplete(CHECKPOINT_PATH)
+    )
+    logger.info("Starting ingestion..." + (" (resuming)" if resume else ""))
+    asyncio.run(
+        ingest(
+            resume=resume,
+            use_cache=not args.no_cache,
+            batch_size=args.label_batch_size,
+            force_publish=args.force_publish,
+        )
+    )
     logger.info("Ingestion complete.")
 
 
@@ -71,8 +71,13 @@ start_llm() {
     if lsof -Pi :$LLM_PORT -sTCP:LISTEN -t >/dev/null ; then
         echo "LLM Service already running on port $LLM_PORT."
     else
-        echo "Starting LLM Model Service on $SERVICE_HOST:$LLM_PORT..."
-        nohup uv run uvicorn app.llm_server:app --host $SERVICE_HOST --port $LLM_PORT >> $LOG_DIR/$LLM_LOG_FILENAME 2>&1 &
+        if [ -n "$LLM_UDS_PATH" ]; then
+            echo "Starting LLM Model Service on unix:$LLM_UDS_PATH..."
+            nohup uv run uvicorn app.llm_server:app --uds $LLM_UDS_PATH >> $LOG_DIR/$LLM_LOG_FILENAME 2>&1 &
+        else
+            echo "Starting LLM Model Service on $SERVICE_HOST:$LLM_PORT..."
+            nohup uv run uvicorn app.llm_server:app --host $SERVICE_HOST --port $LLM_PORT >> $LOG_DIR/$LLM_LOG_FILENAME 2>&1 &
+        fi
         echo "LLM Service started (PID: $!)."
     fi
 }
@@ -0,0 +1,102 @@
+import asyncio
+import pytest
+from app.nlp.batch_scheduler import MicroBatchScheduler, GenerateJob, apply_stop
+
+
+def _job(prompt, temperature=0.7, max_tokens=16, stop=None):
+    return GenerateJob(
+        prompt=prompt,
+        system_prompt="System",
+        max_tokens=max_tokens,
+        temperature=temperature,
+        stop=stop or [],
+    )
+
+
+def test_apply_stop():
+    assert apply_stop('{"a": 1}\nDONE trailing', ["DONE"]) == '{"a": 1}\n'
+    assert apply_stop("abc", []) == "abc"
+    # Earliest stop sequence wins
+    assert apply_stop("x END y STOP", ["STOP", "END"]) == "x "
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_batch():
+    batches = []
+
+    async def run_batch(jobs):
+        batches.append([(j.prompt, j.max_tokens) for j in jobs])
+        return [f"out:{j.prompt}" for j in jobs]
+
+    scheduler = MicroBatchScheduler(run_batch, window_ms=20, max_batch_size=8)
+    try:
+        results = await asyncio.gather(
+            *[scheduler.submit(_job(f"q{i}", max_tokens=8 + i)) for i in range(4)]
+        )
+    finally:
+        await scheduler.stop()
+
+    assert results == ["out:q0", "out:q1", "out:q2", "out:q3"]
+    assert len(batches) == 1
+    # Per-request max_tokens survive batching
+    assert [m for _, m in batches[0]] == [8, 9, 10, 11]
+
+
+@pytest.mark.asyncio
+async def test_batches_split_by_size_and_temperature():
+    batches = []
+
+    async def run_batch(jobs):
+        batches.append(len(jobs))
+        return ["done STOP junk" for _ in jobs]
+
+    scheduler = MicroBatchScheduler(run_batch, window_ms=20, max_batch_size=2)
+    try:
+        jobs = [_job("a"), _job("b"), _job("c", temperature=0.0, stop=["STOP"])]
+        results = await asyncio.gather(*[scheduler.submit(j) for j in jobs])
+    finally:
+        await scheduler.stop()
+
+    # [a, b] hit max_batch_size; c runs alone
+    assert sorted(batches) == [1, 2]
+    assert results[2] == "done "
+
+
+@pytest.mark.asyncio
+async def test_batch_failure_propagates_to_every_request():
+    async def run_batch(jobs):
+        raise RuntimeError("model crashed")
+
+    scheduler = MicroBatchScheduler(run_batch, window_ms=5, max_batch_size=4)
+    try:
+        results = await asyncio.gather(
+            scheduler.submit(_job("a")),
+            scheduler.submit(_job("b")),
+            return_exceptions=True,
+        )
+    finally:
+        await scheduler.stop()
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_short_batch_result_fails_unmatched_requests():
+    async def run_batch(jobs):
+        return ["only one"]
+
+    scheduler = MicroBatchScheduler(run_batch, window_ms=20, max_batch_size=4)
+    try:
+        results = await asyncio.wait_for(
+            asyncio.gather(
+                scheduler.submit(_job("a")),
+                scheduler.submit(_job("b")),
+                return_exceptions=True,
+            ),
+            2,
+        )
+    finally:
+        await scheduler.stop()
+
+    assert results[0] == "only one"
+    assert isinstance(results[1], RuntimeError)
@@ -0,0 +1,52 @@
+import json
+import os
+import subprocess
+import sys
+
+from scripts.benchmark_search import percentile, summarize, synthetic_corpus
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def test_percentiles_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert summarize([])["count"] == 0
+    assert summarize([3.0, 1.0, 2.0])["p50"] == 2.0
+
+
+def test_synthetic_corpus_is_deterministic():
+    assert synthetic_corpus(50, seed=1) == synthetic_corpus(50, seed=1)
+    assert len({doc_id for doc_id, _ in synthetic_corpus(50)}) == 50
+
+
+def test_benchmark_runs_end_to_end_with_stubs(tmp_path):
+    out = tmp_path / "result.json"
+    proc = subprocess.run(
+        [
+            sys.executable,
+            "scripts/benchmark_search.py",
+            "--requests", "30",
+            "--concurrency", "4",
+            "--warmup", "0",
+            "--pois", "300",
+            "--llm-ttft-ms", "1",
+            "--llm-token-ms", "0",
+            "--out", str(out),
+        ],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert proc.returncode == 0, proc.stderr
+
+    result = json.loads(out.read_text())
+    assert result["overall"]["requests"] == 30
+    assert result["overall"]["errors"] == 0
+    assert result["overall"]["qps"] > 0
+    assert {"p50", "p95", "p99"} <= set(result["overall"]["latency_ms"])
+    assert result["stages"]["recall"]["count"] == 30
+    assert result["config"]["recall_backend"] == "memory"
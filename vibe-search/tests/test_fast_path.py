@@ -0,0 +1,103 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.nlp.fast_path import FastPathAnalyzer
+from app.nlp.analyzer import analyzer
+
+GAZETTEER_CATEGORIES = ["cafe", "park", "restaurant"]
+GAZETTEER_NAMES = {"田子坊": "attraction", "Starbucks Reserve": "cafe"}
+
+
+def _loaded_fast_path():
+    fp = FastPathAnalyzer()
+    fp.load(GAZETTEER_CATEGORIES, GAZETTEER_NAMES)
+    return fp
+
+
+def test_bare_category_and_name_queries():
+    fp = _loaded_fast_path()
+
+    result = fp.analyze("咖啡")
+    assert result.intent["category"] == "cafe"
+    assert result.confidence >= 0.9
+
+    # Filler words ("上海") lower confidence slightly but still hit
+    result = fp.analyze("上海公园")
+    assert result.intent["category"] == "park"
+    assert 0.8 <= result.confidence < 0.9
+
+    result = fp.analyze(" 田子坊 ")
+    assert result.intent["category"] == "attraction"
+    assert result.intent["key_phrases"] == ["田子坊"]
+
+    # Same schema as the LLM analyzer
+    assert set(result.intent) == set(analyzer.fallback())
+
+
+def test_complex_queries_go_to_llm():
+    fp = _loaded_fast_path()
+    assert fp.analyze("popular coffee near the bund with wifi") is None
+    # Category unknown to the index is never returned
+    assert fp.analyze("医院") is None
+    # Threshold is respected
+    assert fp.analyze("上海公园", min_confidence=0.99) is None
+    assert fp.stats()["misses"] == 3
+
+
+def test_fillers_are_stripped_on_word_boundaries_only():
+    fp = FastPathAnalyzer()
+    fp.load(["bank", "cafe"], {"上海银行(人民广场支行)": "bank"})
+
+    # "上海" is part of a POI name here, not filler around a category
+    assert fp.analyze("上海银行") is None
+    assert fp.analyze("银行 附近").intent["category"] == "bank"
+    # Latin fillers only as whole words
+    assert fp.analyze("shanghaicoffee") is None
+    assert fp.analyze("coffee near me").intent["keywords"] == ["coffee"]
+
+
+def test_unloaded_gazetteer_never_hits():
+    assert FastPathAnalyzer().analyze("咖啡") is None
+
+
+@pytest.mark.asyncio
+async def test_refresh_from_es():
+    client = MagicMock()
+    client.search = AsyncMock(
+        return_value={
+            "aggregations": {
+                "category": {"buckets": [{"key": "cafe"}, {"key": "park"}]},
+                "amenity": {"buckets": [{"key": "cafe"}]},
+            }
+        }
+    )
+
+    async def fake_scan(*args, **kwargs):
+        for name, category in [("田子坊", "attraction"), ("田子坊", "attraction")]:
+            yield {"_source": {"name": name, "category": category}}
+
+    fp = FastPathAnalyzer()
+    with patch("app.nlp.fast_path.async_scan", fake_scan):
+        await fp.refresh(client, "poi_v1")
+
+    assert fp.categories == {"cafe", "park"}
+    assert fp.analyze("田子坊").intent["category"] == "attraction"
+
+
+@pytest.mark.asyncio
+async def test_run_nlp_skips_llm_on_fast_path():
+    from app.main import run_nlp
+    from app.nlp.cache import rewrite_cache
+
+    rewrite_cache.clear()
+    with patch("app.main.fast_path", _loaded_fast_path()), patch(
+        "app.nlp.analyzer.QueryAnalyzer.analyze", new_callable=AsyncMock
+    ) as mock_analyze, patch(
+        "app.nlp.rewriter.QueryRewriter.rewrite", new_callable=AsyncMock
+    ) as mock_rewrite:
+        mock_rewrite.return_value = ["cafe", "coffee shop", "espresso bar"]
+        intent, rewrites = await run_nlp("咖啡")
+
+    assert mock_analyze.call_count == 0
+    assert intent["category"] == "cafe"
+    assert rewrites == ["cafe", "coffee shop", "espresso bar"]
+    rewrite_cache.clear()
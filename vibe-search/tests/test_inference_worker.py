@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+import pytest
+from app.nlp.inference_worker import InferenceWorker, WorkerBusyError, collect
+
+
+@pytest.mark.asyncio
+async def test_event_loop_stays_responsive_during_inference():
+    worker = InferenceWorker(max_queue=4)
+    ticks = []
+
+    async def heartbeat():
+        for _ in range(5):
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.01)
+
+    try:
+        result, _ = await asyncio.gather(
+            worker.run(lambda: time.sleep(0.1) or "done"), heartbeat()
+        )
+    finally:
+        worker.stop()
+
+    assert result == "done"
+    # Heartbeats kept firing while the blocking call ran
+    assert len(ticks) == 5
+    assert ticks[-1] - ticks[0] < 0.1
+
+
+@pytest.mark.asyncio
+async def test_closing_stream_cancels_generation():
+    worker = InferenceWorker(max_queue=4)
+    produced = []
+    finished = threading.Event()
+
+    def tokens():
+        try:
+            for i in range(100):
+                produced.append(i)
+                time.sleep(0.002)
+                yield f"t{i} "
+        finally:
+            finished.set()
+
+    try:
+        stream = worker.stream(tokens)
+        received = []
+        async for delta in stream:
+            received.append(delta)
+            if len(received) == 3:
+                break
+        await stream.aclose()
+
+        assert await asyncio.to_thread(finished.wait, 1.0)
+        assert len(produced) < 100
+        assert received == ["t0 ", "t1 ", "t2 "]
+    finally:
+        worker.stop()
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects_new_jobs():
+    worker = InferenceWorker(max_queue=1)
+    release = threading.Event()
+
+    try:
+        running = asyncio.create_task(worker.run(release.wait))
+        await asyncio.sleep(0.02)  # first job is now running, queue empty
+        queued = asyncio.create_task(worker.run(lambda: "queued"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(WorkerBusyError):
+            await worker.run(lambda: "rejected")
+
+        release.set()
+        assert await running is True
+        assert await queued == "queued"
+    finally:
+        release.set()
+        worker.stop()
+
+
+@pytest.mark.asyncio
+async def test_collect_joins_stream():
+    worker = InferenceWorker(max_queue=4)
+    try:
+        text = await collect(worker.stream(lambda: iter(["{", '"a": 1', "}"])))
+        assert text == '{"a": 1}'
+    finally:
+        worker.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_gives_up_on_a_busy_worker():
+    worker = InferenceWorker(max_queue=4)
+    release = threading.Event()
+    running = asyncio.create_task(worker.run(release.wait))
+    await asyncio.sleep(0.02)
+
+    started = time.perf_counter()
+    assert await asyncio.to_thread(worker.stop, 0.05) is False
+    assert time.perf_counter() - started < 1
+
+    release.set()
+    assert await running is True
+    assert await asyncio.to_thread(worker.stop, 1) is True
+    # Only one end marker was queued: a restarted worker still runs jobs
+    assert await worker.run(lambda: "again") == "again"
+    worker.stop()
@@ -0,0 +1,438 @@
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.core.config import settings
+from app.nlp.backends.fake_backend import FakeBackend
+from scripts.ingest_shanghai import (
+    LABELING_SYSTEM_PROMPT,
+    BlueGreenIndex,
+    EnrichmentCache,
+    IngestPipeline,
+    PipelineClosed,
+    build_batch_prompt,
+    enrichment_key,
+    ingest,
+    parse_batch_labels,
+    plan_label_batches,
+    read_artifact,
+)
+
+
+def _produce(n):
+    def produce(emit):
+        for i in range(n):
+            emit(
+                {
+                    "name": f"POI {i}",
+                    "location": {"lat": 31.23, "lon": 121.47},
+                    "category": "cafe",
+                    "amenity": "cafe",
+                    "tags": {"amenity": "cafe"},
+                    "popularity": 10,
+                    "address": "上海市",
+                }
+            )
+
+    return produce
+
+
+@pytest.mark.asyncio
+async def test_pipeline_enriches_concurrently_and_indexes_everything():
+    active = 0
+    peak = 0
+
+    async def enrich(name, address, category, tags):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        if name == "POI 3":
+            raise ValueError("bad LLM output")
+        return {"keywords": [name], "key_info": f"{name} info"}
+
+    indexed = []
+
+    async def fake_bulk(es, actions, **kwargs):
+        async for action in actions:
+            indexed.append(action)
+            yield True, {"index": {"_id": str(len(indexed))}}
+
+    with patch("scripts.ingest_shanghai.async_streaming_bulk", fake_bulk), patch(
+        "scripts.ingest_shanghai.remote_llm"
+    ) as mock_llm:
+        mock_llm.start = AsyncMock()
+        mock_llm.close = AsyncMock()
+        pipeline = IngestPipeline(
+            AsyncMock(), index="poi_test", concurrency=4, queue_size=2, enrich=enrich
+        )
+        await pipeline.run(_produce(20))
+
+    assert pipeline.indexed == 20 and pipeline.failed == 0
+    assert peak == 4  # bounded by the worker count
+    by_name = {a["_source"]["name"]: a["_source"] for a in indexed}
+    assert by_name["POI 0"]["keywords"] == ["POI 0"]
+    # A failed enrichment still indexes the POI, without AI fields
+    assert by_name["POI 3"]["keywords"] == []
+    assert all(a["_index"] == "poi_test" for a in indexed)
+
+
+@pytest.mark.asyncio
+async def test_pipeline_failure_stops_every_stage():
+    parser_exit = []
+
+    async def enrich(name, address, category, tags):
+        return {}
+
+    async def failing_bulk(es, actions, **kwargs):
+        async for _ in actions:
+            raise ConnectionError("ES down")
+        yield  # pragma: no cover
+
+    def produce(emit):
+        try:
+            _produce(10_000)(emit)
+        except BaseException as e:
+            parser_exit.append(e)
+            raise
+
+    with patch("scripts.ingest_shanghai.async_streaming_bulk", failing_bulk), patch(
+        "scripts.ingest_shanghai.remote_llm"
+    ) as mock_llm, patch("scripts.ingest_shanghai.EMIT_POLL_SECONDS", 0.01):
+        mock_llm.start = AsyncMock()
+        mock_llm.close = AsyncMock()
+        pipeline = IngestPipeline(
+            AsyncMock(), index="poi_test", concurrency=2, queue_size=2, enrich=enrich
+        )
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(pipeline.run(produce), 5)
+
+        # The parser thread blocked on the full queue gives up as well
+        for _ in range(100):
+            if parser_exit:
+                break
+            await asyncio.sleep(0.01)
+    assert parser_exit and isinstance(parser_exit[0], PipelineClosed)
+
+
+def _produce_with_ids(n):
+    inner = _produce(n)
+
+    def produce(emit):
+        counter = iter(range(n))
+        inner(lambda poi: emit({"id": f"node/{next(counter)}", **poi}))
+
+    return produce
+
+
+async def _run(pipeline, produce, **kwargs):
+    indexed = []
+
+    async def fake_bulk(es, actions, **kw):
+        async for action in actions:
+            indexed.append(action)
+            yield True, {"index": {"_id": action.get("_id")}}
+
+    with patch("scripts.ingest_shanghai.async_streaming_bulk", fake_bulk), patch(
+        "scripts.ingest_shanghai.remote_llm"
+    ) as mock_llm:
+        mock_llm.start = AsyncMock()
+        mock_llm.close = AsyncMock()
+        await pipeline.run(produce, **kwargs)
+    return indexed
+
+
+@pytest.mark.asyncio
+async def test_enrichment_cache_artifact_and_resume(tmp_path):
+    calls = []
+
+    async def enrich(name, address, category, tags):
+        calls.append(name)
+        return {"keywords": [name]}
+
+    def make_pipeline(cache):
+        return IngestPipeline(
+            AsyncMock(),
+            index="poi_test",
+            concurrency=2,
+            enrich=enrich,
+            cache=cache,
+            artifact_path=str(tmp_path / "poi.ndjson"),
+            checkpoint_path=str(tmp_path / "checkpoint.json"),
+        )
+
+    cache = EnrichmentCache(str(tmp_path / "cache.sqlite"))
+    indexed = await _run(make_pipeline(cache), _produce_with_ids(5))
+    assert len(calls) == 5
+    assert {a["_id"] for a in indexed} == {f"node/{i}" for i in range(5)}
+    assert json.loads((tmp_path / "checkpoint.json").read_text())["completed"]
+
+    # Unchanged POIs are not sent to the LLM again
+    calls.clear()
+    await _run(make_pipeline(cache), _produce_with_ids(5))
+    assert calls == [] and cache.hits == 5
+
+    # Simulate a crash after 3 POIs, mid-way through writing the 4th
+    artifact_file = tmp_path / "poi.ndjson"
+    lines = artifact_file.read_text(encoding="utf-8").splitlines(keepends=True)
+    artifact_file.write_text("".join(lines[:3]) + lines[3][:10], encoding="utf-8")
+
+    # Resume: artifact docs are re-indexed as-is, only new POIs are enriched
+    with patch("scripts.ingest_shanghai.INDEX_NAME", "poi_test"):
+        preloaded = read_artifact(str(artifact_file))
+    assert len(preloaded) == 3
+    done = {d["_source"]["name"] for d in preloaded}
+    calls.clear()
+    pipeline = make_pipeline(EnrichmentCache(str(tmp_path / "other.sqlite")))
+    indexed = await _run(pipeline, _produce_with_ids(5), preloaded=preloaded, resume=True)
+    assert sorted(calls) == sorted({f"POI {i}" for i in range(5)} - done)
+    assert sorted(a["_id"] for a in indexed) == [f"node/{i}" for i in range(5)]
+    # The artifact now holds every POI exactly once
+    artifact = read_artifact(str(tmp_path / "poi.ndjson"))
+    assert sorted(d["_id"] for d in artifact) == [f"node/{i}" for i in range(5)]
+    assert artifact[0]["_source"]["keywords"] == [artifact[0]["_source"]["name"]]
+
+
+def test_enrichment_key_ignores_tag_order():
+    a = enrichment_key("Cafe", "上海市", "cafe", {"amenity": "cafe", "cuisine": "coffee"})
+    b = enrichment_key("Cafe", "上海市", "cafe", {"cuisine": "coffee", "amenity": "cafe"})
+    c = enrichment_key("Cafe", "上海市", "cafe", {"amenity": "cafe"})
+    assert a == b != c
+
+
+def test_enrichment_key_follows_the_backend_model():
+    args = ("Cafe", "上海市", "cafe", {"amenity": "cafe"})
+    with patch.object(settings, "LLM_BACKEND", "llama_cpp"):
+        gguf = enrichment_key(*args)
+        with patch.object(settings, "LLM_GGUF_PATH", "other.gguf"):
+            assert enrichment_key(*args) != gguf
+        # Weights of a backend not in use do not matter
+        with patch.object(settings, "LLM_MODEL_PATH", "other-mlx"):
+            assert enrichment_key(*args) == gguf
+    with patch.object(settings, "LLM_BACKEND", "mlx"):
+        assert enrichment_key(*args) != gguf
+
+
+@pytest.mark.asyncio
+async def test_batched_labeling_falls_back_per_poi():
+    batches = []
+    singles = []
+
+    async def enrich_batch(pois):
+        batches.append([p[0] for p in pois])
+        # Second element invalid, the rest fine
+        return [
+            None if i == 1 else {"keywords": [name], "key_info": "", "key_phrases": [], "rewrites": []}
+            for i, (name, *_rest) in enumerate(pois)
+        ]
+
+    async def enrich(name, address, category, tags):
+        singles.append(name)
+        return {"keywords": ["single"]}
+
+    pipeline = IngestPipeline(
+        AsyncMock(),
+        index="poi_test",
+        concurrency=1,
+        queue_size=16,
+        enrich=enrich,
+        enrich_batch=enrich_batch,
+        batch_size=4,
+    )
+    indexed = await _run(pipeline, _produce(8))
+
+    assert len(indexed) == 8
+    assert all(len(b) <= 4 for b in batches) and sum(map(len, batches)) >= 7
+    # Only the POIs whose element failed validation are relabelled one by one
+    assert len(singles) == pipeline.label_fallbacks == len(
+        [b for b in batches if len(b) > 1]
+    )
+    by_name = {a["_source"]["name"]: a["_source"]["keywords"] for a in indexed}
+    for name in singles:
+        assert by_name[name] == ["single"]
+
+
+def test_fake_backend_answers_batched_prompt():
+    pois = [
+        ("星巴克", "上海市", "cafe", {"amenity": "cafe"}),
+        ("Tianzifang", "上海市", "attraction", {}),
+    ]
+    response = FakeBackend(ttft_ms=0, token_ms=0).respond(
+        build_batch_prompt(pois), LABELING_SYSTEM_PROMPT
+    )
+    labels = parse_batch_labels(response, len(pois))
+    assert [l["key_phrases"] for l in labels] == [["星巴克"], ["Tianzifang"]]
+
+
+def test_parse_batch_labels_validates_each_element():
+    response = json.dumps(
+        [
+            {"index": 0, "keywords": ["a"], "key_phrases": [], "key_info": "x", "rewrites": []},
+            {"index": 1, "keywords": "not a list"},
+            {"index": 7, "keywords": ["out of range"]},
+        ]
+    )
+    labels = parse_batch_labels("junk " + response, 3)
+    assert labels[0]["keywords"] == ["a"]
+    assert labels[1] is None and labels[2] is None
+    assert parse_batch_labels("not json", 2) == [None, None]
+
+
+def test_plan_label_batches_fits_context():
+    pois = [(f"POI {i}", "上海市", "cafe", {"amenity": "cafe"}) for i in range(10)]
+    assert [len(b) for b in plan_label_batches(pois, 4)] == [4, 4, 2]
+    with patch.object(settings, "LLM_CONTEXT_SIZE", 600), patch.object(
+        settings, "INGEST_LABEL_TOKENS_PER_POI", 160
+    ):
+        batches = plan_label_batches(pois, 8)
+    assert max(len(b) for b in batches) < 4
+    assert sorted(i for b in batches for i in b) == list(range(10))
+
+
+def _mock_es(alias_targets=None, concrete=False, versions=(), counts=None, published=()):
+    es = AsyncMock()
+    calls = []
+
+    def record(name):
+        async def call(*args, **kwargs):
+            calls.append((name, kwargs))
+
+        return call
+
+    for name in (
+        "put_settings", "refresh", "forcemerge", "update_aliases", "delete", "put_mapping"
+    ):
+        setattr(es.indices, name, AsyncMock(side_effect=record(name)))
+    es.search = AsyncMock(side_effect=record("search"))
+    es.cluster.health = AsyncMock(side_effect=record("health"))
+    es.indices.exists_alias = AsyncMock(return_value=alias_targets is not None)
+    es.indices.get_alias = AsyncMock(
+        return_value={t: {} for t in alias_targets or []}
+    )
+    es.indices.exists = AsyncMock(return_value=concrete)
+    es.indices.get = AsyncMock(
+        return_value={
+            v: {"mappings": {"_meta": {"published_at": 1}} if v in published else {}}
+            for v in versions
+        }
+    )
+    es.indices.get_mapping = AsyncMock(
+        side_effect=lambda index: {index: {"mappings": {"_meta": {"schema_version": 2}}}}
+    )
+    es.count = AsyncMock(side_effect=lambda index: {"count": (counts or {})[index]})
+    return es, calls
+
+
+@pytest.mark.asyncio
+async def test_create_uses_bulk_load_settings():
+    es, _ = _mock_es()
+    await BlueGreenIndex(es, "poi_v1").create("poi_v1_20260101000000")
+    kwargs = es.indices.create.call_args.kwargs
+    assert kwargs["settings"]["index"]["refresh_interval"] == "-1"
+    assert kwargs["settings"]["index"]["number_of_replicas"] == 0
+
+
+@pytest.mark.asyncio
+async def test_publish_prepares_index_then_swaps_alias():
+    es, calls = _mock_es(
+        alias_targets=["poi_v1_1"],
+        versions=["poi_v1_0", "poi_v1_1", "poi_v1_2"],
+        published=["poi_v1_0"],
+    )
+    await BlueGreenIndex(es, "poi_v1").publish("poi_v1_2")
+
+    names = [name for name, _ in calls]
+    # Serving settings, merge and warm-up all happen before traffic moves
+    assert names.index("put_settings") < names.index("forcemerge") < names.index(
+        "search"
+    ) < names.index("update_aliases")
+    restored = dict(calls)["put_settings"]["settings"]["index"]
+    assert restored["refresh_interval"] == settings.ES_REFRESH_INTERVAL
+    assert dict(calls)["update_aliases"]["actions"] == [
+        {"remove": {"index": "poi_v1_1", "alias": "poi_v1"}},
+        {"add": {"index": "poi_v1_2", "alias": "poi_v1"}},
+    ]
+    # The previous version is kept for rollback, older ones are deleted
+    assert [kw["index"] for name, kw in calls if name == "delete"] == ["poi_v1_0"]
+    # Marked as published, schema_version kept
+    assert dict(calls)["put_mapping"]["meta"]["schema_version"] == 2
+    assert "published_at" in dict(calls)["put_mapping"]["meta"]
+
+
+@pytest.mark.asyncio
+async def test_prune_keeps_rollback_past_a_blocked_build():
+    # A published, B blocked by publish_blocker, C being published
+    es, calls = _mock_es(
+        alias_targets=["poi_v1_a"],
+        versions=["poi_v1_a", "poi_v1_b", "poi_v1_c"],
+        published=["poi_v1_a"],
+    )
+    await BlueGreenIndex(es, "poi_v1").publish("poi_v1_c")
+    # A is the rollback target; the unpublished B is not counted or deleted
+    assert [kw["index"] for name, kw in calls if name == "delete"] == []
+
+    # Once two published versions are older than C, only the newest is kept
+    es, calls = _mock_es(
+        alias_targets=["poi_v1_c"],
+        versions=["poi_v1_a", "poi_v1_b", "poi_v1_c", "poi_v1_d"],
+        published=["poi_v1_a"],
+    )
+    await BlueGreenIndex(es, "poi_v1").publish("poi_v1_d")
+    assert [kw["index"] for name, kw in calls if name == "delete"] == ["poi_v1_a"]
+
+
+@pytest.mark.asyncio
+async def test_swap_replaces_legacy_concrete_index():
+    es, calls = _mock_es(concrete=True)
+    await BlueGreenIndex(es, "poi_v1").swap_alias("poi_v1_2")
+    assert dict(calls)["update_aliases"]["actions"] == [
+        {"remove_index": {"index": "poi_v1"}},
+        {"add": {"index": "poi_v1_2", "alias": "poi_v1"}},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_publish_blocked_by_failed_bulk_items():
+    es, _ = _mock_es(alias_targets=["poi_v1_1"], counts={"poi_v1": 100, "poi_v1_2": 100})
+    target = BlueGreenIndex(es, "poi_v1")
+    assert await target.publish_blocker("poi_v1_2", indexed=0, failed=0)
+    assert "failed" in await target.publish_blocker("poi_v1_2", indexed=90, failed=10)
+    with patch.object(settings, "INGEST_MAX_FAILED_RATIO", 0.2):
+        assert await target.publish_blocker("poi_v1_2", indexed=90, failed=10) is None
+
+
+@pytest.mark.asyncio
+async def test_publish_blocked_when_index_shrinks():
+    es, _ = _mock_es(alias_targets=["poi_v1_1"], counts={"poi_v1": 1000, "poi_v1_2": 500})
+    target = BlueGreenIndex(es, "poi_v1")
+    assert "1000" in await target.publish_blocker("poi_v1_2", indexed=500, failed=0)
+    with patch.object(settings, "INGEST_MIN_DOC_RATIO", 0.5):
+        assert await target.publish_blocker("poi_v1_2", indexed=500, failed=0) is None
+
+    # First publish: nothing behind the alias to compare with
+    es, _ = _mock_es()
+    assert await BlueGreenIndex(es, "poi_v1").publish_blocker(
+        "poi_v1_2", indexed=500, failed=0
+    ) is None
+    es.count.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "state, alias_targets",
+    [
+        ({"index": "poi_v1_1", "completed": True}, ["poi_v1_0"]),
+        ({"index": "poi_v1_1", "completed": False}, ["poi_v1_1"]),
+    ],
+)
+@pytest.mark.asyncio
+async def test_resume_never_loads_a_finished_or_live_index(tmp_path, state, alias_targets):
+    checkpoint = tmp_path / "checkpoint.json"
+    checkpoint.write_text(json.dumps(state))
+    es, calls = _mock_es(alias_targets=alias_targets)
+    with patch("scripts.ingest_shanghai.AsyncElasticsearch", return_value=es), patch(
+        "scripts.ingest_shanghai.CHECKPOINT_PATH", str(checkpoint)
+    ):
+        await ingest(resume=True, use_cache=False)
+    es.indices.create.assert_not_called()
+    assert "update_aliases" not in [name for name, _ in calls]
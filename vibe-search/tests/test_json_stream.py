@@ -0,0 +1,38 @@
+import json
+from app.nlp.json_stream import JSONStreamExtractor
+
+
+def _feed_all(extractor, chunks):
+    for chunk in chunks:
+        result = extractor.feed(chunk)
+        if result is not None:
+            return result
+    return None
+
+
+def test_object_closes_before_trailing_tokens():
+    extractor = JSONStreamExtractor("{")
+    chunks = ['Sure! {"category": ', '"cafe", "keywords": ["co', 'ffee"]}', " and more"]
+    result = _feed_all(extractor, chunks)
+
+    assert json.loads(result) == {"category": "cafe", "keywords": ["coffee"]}
+    # The trailing chunk was never needed
+    assert "and more" not in extractor.text
+
+
+def test_think_block_is_skipped():
+    extractor = JSONStreamExtractor("[")
+    chunks = ["<th", "ink>maybe [not this] one", "</think>\n", '["a", ', '"b"]']
+    assert json.loads(_feed_all(extractor, chunks)) == ["a", "b"]
+
+
+def test_brackets_inside_strings_are_ignored():
+    extractor = JSONStreamExtractor("{")
+    chunks = ['{"key_info": "a } tricky \\" {string", ', '"rewrites": ["x]"]}']
+    result = _feed_all(extractor, chunks)
+    assert json.loads(result)["rewrites"] == ["x]"]
+
+
+def test_incomplete_payload_returns_none():
+    extractor = JSONStreamExtractor("{")
+    assert _feed_all(extractor, ['{"category": "park"']) is None
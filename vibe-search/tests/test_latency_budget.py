@@ -0,0 +1,101 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import AsyncMock, patch
+from httpx import AsyncClient, ASGITransport
+from app.core.config import settings
+from app.main import app
+from app.nlp.cache import intent_cache, rewrite_cache
+
+MOCK_HITS = {
+    "hits": {
+        "hits": [
+            {
+                "_id": "1",
+                "_score": 3.0,
+                "_source": {
+                    "name": "Manner Coffee",
+                    "location": {"lat": 31.2304, "lon": 121.4737},
+                    "category": "cafe",
+                    "popularity": 50,
+                },
+            }
+        ]
+    }
+}
+
+
+async def _slow_analyze(query):
+    await asyncio.sleep(1.0)
+    return {"category": "cafe", "keywords": ["coffee"]}
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    intent_cache.clear()
+    rewrite_cache.clear()
+    yield
+    intent_cache.clear()
+    rewrite_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_slow_nlp_degrades_to_original_query_recall():
+    with patch(
+        "app.nlp.analyzer.QueryAnalyzer.analyze", side_effect=_slow_analyze
+    ), patch(
+        "app.nlp.rewriter.QueryRewriter.rewrite", new_callable=AsyncMock
+    ) as mock_rewrite, patch(
+        "app.recall.es_client.AsyncElasticsearch.search", new_callable=AsyncMock
+    ) as mock_es:
+        mock_rewrite.return_value = ["manner coffee"]
+        mock_es.return_value = MOCK_HITS
+
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as ac:
+            start = time.perf_counter()
+            response = await ac.post(
+                "/search",
+                json={
+                    "query": "slow coffee",
+                    "lat": 31.23,
+                    "lon": 121.47,
+                    "latency_budget_ms": 200,
+                },
+            )
+            elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.8
+    data = response.json()
+    assert data["degraded"] is True
+    assert data["rewrites"] == ["manner coffee"]
+    assert [r["name"] for r in data["results"]] == ["Manner Coffee"]
+    # The raw query was recalled as its own sub-queue
+    queries = [str(c.kwargs["query"]) for c in mock_es.call_args_list]
+    assert any("slow coffee" in q for q in queries)
+
+
+@pytest.mark.asyncio
+async def test_fast_nlp_is_not_degraded():
+    with patch.object(settings, "SPECULATIVE_RECALL", False), patch(
+        "app.nlp.analyzer.QueryAnalyzer.analyze", new_callable=AsyncMock
+    ) as mock_analyze, patch(
+        "app.nlp.rewriter.QueryRewriter.rewrite", new_callable=AsyncMock
+    ) as mock_rewrite, patch(
+        "app.recall.es_client.AsyncElasticsearch.search", new_callable=AsyncMock
+    ) as mock_es:
+        mock_analyze.return_value = {"category": "cafe", "keywords": ["coffee"]}
+        mock_rewrite.return_value = ["manner coffee"]
+        mock_es.return_value = MOCK_HITS
+
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as ac:
+            response = await ac.post(
+                "/search",
+                json={"query": "fast coffee", "lat": 31.23, "lon": 121.47},
+            )
+
+    data = response.json()
+    assert data["degraded"] is False
+    queries = [str(c.kwargs["query"]) for c in mock_es.call_args_list]
+    assert not any("fast coffee" in q for q in queries)
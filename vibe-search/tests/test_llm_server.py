@@ -0,0 +1,100 @@
+import asyncio
+import json
+import time
+import pytest
+from httpx import AsyncClient, ASGITransport
+from app.llm_server import app, llm_client
+from app.nlp.analyzer import analyzer
+from app.nlp.local_qwen import load_backend
+from app.nlp.backends.fake_backend import FakeBackend
+
+
+@pytest.fixture
+def fake_backend():
+    previous = llm_client._backend
+    llm_client._backend = FakeBackend(ttft_ms=0, token_ms=0)
+    yield llm_client._backend
+    llm_client._backend = previous
+    llm_client.worker.stop()
+
+
+def test_backends_are_imported_lazily():
+    assert isinstance(load_backend("fake"), FakeBackend)
+    with pytest.raises(ValueError):
+        load_backend("nope")
+
+
+def test_fake_backend_is_deterministic_and_parsable():
+    backend = FakeBackend(ttft_ms=0, token_ms=0)
+    first = backend.respond("coffee near bund", analyzer.SYSTEM_PROMPT)
+    assert first == backend.respond("coffee near bund", analyzer.SYSTEM_PROMPT)
+
+    intent = analyzer._normalize(analyzer._extract_json(first))
+    assert intent["keywords"] == ["coffee", "near", "bund"]
+
+
+@pytest.mark.asyncio
+async def test_generate_with_fake_backend(fake_backend):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        resp = await ac.post(
+            "/generate",
+            json={"prompt": "coffee", "system_prompt": analyzer.SYSTEM_PROMPT},
+        )
+    assert resp.status_code == 200
+    assert json.loads(resp.json()["response"])["keywords"] == ["coffee"]
+
+
+@pytest.mark.asyncio
+async def test_stream_returns_ndjson_deltas(fake_backend):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        resp = await ac.post(
+            "/generate",
+            json={
+                "prompt": "coffee",
+                "system_prompt": "You are a Search Query Expander.",
+                "stream": True,
+            },
+        )
+    events = [json.loads(line) for line in resp.text.splitlines() if line]
+    assert events[-1] == {"done": True}
+    text = "".join(e.get("delta", "") for e in events)
+    assert json.loads(text) == ["coffee nearby", "best coffee", "coffee recommendations"]
+
+
+@pytest.mark.asyncio
+async def test_stream_never_sends_part_of_a_stop_sequence(fake_backend):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        resp = await ac.post(
+            "/generate",
+            json={
+                "prompt": "coffee",
+                "system_prompt": "You are a Search Query Expander.",
+                "stream": True,
+                # Spans two 4-character fake tokens (" nea" + "rby")
+                "stop": ["nearby"],
+            },
+        )
+    events = [json.loads(line) for line in resp.text.splitlines() if line]
+    assert events[-1] == {"done": True}
+    assert "".join(e.get("delta", "") for e in events) == '["coffee '
+
+
+@pytest.mark.asyncio
+async def test_health_responsive_while_generating(fake_backend):
+    fake_backend.ttft_ms = 300
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        generation = asyncio.create_task(
+            ac.post("/generate", json={"prompt": "slow", "system_prompt": "System"})
+        )
+        await asyncio.sleep(0.05)
+
+        start = time.perf_counter()
+        health = await ac.get("/health")
+        assert health.status_code == 200
+        assert time.perf_counter() - start < 0.2
+
+        assert (await generation).status_code == 200
@@ -0,0 +1,308 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.core.config import settings
+from app.ranking.ranker import ranker
+from app.recall.es_client import ESClient
+from app.recall.memory_engine import MemoryRecallEngine, required_terms, tokenize
+
+USER = (31.2304, 121.4737)  # The Bund
+
+DOCS = [
+    (
+        "1",
+        {
+            "name": "星巴克臻选烘焙工坊",
+            "location": {"lat": 31.2319, "lon": 121.4753},
+            "category": "cafe",
+            "amenity": "cafe",
+            "popularity": 95,
+            "keywords": ["咖啡", "烘焙", "Starbucks"],
+            "key_phrases": ["精品咖啡", "烘焙工坊"],
+            "key_info": "Starbucks Reserve Roastery, the largest coffee roastery.",
+            "rewrites": ["starbucks reserve", "咖啡工坊"],
+        },
+    ),
+    (
+        "2",
+        {
+            "name": "Manner Coffee",
+            "location": {"lat": 31.2290, "lon": 121.4720},
+            "category": "cafe",
+            "amenity": "cafe",
+            "popularity": 40,
+            "keywords": ["coffee", "咖啡"],
+            "key_phrases": ["平价咖啡"],
+            "key_info": "Cheap specialty coffee to go.",
+            "rewrites": ["manner", "coffee to go"],
+        },
+    ),
+    (
+        "3",
+        {
+            "name": "外滩公园",
+            "location": {"lat": 31.2400, "lon": 121.4900},
+            "category": "park",
+            "amenity": None,
+            "popularity": 80,
+            "keywords": ["公园", "外滩"],
+            "key_phrases": ["外滩夜景"],
+            "key_info": "Riverside park on the Bund.",
+            "rewrites": ["bund park"],
+        },
+    ),
+    (
+        "4",
+        {
+            "name": "Far Away Coffee",
+            "location": {"lat": 31.1000, "lon": 121.4000},
+            "category": "cafe",
+            "amenity": "cafe",
+            "popularity": 10,
+            "keywords": ["coffee"],
+        },
+    ),
+]
+
+
+@pytest.fixture
+def engine():
+    engine = MemoryRecallEngine(grid_deg=0.01)
+    engine.load(DOCS)
+    return engine
+
+
+def _geo(radius_km=5.0):
+    return {
+        "geo_distance": {
+            "distance": f"{radius_km}km",
+            "location": {"lat": USER[0], "lon": USER[1]},
+        }
+    }
+
+
+def test_tokenizer_splits_cjk_per_character():
+    assert tokenize("Starbucks星巴克 Reserve-Roastery") == [
+        "starbucks", "星", "巴", "克", "reserve", "roastery"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_geo_filter_and_bm25(engine):
+    resp = await engine.search(
+        query={
+            "bool": {
+                "must": [_geo()],
+                "should": [{"match": {"keywords": {"query": "coffee", "boost": 2.0}}}],
+                "minimum_should_match": 1,
+            }
+        },
+        size=10,
+    )
+    ids = [h["_id"] for h in resp["hits"]["hits"]]
+    # "4" matches the text but is ~15 km away
+    assert ids == ["2"]
+    # geo_distance contributes a constant 1.0, the boosted BM25 the rest
+    assert resp["hits"]["hits"][0]["_score"] > 1.0
+
+
+@pytest.mark.asyncio
+async def test_phrase_keyword_and_msearch(engine):
+    resp = await engine.msearch(
+        searches=[
+            {"index": "poi"},
+            {"query": {"match_phrase": {"key_phrases": "烘焙工坊"}}, "size": 5},
+            {"index": "poi"},
+            {"query": {"match_phrase": {"key_phrases": "工坊烘焙"}}, "size": 5},
+            {"index": "poi"},
+            {"query": {"match": {"amenity": "cafe"}}, "size": 5},
+            {"index": "poi"},
+            {"query": {"regexp": {"name": ".*"}}, "size": 5},
+        ]
+    )
+    phrase, reversed_phrase, keyword, unsupported = resp["responses"]
+    assert [h["_id"] for h in phrase["hits"]["hits"]] == ["1"]
+    assert reversed_phrase["hits"]["hits"] == []
+    assert sorted(h["_id"] for h in keyword["hits"]["hits"]) == ["1", "2", "4"]
+    assert "error" in unsupported
+
+
+@pytest.mark.asyncio
+async def test_wide_scans_run_off_the_event_loop(engine):
+    query = {"match": {"keywords": "coffee"}}
+    inline = await engine.search(query=query, size=5)
+
+    with patch.object(settings, "MEMORY_INLINE_SCAN_DOCS", 1), patch(
+        "app.recall.memory_engine.asyncio.to_thread", wraps=asyncio.to_thread
+    ) as to_thread:
+        threaded = await engine.search(query=query, size=5)
+        await engine.msearch(searches=[{"index": "poi"}, {"query": query}])
+    assert to_thread.call_count == 2
+    assert threaded == inline
+    # Scores use the idf table built at load time
+    assert engine.idf["keywords"]["coffee"] == engine._bm25_idf(2)
+
+
+@pytest.mark.asyncio
+async def test_esclient_on_memory_backend(engine):
+    with patch("app.recall.es_client.AsyncElasticsearch"), patch.object(
+        settings, "RANK_MODE", "es"
+    ):
+        client = ESClient()
+        client.memory = client.client = engine
+        results = await client.search(
+            "咖啡",
+            ["coffee to go"],
+            {"keywords": ["咖啡"], "key_phrases": ["精品咖啡"], "sort_preference": "distance"},
+            *USER,
+        )
+
+    by_id = {r["id"]: r for r in results}
+    assert set(by_id) == {"1", "2"}
+    assert "rewriting" in by_id["2"]["recall_source"]
+    # function_score evaluated in-process: scores are the Ranker weights' sum
+    ranked = ranker.rank_scored(results)
+    assert all(0 < r["final_score"] <= 1.0 for r in ranked)
+
+
+@pytest.mark.asyncio
+async def test_memory_fallback_when_es_is_down(engine):
+    with patch("app.recall.es_client.AsyncElasticsearch") as MockES, patch.object(
+        settings, "RECALL_MEMORY_FALLBACK", True
+    ):
+        mock_es_instance = AsyncMock()
+        mock_es_instance.search.side_effect = ConnectionError("ES down")
+        MockES.return_value = mock_es_instance
+
+        client = ESClient()
+        client.memory = engine
+        results = await client.search("coffee", [], {"keywords": ["coffee"]}, *USER)
+
+    assert [r["id"] for r in results] == ["2"]
+
+
+def test_ndjson_round_trip(engine, tmp_path):
+    path = tmp_path / "snapshot.ndjson"
+    engine.write_ndjson(str(path))
+
+    reloaded = MemoryRecallEngine()
+    reloaded.load_ndjson(str(path))
+    assert reloaded.ids == engine.ids
+    assert reloaded.gazetteer() == engine.gazetteer()
+
+
+@pytest.mark.asyncio
+async def test_schema_v2_combined_field_and_normalized_category(engine):
+    # `search_text` is derived from name / address / rewrites / category
+    resp = await engine.search(
+        query={
+            "bool": {
+                "must": [_geo(), {"match": {"search_text": "manner"}}],
+                "should": [{"term": {"category.norm": {"value": "CAFE", "boost": 2.0}}}],
+                "minimum_should_match": 0,
+            }
+        },
+        size=5,
+    )
+    hits = resp["hits"]["hits"]
+    assert [h["_id"] for h in hits] == ["2"]
+
+    with_cat = await engine.search(query={"term": {"category.norm": "Park"}}, size=5)
+    assert [h["_id"] for h in with_cat["hits"]["hits"]] == ["3"]
+
+
+def test_rewrite_sub_queue_clause_count_by_schema():
+    client = ESClient()
+    nlp = {"category": "cafe"}
+
+    def clauses(query):
+        body = query["bool"]
+        return len(body["must"]) + len(body["should"])
+
+    with patch.object(client, "schema_version", 1), patch.object(
+        settings, "RANK_MODE", "python"
+    ):
+        v1 = client._build_query("咖啡", "rewrite", nlp, *USER, 5.0)
+    with patch.object(client, "schema_version", 2), patch.object(
+        settings, "RANK_MODE", "python"
+    ):
+        v2 = client._build_query("咖啡", "rewrite", nlp, *USER, 5.0)
+
+    assert clauses(v1) == 7  # geo + 5 field matches + category
+    assert clauses(v2) == 4  # geo + search_text + name top-up + category.norm term
+    assert v2["bool"]["should"][-1] == {
+        "term": {"category.norm": {"value": "cafe", "boost": settings.BOOST_CATEGORY}}
+    }
+
+
+@pytest.mark.asyncio
+async def test_v1_and_v2_rewrite_hit_sets():
+    loc = {"lat": USER[0], "lon": USER[1]}
+    engine = MemoryRecallEngine()
+    engine.load(
+        [
+            ("name", {"name": "Manner Coffee", "location": loc, "rewrites": ["manner coffee"]}),
+            (
+                "addr",
+                {
+                    "name": "Lawson",
+                    "address": "Manner Coffee Road",
+                    "location": loc,
+                    "rewrites": ["manner coffee road"],
+                },
+            ),
+            # Only one of the two query terms
+            ("partial", {"name": "Costa Coffee", "location": loc, "rewrites": ["coffee"]}),
+        ]
+    )
+    client = ESClient()
+
+    async def hits(version):
+        with patch.object(client, "schema_version", version), patch.object(
+            settings, "RANK_MODE", "python"
+        ):
+            query = client._build_query("manner coffee", "rewrite", {}, *USER, 5.0)
+        resp = await engine.search(query=query, size=10)
+        return [h["_id"] for h in resp["hits"]["hits"]]
+
+    v1, v2 = await hits(1), await hits(2)
+    # v1 needs two matching fields, v2 most of the query terms
+    assert set(v1) == {"name", "addr", "partial"}
+    assert set(v2) == {"name", "addr"}
+    # The name top-up ranks the name hit above the address-only one
+    assert v2.index("name") < v2.index("addr")
+
+
+def test_required_terms_follows_minimum_should_match():
+    assert required_terms(None, 4) == 1
+    assert required_terms("2<75%", 2) == 2
+    assert required_terms("2<75%", 4) == 3
+    assert required_terms("-1", 3) == 2
+    assert required_terms("2<-25% 9<-3", 12) == 9
+
+
+@pytest.mark.asyncio
+async def test_recall_schema_version_follows_index_mappings():
+    with patch("app.recall.es_client.AsyncElasticsearch") as MockES, patch.object(
+        settings, "RECALL_SCHEMA_VERSION", "auto"
+    ), patch.object(settings, "RECALL_BACKEND", "es"):
+        mock_es_instance = AsyncMock()
+        MockES.return_value = mock_es_instance
+        client = ESClient()
+        # Nothing read yet: an index built before v2
+        assert client.schema_version == 1
+
+        mock_es_instance.indices.get_mapping.return_value = {
+            "poi_v1_20260101000000": {"mappings": {"_meta": {"schema_version": 2}}}
+        }
+        assert await client.refresh_schema_version() == 2
+
+        # Alias also spanning a legacy index: the oldest mapping wins
+        mock_es_instance.indices.get_mapping.return_value = {
+            "poi_v1_20260101000000": {"mappings": {"_meta": {"schema_version": 2}}},
+            "poi_legacy": {"mappings": {"properties": {}}},
+        }
+        assert await client.refresh_schema_version() == 1
+        assert "category.norm" not in str(
+            client._build_query("咖啡", "rewrite", {"category": "cafe"}, *USER, 5.0)
+        )
@@ -0,0 +1,137 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.nlp.cache import QueryResultCache, normalize_query
+
+
+def test_normalize_query():
+    # Whitespace, case and full-width forms collapse to one key
+    assert normalize_query("  Coffee   Shop ") == "coffee shop"
+    assert normalize_query("ＣＯＦＦＥＥ　ｓｈｏｐ") == "coffee shop"
+    assert normalize_query("田子坊") == normalize_query(" 田子坊　")
+
+
+@pytest.mark.asyncio
+async def test_cache_hit_miss_and_lru():
+    cache = QueryResultCache("test", max_size=2, ttl_seconds=60)
+    loader = AsyncMock(side_effect=lambda q: {"q": q})
+
+    await cache.get_or_load("a", loader)
+    await cache.get_or_load(" A ", loader)
+    assert loader.call_count == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+    # Callers get copies; mutating a result does not poison the cache
+    result = await cache.get_or_load("a", loader)
+    result["q"] = "mutated"
+    assert (await cache.get_or_load("a", loader))["q"] == "a"
+
+    # "b" and "c" push the least recently used entry ("a") out
+    await cache.get_or_load("b", loader)
+    await cache.get_or_load("c", loader)
+    assert cache.get("a") is None
+    assert cache.stats()["evictions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_fallback_results_expire_quickly():
+    cache = QueryResultCache(
+        "test", max_size=10, ttl_seconds=60, fallback_ttl_seconds=0.01
+    )
+    loader = AsyncMock(return_value=[])
+
+    await cache.get_or_load("coffee", loader, is_fallback=lambda r: not r)
+    await asyncio.sleep(0.02)
+    await cache.get_or_load("coffee", loader, is_fallback=lambda r: not r)
+
+    assert loader.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_load():
+    cache = QueryResultCache("test", max_size=10, ttl_seconds=60)
+
+    async def slow_loader(query):
+        await asyncio.sleep(0.01)
+        return ["coffee shop"]
+
+    loader = AsyncMock(side_effect=slow_loader)
+    results = await asyncio.gather(
+        *[cache.get_or_load("coffee", loader) for _ in range(5)]
+    )
+
+    assert loader.call_count == 1
+    assert all(r == ["coffee shop"] for r in results)
+
+
+@pytest.mark.asyncio
+async def test_waiter_takes_over_a_cancelled_load():
+    cache = QueryResultCache("test", max_size=10, ttl_seconds=60)
+    started = asyncio.Event()
+
+    async def slow_loader(query):
+        started.set()
+        await asyncio.sleep(0.05)
+        return ["coffee shop"]
+
+    leader = asyncio.create_task(cache.get_or_load("coffee", slow_loader))
+    await started.wait()
+    follower = asyncio.create_task(cache.get_or_load("coffee", slow_loader))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await follower == ["coffee shop"]
+    assert cache.get("coffee") == ["coffee shop"]
+
+
+@pytest.mark.asyncio
+async def test_late_nlp_calls_are_capped():
+    from app.main import _gather_within
+
+    async def never():
+        await asyncio.sleep(10)
+
+    background = set()
+    with patch("app.main.settings.NLP_MAX_BACKGROUND_TASKS", 1), patch(
+        "app.main._background_tasks", background
+    ):
+        tasks = [asyncio.create_task(never()), asyncio.create_task(never())]
+        results, timed_out = await _gather_within(tasks, [1, 2], timeout=0.01)
+        await asyncio.sleep(0)
+
+    assert results == [1, 2] and timed_out
+    (kept,) = background
+    assert not kept.done()
+    assert [t.cancelled() for t in tasks].count(True) == 1
+    kept.cancel()
+
+
+@pytest.mark.asyncio
+async def test_run_nlp_uses_cache():
+    from app.main import run_nlp
+    from app.nlp.cache import intent_cache, rewrite_cache
+
+    intent_cache.clear()
+    rewrite_cache.clear()
+
+    with patch(
+        "app.nlp.analyzer.QueryAnalyzer.analyze", new_callable=AsyncMock
+    ) as mock_analyze, patch(
+        "app.nlp.rewriter.QueryRewriter.rewrite", new_callable=AsyncMock
+    ) as mock_rewrite, patch(
+        "app.main.settings.NLP_MODE", "split"
+    ):
+        mock_analyze.return_value = {"category": "park", "keywords": []}
+        mock_rewrite.return_value = ["city park"]
+
+        await run_nlp("上海公园")
+        intent, rewrites = await run_nlp("上海公园 ")
+
+        assert mock_analyze.call_count == 1
+        assert mock_rewrite.call_count == 1
+        assert intent["category"] == "park"
+        assert rewrites == ["city park"]
+
+    intent_cache.clear()
+    rewrite_cache.clear()
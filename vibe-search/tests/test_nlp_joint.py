@@ -0,0 +1,47 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.nlp.joint import joint_processor
+
+MOCK_JOINT_RESPONSE = """<think>short reasoning</think>
+{
+    "intent": {
+        "category": "cafe",
+        "location_hint": "The Bund",
+        "sort_preference": "popularity",
+        "keywords": ["coffee"]
+    },
+    "rewrites": ["coffee shop", "starbucks", "espresso"]
+}"""
+
+
+@pytest.mark.asyncio
+async def test_joint_single_generation():
+    with patch(
+        "app.nlp.joint.llm_client.generate_json", new_callable=AsyncMock
+    ) as mock_generate:
+        mock_generate.return_value = MOCK_JOINT_RESPONSE
+
+        intent, rewrites = await joint_processor.process("popular coffee near bund")
+
+        # One LLM round-trip for both outputs
+        assert mock_generate.call_count == 1
+
+        # Same contract as QueryAnalyzer.analyze / QueryRewriter.rewrite
+        assert intent["category"] == "cafe"
+        assert intent["key_phrases"] == []
+        assert intent["key_info"] == ""
+        assert rewrites == ["coffee shop", "starbucks", "espresso"]
+
+
+@pytest.mark.asyncio
+async def test_joint_fallback_on_garbage():
+    with patch(
+        "app.nlp.joint.llm_client.generate_json", new_callable=AsyncMock
+    ) as mock_generate:
+        mock_generate.return_value = "ERROR"
+
+        intent, rewrites = await joint_processor.process("coffee")
+
+        assert intent["sort_preference"] == "relevance"
+        assert intent["keywords"] == []
+        assert rewrites == []
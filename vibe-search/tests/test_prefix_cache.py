@@ -0,0 +1,62 @@
+from app.nlp.prefix_cache import PromptPrefixCache, PrefixEntry, split_chat_template
+
+
+class ChatMLTokenizer:
+    """Renders the Qwen ChatML template the way the HF tokenizer does."""
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=False):
+        text = "".join(
+            f"<|im_start|>{m['role']}\n{m['content']}<|im_end|>\n" for m in messages
+        )
+        if add_generation_prompt:
+            text += "<|im_start|>assistant\n"
+        return text
+
+
+class ReorderingTokenizer(ChatMLTokenizer):
+    """A template that puts the user turn before the system turn."""
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=False):
+        return super().apply_chat_template(
+            list(reversed(messages)), tokenize, add_generation_prompt
+        )
+
+
+def test_split_matches_full_template():
+    tokenizer = ChatMLTokenizer()
+    system_prompt = "You are a Geo-Intent Extractor."
+    template = split_chat_template(tokenizer, system_prompt)
+
+    full = tokenizer.apply_chat_template(
+        [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": "田子坊"},
+        ],
+        add_generation_prompt=True,
+    )
+    assert template.prefix + template.suffix("田子坊") == full
+    assert "田子坊" not in template.prefix
+
+
+def test_unsplittable_template_falls_back():
+    assert split_chat_template(ReorderingTokenizer(), "System") is None
+
+
+def test_prefix_built_once_per_system_prompt():
+    built = []
+
+    def build(system_prompt):
+        built.append(system_prompt)
+        template = split_chat_template(ChatMLTokenizer(), system_prompt)
+        return PrefixEntry(template=template, tokens=[], state=object())
+
+    cache = PromptPrefixCache(build, max_entries=2)
+    first = cache.get("analyzer")
+    assert cache.get("analyzer") is first
+    cache.get("rewriter")
+    cache.get("ingest")  # evicts "analyzer"
+    cache.get("analyzer")
+
+    assert built == ["analyzer", "rewriter", "ingest", "analyzer"]
+    assert cache.hits == 1
+    assert cache.misses == 4
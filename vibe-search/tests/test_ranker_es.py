@@ -0,0 +1,82 @@
+import math
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.core.config import settings
+from app.ranking.ranker import ranker, REL_SATURATION_SCRIPT
+from app.recall.es_client import ESClient
+
+
+def _es_gauss(dist_km, scale_km, decay):
+    # ES gauss decay: exp(-d^2 / 2s^2) with s^2 = -scale^2 / (2 ln decay)
+    s2 = -(scale_km**2) / (2 * math.log(decay))
+    return math.exp(-(dist_km**2) / (2 * s2))
+
+
+def test_function_score_matches_python_formula():
+    wrapped = ranker.function_score({"match_all": {}}, 31.23, 121.47, "relevance")
+    fs = wrapped["function_score"]
+    assert fs["query"] == {"match_all": {}}
+    assert fs["score_mode"] == "sum"
+    assert fs["boost_mode"] == "replace"
+
+    rel, gauss, pop = fs["functions"]
+    w_rel, w_dist, w_pop = ranker.weights_for("relevance")
+    assert rel["weight"] == w_rel
+    assert rel["script_score"]["script"]["source"] == REL_SATURATION_SCRIPT
+    assert gauss["weight"] == w_dist
+
+    # Distance decay parity with Ranker.rank
+    location = gauss["gauss"]["location"]
+    scale_km = float(location["scale"].removesuffix("km"))
+    sigma = settings.RANK_DIST_SIGMA
+    for dist_km in (0.0, 0.5, 2.0, 5.0):
+        expected = math.exp(-(dist_km**2) / (2 * sigma**2))
+        assert _es_gauss(dist_km, scale_km, location["decay"]) == pytest.approx(
+            expected, rel=1e-4
+        )
+
+    # Popularity parity: weight * ln(1 + pop) == w_pop * log1p(pop) / log1p(max)
+    pop_value = 42
+    expected = w_pop * math.log1p(pop_value) / math.log1p(settings.RANK_POP_MAX)
+    assert pop["weight"] * math.log1p(pop_value) == pytest.approx(expected)
+    assert pop["field_value_factor"]["modifier"] == "ln1p"
+
+
+def test_function_score_preference_weights():
+    fs = ranker.function_score({"match_all": {}}, 31.23, 121.47, "distance")
+    weights = [f["weight"] for f in fs["function_score"]["functions"]]
+    assert weights[0] == 0.1 and weights[1] == 0.8
+
+
+@pytest.mark.asyncio
+async def test_es_rank_mode_wraps_sub_queues_and_orders_by_es_score():
+    with patch("app.recall.es_client.AsyncElasticsearch") as MockES, patch.object(
+        settings, "RANK_MODE", "es"
+    ):
+        mock_es_instance = AsyncMock()
+        MockES.return_value = mock_es_instance
+        mock_es_instance.search.side_effect = [
+            {"hits": {"hits": [{"_id": "1", "_score": 0.4, "_source": {"name": "A"}}]}},
+            {
+                "hits": {
+                    "hits": [
+                        {"_id": "1", "_score": 0.9, "_source": {"name": "A"}},
+                        {"_id": "2", "_score": 0.6, "_source": {"name": "B"}},
+                    ]
+                }
+            },
+        ]
+
+        client = ESClient()
+        candidates = await client.search(
+            "coffee", ["exp1"], {"keywords": ["coffee"]}, 31.23, 121.47
+        )
+
+        call = mock_es_instance.search.call_args_list[0].kwargs
+        assert "function_score" in call["query"]
+        assert call["size"] == settings.RANK_ES_SEARCH_SIZE
+
+        ranked = ranker.rank_scored(candidates)
+        assert [c["id"] for c in ranked] == ["1", "2"]
+        # Best per-sub-queue score wins for duplicates
+        assert ranked[0]["final_score"] == 0.9
@@ -0,0 +1,208 @@
+import json
+import random
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.core.config import settings
+from app.recall.cache import RecallCache, geohash_encode, geohash_cell
+from app.recall.es_client import ESClient
+from app.recall.memory_engine import MemoryRecallEngine
+
+USER_A = (31.2304, 121.4737)
+USER_B = (31.2310, 121.4745)  # ~100 m away, same tile
+
+
+def _hits():
+    return {
+        "hits": {
+            "hits": [
+                {
+                    "_id": "near",
+                    "_score": 2.0,
+                    "_source": {"name": "Near", "location": {"lat": 31.2320, "lon": 121.4750}},
+                },
+                {
+                    "_id": "edge",
+                    "_score": 1.0,
+                    "_source": {"name": "Edge", "location": {"lat": 31.2304, "lon": 121.5255}},
+                },
+            ]
+        }
+    }
+
+
+def _client(cache):
+    client = ESClient()
+    client.cache = cache
+    return client
+
+
+def test_geohash_known_value_and_cell():
+    assert geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    c_lat, c_lon, half_h, half_w = geohash_cell(*USER_A, 6)
+    assert abs(c_lat - USER_A[0]) <= half_h
+    assert abs(c_lon - USER_A[1]) <= half_w
+
+
+def test_snap_shares_tile_and_covers_radius():
+    cache = RecallCache(max_size=16, ttl_seconds=60, geohash_precision=6, radius_bucket_km=0.5)
+    a = cache.snap(*USER_A, 5.0)
+    assert a == cache.snap(*USER_B, 5.0)
+    assert a[2] > 5.0 and (a[2] / 0.5).is_integer()
+
+
+@pytest.mark.asyncio
+async def test_neighbours_share_entry_with_their_own_distances():
+    with patch("app.recall.es_client.AsyncElasticsearch") as MockES:
+        mock_es_instance = AsyncMock()
+        mock_es_instance.search.return_value = _hits()
+        MockES.return_value = mock_es_instance
+
+        cache = RecallCache(max_size=16, ttl_seconds=60)
+        client = _client(cache)
+        analysis = {"keywords": ["coffee"]}
+
+        first = await client.search("coffee", [], analysis, *USER_A, radius_km=5.0)
+        second = await client.search("coffee", [], analysis, *USER_B, radius_km=5.0)
+
+        assert mock_es_instance.search.call_count == 1
+        assert cache.hits == 1
+        a = {r["id"]: r["distance_km"] for r in first}
+        b = {r["id"]: r["distance_km"] for r in second}
+        assert a["near"] != b["near"]
+
+        # "edge" is ~4.8 km from A: outside a 4.5 km radius, trimmed locally
+        trimmed = await client.search("coffee", [], analysis, *USER_A, radius_km=4.5)
+        assert [r["id"] for r in trimmed] == ["near"]
+
+
+@pytest.mark.asyncio
+async def test_es_rank_mode_queries_the_exact_position():
+    with patch("app.recall.es_client.AsyncElasticsearch") as MockES:
+        mock_es_instance = AsyncMock()
+        mock_es_instance.search.return_value = _hits()
+        MockES.return_value = mock_es_instance
+
+        cache = RecallCache(max_size=16, ttl_seconds=60)
+        client = _client(cache)
+        analysis = {"keywords": ["coffee"]}
+
+        with patch.object(settings, "RANK_MODE", "es"):
+            await client.search("coffee", [], analysis, *USER_A, radius_km=5.0)
+            await client.search("coffee", [], analysis, *USER_B, radius_km=5.0)
+
+        # The distance decay is centred on each user, so no tile sharing
+        assert mock_es_instance.search.call_count == 2
+        origins = [
+            json.dumps(c.kwargs["query"]) for c in mock_es_instance.search.call_args_list
+        ]
+        assert str(USER_A[0]) in origins[0] and str(USER_B[0]) in origins[1]
+
+
+@pytest.mark.asyncio
+async def test_distances_left_to_the_ranker_when_not_needed():
+    with patch("app.recall.es_client.AsyncElasticsearch") as MockES:
+        mock_es_instance = AsyncMock()
+        mock_es_instance.search.return_value = _hits()
+        MockES.return_value = mock_es_instance
+
+        client = _client(RecallCache(max_size=0))
+        analysis = {"keywords": ["coffee"]}
+
+        # The local ranker computes the distances of the results it keeps
+        results = await client.search("coffee", [], analysis, *USER_A, radius_km=5.0)
+        assert all(r["distance_km"] is None for r in results)
+
+        # RANK_MODE=es returns recall hits as they are
+        with patch.object(settings, "RANK_MODE", "es"):
+            results = await client.search("coffee", [], analysis, *USER_A, radius_km=5.0)
+        assert all(r["distance_km"] is not None for r in results)
+
+
+def _dense_cafes(n=600):
+    rng = random.Random(7)
+    return [
+        (
+            str(i),
+            {
+                "name": f"Cafe {i}",
+                "location": {
+                    "lat": USER_A[0] + rng.uniform(-0.04, 0.04),
+                    "lon": USER_A[1] + rng.uniform(-0.045, 0.045),
+                },
+                "category": "cafe",
+                "popularity": 1,
+                "keywords": ["coffee"] * rng.randint(1, 3) + ["x"] * rng.randint(0, 6),
+            },
+        )
+        for i in range(n)
+    ]
+
+
+async def _recall_ids(cache):
+    engine = MemoryRecallEngine(grid_deg=0.01)
+    engine.load(_dense_cafes())
+    with patch("app.recall.es_client.AsyncElasticsearch"):
+        client = _client(cache)
+        client.memory = client.client = engine
+        results = await client.search(
+            "coffee", [], {"keywords": ["coffee"]}, *USER_A, radius_km=2.0
+        )
+    return sorted(r["id"] for r in results)
+
+
+@pytest.mark.asyncio
+async def test_tile_query_returns_the_exact_in_radius_page():
+    exact = await _recall_ids(RecallCache(max_size=0))
+    tiled = RecallCache(max_size=16, ttl_seconds=60)
+    assert len(exact) == settings.SEARCH_SIZE
+    assert await _recall_ids(tiled) == exact
+
+    # Without the wider fetch, the page of the larger tile area is trimmed short
+    narrow = RecallCache(max_size=16, ttl_seconds=60)
+    narrow.fetch_size = lambda size, *_: size
+    assert await _recall_ids(narrow) != exact
+
+
+@pytest.mark.asyncio
+async def test_index_version_change_clears_cache():
+    client = AsyncMock()
+    client.indices.get_alias.return_value = {"poi_v1": {}}
+    client.count.return_value = {"count": 10}
+
+    cache = RecallCache(max_size=16, ttl_seconds=60)
+    await cache.refresh_version(client, "poi")
+    cache.set("k", [{"_id": "1"}])
+
+    await cache.refresh_version(client, "poi")
+    assert cache.get("k") == [{"_id": "1"}]
+
+    client.count.return_value = {"count": 11}
+    await cache.refresh_version(client, "poi")
+    assert cache.get("k") is None
+    assert cache.invalidations == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = RecallCache(max_size=0, ttl_seconds=60)
+    assert not cache.enabled
+    cache.set("k", [])
+    assert cache.get("k") is None
+
+
+@pytest.mark.asyncio
+async def test_msearch_only_sends_misses():
+    from app.core.config import settings
+
+    with patch("app.recall.es_client.AsyncElasticsearch") as MockES, patch.object(
+        settings, "RECALL_MODE", "msearch"
+    ):
+        mock_es_instance = AsyncMock()
+        mock_es_instance.msearch.return_value = {"responses": [_hits()]}
+        MockES.return_value = mock_es_instance
+
+        client = _client(RecallCache(max_size=16, ttl_seconds=60))
+        await client.search("coffee", [], {"keywords": ["coffee"]}, *USER_A)
+        results = await client.search("coffee", [], {"keywords": ["coffee"]}, *USER_B)
+
+        assert mock_es_instance.msearch.call_count == 1
+        assert {r["id"] for r in results} == {"near", "edge"}
@@ -0,0 +1,101 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.core import explain
+from app.core.config import settings
+from app.recall.es_client import ESClient
+
+
+def _hits(*names):
+    return {
+        "hits": {
+            "hits": [
+                {"_id": n, "_score": 1, "_source": {"name": n}} for n in names
+            ]
+        }
+    }
+
+
+@pytest.mark.asyncio
+async def test_msearch_recall_single_round_trip():
+    with patch("app.recall.es_client.AsyncElasticsearch") as MockES, patch.object(
+        settings, "RECALL_MODE", "msearch"
+    ):
+        mock_es_instance = AsyncMock()
+        MockES.return_value = mock_es_instance
+        mock_es_instance.msearch.return_value = {
+            "responses": [_hits("A", "B"), _hits("B", "C")]
+        }
+
+        client = ESClient()
+        results = await client.search(
+            "coffee", ["exp1"], {"keywords": ["coffee"]}, 31.23, 121.47
+        )
+
+        # One request for both sub-queues, none through search()
+        assert mock_es_instance.msearch.call_count == 1
+        assert mock_es_instance.search.call_count == 0
+        searches = mock_es_instance.msearch.call_args.kwargs["searches"]
+        assert len(searches) == 4
+        assert searches[0] == {"index": client.index}
+        assert searches[1]["size"] == settings.SEARCH_SIZE
+
+        # Same merge / attribution as the parallel mode
+        assert [r["id"] for r in results] == ["A", "B", "C"]
+        by_id = {r["id"]: r["recall_source"] for r in results}
+        assert by_id["A"] == "analysis_keywords"
+        assert by_id["B"] == "analysis_keywords, rewriting"
+        assert by_id["C"] == "rewriting"
+
+
+@pytest.mark.asyncio
+async def test_msearch_failed_sub_queue_is_isolated():
+    with patch("app.recall.es_client.AsyncElasticsearch") as MockES, patch.object(
+        settings, "RECALL_MODE", "msearch"
+    ):
+        mock_es_instance = AsyncMock()
+        MockES.return_value = mock_es_instance
+        mock_es_instance.msearch.return_value = {
+            "responses": [
+                {"error": {"type": "query_shard_exception"}, "status": 400},
+                _hits("C"),
+            ]
+        }
+
+        client = ESClient()
+        results = await client.search(
+            "coffee", ["exp1"], {"keywords": ["coffee"]}, 31.23, 121.47
+        )
+
+        assert [r["id"] for r in results] == ["C"]
+        assert results[0]["recall_source"] == "rewriting"
+
+
+@pytest.mark.asyncio
+async def test_msearch_explain_records_each_sub_queue():
+    with patch("app.recall.es_client.AsyncElasticsearch") as MockES, patch.object(
+        settings, "RECALL_MODE", "msearch"
+    ):
+        mock_es_instance = AsyncMock()
+        MockES.return_value = mock_es_instance
+        mock_es_instance.msearch.return_value = {
+            "responses": [
+                {"error": {"type": "query_shard_exception"}, "status": 400},
+                {**_hits("C"), "took": 2, "profile": {"shards": []}},
+            ]
+        }
+
+        client = ESClient()
+        trace = explain.start_request(True, profile=True)
+        try:
+            await client.search("coffee", ["exp1"], {"keywords": ["coffee"]}, 31.23, 121.47)
+        finally:
+            explain.start_request(False)
+
+        searches = mock_es_instance.msearch.call_args.kwargs["searches"]
+        assert all(body["profile"] is True for body in searches[1::2])
+        failed, rewriting = trace.sub_queues
+        assert failed["source"] == "analysis_keywords" and failed["failed"]
+        assert rewriting["query"] == searches[3]["query"]
+        assert rewriting["es_took_ms"] == 2
+        assert rewriting["profile"] == {"shards": []}
+        assert [h["id"] for h in rewriting["hits"]] == ["C"]
@@ -1,5 +1,8 @@
+import asyncio
+import time
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
+from app.core.config import settings
 from app.recall.es_client import ESClient
 
 
@@ -52,3 +55,54 @@ async def test_parallel_recall_search():
         assert ids == ["1", "2", "3"]
 
         print("\n[PASS] Parallel recall executed and merged correctly.")
+
+
+def _slow_search(slow_query_marker):
+    async def search(index=None, query=None, size=10, **kwargs):
+        if slow_query_marker in str(query):
+            await asyncio.sleep(5)
+        return {"hits": {"hits": [{"_id": "1", "_score": 1, "_source": {"name": "A"}}]}}
+
+    return search
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["parallel", "msearch"])
+async def test_deadline_bounds_non_streaming_recall(mode):
+    with patch("app.recall.es_client.AsyncElasticsearch") as MockES, patch.object(
+        settings, "RECALL_MODE", mode
+    ):
+        mock_es_instance = AsyncMock()
+        MockES.return_value = mock_es_instance
+        mock_es_instance.search.side_effect = _slow_search("slow rewrite")
+
+        async def msearch(searches=None, **kwargs):
+            await asyncio.sleep(5)
+
+        mock_es_instance.msearch.side_effect = msearch
+
+        client = ESClient()
+        trace = {}
+        start = time.perf_counter()
+        results = await client.search(
+            "coffee",
+            ["slow rewrite"],
+            {"keywords": ["coffee"]},
+            31.23,
+            121.47,
+            deadline_ms=50,
+            trace=trace,
+        )
+
+    assert time.perf_counter() - start < 1.0
+    if mode == "parallel":
+        # Only the late sub-queue is dropped
+        assert [r["id"] for r in results] == ["1"]
+        assert trace["dropped_sub_queues"] == ["rewriting:slow rewrite"]
+    else:
+        # One round-trip: all of its sub-queues miss the deadline together
+        assert results == []
+        assert trace["dropped_sub_queues"] == [
+            "analysis_keywords",
+            "rewriting:slow rewrite",
+        ]
@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.core.config import settings
+from app.recall.es_client import ESClient
+
+
+def _hits(*names):
+    return {
+        "hits": {
+            "hits": [
+                {"_id": n, "_score": 1, "_source": {"name": n}} for n in names
+            ]
+        }
+    }
+
+
+@pytest.mark.asyncio
+async def test_streaming_recall_drops_late_sub_queues():
+    cancelled = []
+
+    async def fake_search(index, query, size):
+        if "slow rewrite" in str(query):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+            return _hits("SLOW")
+        if "fast rewrite" in str(query):
+            return _hits("B", "C")
+        return _hits("A", "B")
+
+    with patch("app.recall.es_client.AsyncElasticsearch") as MockES, patch.object(
+        settings, "RECALL_MODE", "streaming"
+    ), patch.object(settings, "RECALL_DEADLINE_MS", 100):
+        mock_es_instance = AsyncMock()
+        mock_es_instance.search.side_effect = fake_search
+        MockES.return_value = mock_es_instance
+
+        client = ESClient()
+        trace = {}
+        start = asyncio.get_running_loop().time()
+        results = await client.search(
+            "coffee",
+            ["fast rewrite", "slow rewrite"],
+            {"keywords": ["coffee"]},
+            31.23,
+            121.47,
+            trace=trace,
+        )
+        elapsed = asyncio.get_running_loop().time() - start
+
+    assert elapsed < 1.0
+    assert sorted(r["id"] for r in results) == ["A", "B", "C"]
+    by_id = {r["id"]: r["recall_source"] for r in results}
+    assert set(by_id["B"].split(", ")) == {"analysis_keywords", "rewriting"}
+    assert trace["dropped_sub_queues"] == ["rewriting:slow rewrite"]
+    assert cancelled == [True]
+
+
+@pytest.mark.asyncio
+async def test_streaming_recall_without_drops():
+    with patch("app.recall.es_client.AsyncElasticsearch") as MockES, patch.object(
+        settings, "RECALL_MODE", "streaming"
+    ):
+        mock_es_instance = AsyncMock()
+        mock_es_instance.search.return_value = _hits("A")
+        MockES.return_value = mock_es_instance
+
+        trace = {}
+        results = await ESClient().search(
+            "coffee", ["exp1"], {"keywords": ["coffee"]}, 31.23, 121.47, trace=trace
+        )
+
+    assert [r["id"] for r in results] == ["A"]
+    assert trace["dropped_sub_queues"] == []
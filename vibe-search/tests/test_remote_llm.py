@@ -0,0 +1,138 @@
+import asyncio
+import json
+import pytest
+from aiohttp import web
+from unittest.mock import patch
+from app.nlp.remote_qwen import RemoteQwenAgent
+
+
+async def _start_llm_stub(delay: float = 0.0):
+    """Tiny stand-in for llm_server.py /generate that tracks concurrency."""
+    state = {"active": 0, "peak": 0, "connections": set()}
+
+    async def generate(request):
+        state["connections"].add(request.transport.get_extra_info("peername"))
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        try:
+            await asyncio.sleep(delay)
+            body = await request.json()
+            return web.json_response({"response": f"echo:{body['prompt']}"})
+        finally:
+            state["active"] -= 1
+
+    app = web.Application()
+    app.router.add_post("/generate", generate)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/generate", state
+
+
+@pytest.mark.asyncio
+async def test_pooled_session_reuses_connections():
+    runner, url, state = await _start_llm_stub()
+    agent = RemoteQwenAgent()
+    agent.api_url = url
+    try:
+        await agent.start()
+        for i in range(5):
+            assert await agent.generate(f"q{i}") == f"echo:q{i}"
+        # Sequential calls ride one keep-alive connection
+        assert len(state["connections"]) == 1
+    finally:
+        await agent.close()
+        await runner.cleanup()
+
+
+def test_new_loop_discards_the_previous_session():
+    agent = RemoteQwenAgent()
+
+    async def open_session():
+        await agent.start()
+        return agent._session
+
+    first = asyncio.run(open_session())
+    second = asyncio.run(open_session())
+    try:
+        assert second is not first
+        # The old session and its connector are closed, not left open
+        assert first.closed and first.connector is None
+    finally:
+        asyncio.run(agent.close())
+
+
+@pytest.mark.asyncio
+async def test_semaphore_bounds_inflight_generations():
+    runner, url, state = await _start_llm_stub(delay=0.02)
+    agent = RemoteQwenAgent()
+    agent.api_url = url
+    try:
+        with patch("app.nlp.remote_qwen.settings.LLM_MAX_CONCURRENCY", 2):
+            await agent.start()
+            results = await asyncio.gather(*[agent.generate(f"q{i}") for i in range(6)])
+        assert results == [f"echo:q{i}" for i in range(6)]
+        assert state["peak"] <= 2
+        assert agent.stats()["queue_wait"]["count"] >= 6
+    finally:
+        await agent.close()
+        await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_read_timeout_returns_error_marker():
+    runner, url, _ = await _start_llm_stub(delay=0.5)
+    agent = RemoteQwenAgent()
+    agent.api_url = url
+    try:
+        response = await agent.generate("slow", read_timeout=0.05)
+        assert response == RemoteQwenAgent.CONNECT_ERROR_RESPONSE
+    finally:
+        await agent.close()
+        await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_stream_stops_once_json_closes():
+    state = {"sent": 0, "finished": False}
+    deltas = ['<think>\n</think>\n', '{"category": ', '"cafe"}', " trailing"] + [
+        " waste"
+    ] * 50
+
+    async def generate(request):
+        body = await request.json()
+        assert body["stream"] is True
+        resp = web.StreamResponse()
+        await resp.prepare(request)
+        for delta in deltas:
+            await resp.write((json.dumps({"delta": delta}) + "\n").encode())
+            state["sent"] += 1
+            await asyncio.sleep(0.005)
+        await resp.write(b'{"done": true}\n')
+        state["finished"] = True
+        return resp
+
+    app = web.Application()
+    app.router.add_post("/generate", generate)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    agent = RemoteQwenAgent()
+    agent.api_url = f"http://127.0.0.1:{port}/generate"
+    try:
+        with patch("app.nlp.remote_qwen.settings.LLM_STREAMING", True):
+            result = await agent.generate_json("coffee", "System", opener="{")
+        assert json.loads(result) == {"category": "cafe"}
+
+        # The server notices the dropped connection well before the end
+        await asyncio.sleep(0.05)
+        assert not state["finished"]
+        assert state["sent"] < len(deltas)
+    finally:
+        await agent.close()
+        await runner.cleanup()
@@ -0,0 +1,126 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from httpx import AsyncClient, ASGITransport
+from app.core.config import settings
+from app.main import app
+from app.nlp.cache import intent_cache, rewrite_cache
+
+PROFILE = {"shards": [{"id": "[node][poi][0]", "searches": []}]}
+
+
+def es_response(*_, **kwargs):
+    resp = {
+        "took": 4,
+        "hits": {
+            "hits": [
+                {
+                    "_id": "1",
+                    "_score": 3.0,
+                    "_source": {
+                        "name": "Manner Coffee",
+                        "location": {"lat": 31.2304, "lon": 121.4737},
+                        "category": "cafe",
+                        "popularity": 50,
+                    },
+                },
+                {
+                    "_id": "2",
+                    "_score": 1.5,
+                    "_source": {
+                        "name": "Seesaw",
+                        "location": {"lat": 31.2404, "lon": 121.4837},
+                        "category": "cafe",
+                        "popularity": 500,
+                    },
+                },
+            ]
+        },
+    }
+    if kwargs.get("profile"):
+        resp["profile"] = PROFILE
+    return resp
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    intent_cache.clear()
+    rewrite_cache.clear()
+    yield
+    intent_cache.clear()
+    rewrite_cache.clear()
+
+
+async def post_search(**extra):
+    with patch(
+        "app.nlp.analyzer.QueryAnalyzer.analyze", new_callable=AsyncMock
+    ) as mock_analyze, patch(
+        "app.nlp.rewriter.QueryRewriter.rewrite", new_callable=AsyncMock
+    ) as mock_rewrite, patch(
+        "app.recall.es_client.AsyncElasticsearch.search", new_callable=AsyncMock
+    ) as mock_es, patch.object(settings, "NLP_MODE", "parallel"), patch.object(
+        settings, "RECALL_MODE", "parallel"
+    ), patch.object(settings, "FAST_PATH_ENABLED", False), patch.object(
+        settings, "SPECULATIVE_RECALL", False
+    ):
+        mock_analyze.return_value = {"category": "cafe", "keywords": ["coffee"]}
+        mock_rewrite.return_value = ["manner coffee"]
+        mock_es.side_effect = es_response
+
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as ac:
+            response = await ac.post(
+                "/search",
+                json={"query": "quiet coffee", "lat": 31.2304, "lon": 121.4737, **extra},
+            )
+    assert response.status_code == 200
+    return response.json(), mock_es
+
+
+@pytest.mark.asyncio
+async def test_explain_off_by_default():
+    data, mock_es = await post_search()
+    assert data["explain"] is None
+    assert all("profile" not in c.kwargs for c in mock_es.call_args_list)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("engine", ["numpy", "python"])
+async def test_explain_traces_the_single_execution(engine):
+    with patch.object(settings, "RANK_ENGINE", engine):
+        data, mock_es = await post_search(explain=True)
+    trace = data["explain"]
+
+    # One ES request per sub-queue: the trace is not produced by re-running
+    assert mock_es.call_count == 2
+    sub_queues = {sq["source"]: sq for sq in trace["sub_queues"]}
+    assert set(sub_queues) == {"analysis_keywords", "rewriting"}
+    rewriting = sub_queues["rewriting"]
+    assert rewriting["query_content"] == "manner coffee"
+    assert rewriting["query"] in [c.kwargs["query"] for c in mock_es.call_args_list]
+    assert rewriting["es_took_ms"] == 4
+    assert rewriting["profile"] is None
+    assert [h["id"] for h in rewriting["hits"]] == ["1", "2"]
+
+    assert trace["candidates"] == 2
+    assert [r["id"] for r in trace["ranking"]] == [r["id"] for r in data["results"]]
+    # Factors recorded by the ranking pass itself add up to the returned score
+    for row, result in zip(trace["ranking"], data["results"]):
+        total = sum(f["score"] * f["weight"] for f in row["factors"].values())
+        assert total == pytest.approx(result["score"])
+    assert {"total", "recall", "rank"} <= set(trace["timings_ms"])
+
+
+@pytest.mark.asyncio
+async def test_explain_profile_is_requested_from_es():
+    data, mock_es = await post_search(explain=True, profile=True)
+    assert all(c.kwargs.get("profile") for c in mock_es.call_args_list)
+    assert all(sq["profile"] == PROFILE for sq in data["explain"]["sub_queues"])
+
+
+@pytest.mark.asyncio
+async def test_explain_es_rank_mode_has_no_local_factors():
+    with patch.object(settings, "RANK_MODE", "es"):
+        data, _ = await post_search(explain=True)
+    ranking = data["explain"]["ranking"]
+    assert [r["id"] for r in ranking] == [r["id"] for r in data["results"]]
+    assert all(r["factors"] is None for r in ranking)
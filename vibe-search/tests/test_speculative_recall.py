@@ -0,0 +1,135 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import AsyncMock, patch
+from httpx import AsyncClient, ASGITransport
+from app.core.config import settings
+from app.main import app
+from app.nlp.cache import intent_cache, rewrite_cache
+from app.recall.es_client import ESClient
+
+
+def _hits(*names):
+    return {
+        "hits": {
+            "hits": [
+                {
+                    "_id": n,
+                    "_score": 1,
+                    "_source": {
+                        "name": n,
+                        "location": {"lat": 31.2304, "lon": 121.4737},
+                        "popularity": 10,
+                    },
+                }
+                for n in names
+            ]
+        }
+    }
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["parallel", "msearch", "streaming"])
+async def test_prefetched_original_merges_with_attribution(mode):
+    with patch("app.recall.es_client.AsyncElasticsearch") as MockES, patch.object(
+        settings, "RECALL_MODE", mode
+    ):
+        mock_es_instance = AsyncMock()
+        mock_es_instance.search.side_effect = lambda index, query, size: (
+            _hits("A", "B") if "original" in str(query) else _hits("B")
+        )
+        mock_es_instance.msearch.return_value = {"responses": [_hits("B")]}
+        MockES.return_value = mock_es_instance
+
+        client = ESClient()
+        prefetched = asyncio.create_task(
+            client.search_original("original", 31.23, 121.47)
+        )
+        results = await client.search(
+            "original",
+            [],
+            {"keywords": ["coffee"]},
+            31.23,
+            121.47,
+            include_original=True,
+            prefetched=prefetched,
+        )
+
+    by_id = {r["id"]: r["recall_source"] for r in results}
+    assert by_id["A"] == "original"
+    assert set(by_id["B"].split(", ")) == {"original", "analysis_keywords"}
+    # The prefetched task replaces the degraded-mode original sub-queue
+    original_calls = [
+        c for c in mock_es_instance.search.call_args_list if "original" in str(c)
+    ]
+    assert len(original_calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_original_recall_overlaps_nlp():
+    intent_cache.clear()
+    rewrite_cache.clear()
+    timeline = {}
+
+    async def slow_analyze(query):
+        await asyncio.sleep(0.2)
+        timeline["nlp_done"] = time.perf_counter()
+        return {"category": "cafe", "keywords": ["coffee"]}
+
+    async def fake_search(index, query, size):
+        if "speculative coffee" in str(query):
+            timeline["original_started"] = time.perf_counter()
+        return _hits("A")
+
+    with patch(
+        "app.nlp.analyzer.QueryAnalyzer.analyze", side_effect=slow_analyze
+    ), patch(
+        "app.nlp.rewriter.QueryRewriter.rewrite", new_callable=AsyncMock
+    ) as mock_rewrite, patch(
+        "app.recall.es_client.AsyncElasticsearch.search", side_effect=fake_search
+    ):
+        mock_rewrite.return_value = ["coffee shop"]
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as ac:
+            response = await ac.post(
+                "/search",
+                json={"query": "speculative coffee", "lat": 31.23, "lon": 121.47},
+            )
+
+    assert response.status_code == 200
+    assert response.json()["results"][0]["id"] == "A"
+    assert timeline["original_started"] < timeline["nlp_done"]
+    intent_cache.clear()
+    rewrite_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_es_ranked_prefetch_is_rerun_with_the_intent():
+    with patch("app.recall.es_client.AsyncElasticsearch") as MockES, patch.object(
+        settings, "RANK_MODE", "es"
+    ), patch.object(settings, "RECALL_MODE", "parallel"):
+        mock_es_instance = AsyncMock()
+        mock_es_instance.search.return_value = _hits("A")
+        MockES.return_value = mock_es_instance
+
+        client = ESClient()
+        prefetched = asyncio.create_task(
+            client.search_original("coffee", 31.23, 121.47)
+        )
+        await asyncio.sleep(0)
+        await client.search(
+            "coffee",
+            [],
+            {"category": "cafe", "sort_preference": "distance"},
+            31.23,
+            121.47,
+            prefetched=prefetched,
+        )
+
+    # Speculative request, then the original sub-queue again with the intent
+    assert mock_es_instance.search.call_count == 2
+    # The merged original sub-queue carries the intent's category boost and weights
+    merged = mock_es_instance.search.call_args_list[-1].kwargs["query"]
+    assert "cafe" in str(merged)
+    weights = [f["weight"] for f in merged["function_score"]["functions"]]
+    assert weights[:2] == [0.1, 0.8]
@@ -0,0 +1,109 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from httpx import AsyncClient, ASGITransport
+from app.core import timing
+from app.core.config import settings
+from app.main import app
+from app.nlp.analyzer import analyzer
+from app.nlp.cache import intent_cache, rewrite_cache
+from app.nlp.remote_qwen import LLM_PARSE_FAILURES
+from scripts.benchmark_search import parse_server_timing
+
+MOCK_HITS = {
+    "hits": {
+        "hits": [
+            {
+                "_id": "1",
+                "_score": 3.0,
+                "_source": {
+                    "name": "Manner Coffee",
+                    "location": {"lat": 31.2304, "lon": 121.4737},
+                    "category": "cafe",
+                    "popularity": 50,
+                },
+            }
+        ]
+    }
+}
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    intent_cache.clear()
+    rewrite_cache.clear()
+    yield
+    intent_cache.clear()
+    rewrite_cache.clear()
+
+
+def test_request_timings_header_keeps_slowest_duplicate():
+    timings = timing.RequestTimings()
+    timings.record("nlp", 0.0125)
+    timings.record("recall_rewriting", 0.002)
+    timings.record("recall_rewriting", 0.005)
+    assert timings.header() == "nlp;dur=12.5, recall_rewriting;dur=5.0"
+    assert parse_server_timing(timings.header()) == {
+        "nlp": 12.5,
+        "recall_rewriting": 5.0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_search_sets_server_timing_and_feeds_metrics():
+    with patch(
+        "app.nlp.analyzer.QueryAnalyzer.analyze", new_callable=AsyncMock
+    ) as mock_analyze, patch(
+        "app.nlp.rewriter.QueryRewriter.rewrite", new_callable=AsyncMock
+    ) as mock_rewrite, patch(
+        "app.recall.es_client.AsyncElasticsearch.search", new_callable=AsyncMock
+    ) as mock_es, patch.object(settings, "NLP_MODE", "parallel"), patch.object(
+        settings, "RECALL_MODE", "parallel"
+    ), patch.object(settings, "FAST_PATH_ENABLED", False):
+        mock_analyze.return_value = {"category": "cafe", "keywords": ["coffee"]}
+        mock_rewrite.return_value = ["manner coffee"]
+        mock_es.return_value = MOCK_HITS
+
+        before = timing.STAGE_LATENCY.snapshot(stage="rank")["count"]
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as ac:
+            response = await ac.post(
+                "/search",
+                json={"query": "quiet coffee", "lat": 31.2304, "lon": 121.4737},
+            )
+            metrics = await ac.get("/metrics")
+
+    assert response.status_code == 200
+    stages = parse_server_timing(response.headers["server-timing"])
+    for name in (
+        "total",
+        "nlp",
+        "nlp_analyze",
+        "nlp_rewrite",
+        "recall",
+        "recall_merge",
+        "recall_analysis_keywords",
+        "recall_rewriting",
+        "rank",
+    ):
+        assert name in stages
+    assert stages["total"] >= stages["recall"]
+
+    assert timing.STAGE_LATENCY.snapshot(stage="rank")["count"] == before + 1
+    body = metrics.text
+    assert 'search_stage_seconds_count{stage="nlp_analyze"}' in body
+    assert 'recall_sub_queue_seconds_count{source="rewriting"}' in body
+    assert 'search_stage_candidates_count{stage="merged"}' in body
+
+
+@pytest.mark.asyncio
+async def test_unparsable_llm_reply_is_counted():
+    before = LLM_PARSE_FAILURES.value(component="analyzer")
+    with patch(
+        "app.nlp.analyzer.llm_client.generate_json", new_callable=AsyncMock
+    ) as mock_gen:
+        mock_gen.return_value = "sorry, no JSON here"
+        assert await analyzer.analyze("coffee") == analyzer.fallback()
+        # Transport errors are not parse failures
+        mock_gen.return_value = "ERROR"
+        await analyzer.analyze("coffee")
+    assert LLM_PARSE_FAILURES.value(component="analyzer") == before + 1
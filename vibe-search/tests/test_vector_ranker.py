@@ -0,0 +1,74 @@
+import copy
+import random
+import numpy as np
+import pytest
+from geopy.distance import geodesic
+from app.core.config import settings
+from app.core.geo import haversine_km, haversine_km_batch
+from app.ranking.ranker import ranker
+from app.ranking.vector_ranker import vector_ranker, CandidateColumns
+
+USER_LAT, USER_LON = 31.2304, 121.4737  # The Bund
+
+
+def _candidates(n, seed=7):
+    rng = random.Random(seed)
+    return [
+        {
+            "id": str(i),
+            "name": f"POI {i}",
+            "location": {
+                "lat": USER_LAT + rng.uniform(-0.1, 0.1),
+                "lon": USER_LON + rng.uniform(-0.1, 0.1),
+            },
+            "popularity": rng.randint(0, 100),
+            "es_score": rng.uniform(0, 20),
+        }
+        for i in range(n)
+    ]
+
+
+def test_haversine_within_bounds_of_geodesic():
+    # City scale (<15 km): within 0.5% and 20 m of the WGS-84 geodesic
+    for c in _candidates(200):
+        lat, lon = c["location"]["lat"], c["location"]["lon"]
+        exact = geodesic((USER_LAT, USER_LON), (lat, lon)).km
+        approx = haversine_km(USER_LAT, USER_LON, lat, lon)
+        assert abs(approx - exact) <= max(0.005 * exact, 0.02)
+
+    lats = np.array([31.0, 40.0, -33.9])
+    lons = np.array([121.0, 116.4, 151.2])
+    batch = haversine_km_batch(USER_LAT, USER_LON, lats, lons)
+    for i in range(3):
+        assert batch[i] == pytest.approx(haversine_km(USER_LAT, USER_LON, lats[i], lons[i]))
+
+
+@pytest.mark.parametrize("preference", ["relevance", "distance", "popularity"])
+def test_vector_ranker_parity_with_reference(preference):
+    candidates = _candidates(300)
+    reference = ranker.rank(copy.deepcopy(candidates), USER_LAT, USER_LON, preference)
+    vectorised = vector_ranker.rank(
+        copy.deepcopy(candidates), USER_LAT, USER_LON, preference
+    )
+
+    assert len(vectorised) == settings.RANK_TOP_K
+    # Distance scores move by <1e-3 (haversine vs geodesic), final scores alike
+    for ref, vec in zip(reference, vectorised):
+        assert vec["final_score"] == pytest.approx(ref["final_score"], abs=1e-3)
+        assert vec["distance_km"] == pytest.approx(ref["distance_km"], rel=5e-3, abs=0.02)
+    # Same top-K set; order may only differ between near-equal scores
+    assert {c["id"] for c in vectorised} == {c["id"] for c in reference}
+
+
+def test_top_k_is_ordered_and_stable():
+    final = np.array([0.5, 0.9, 0.5, 0.1, 0.9])
+    assert list(vector_ranker.top_k(final, 3)) == [1, 4, 0]
+    assert list(vector_ranker.top_k(final, 10)) == [1, 4, 0, 2, 3]
+    assert vector_ranker.rank([], USER_LAT, USER_LON) == []
+
+
+def test_columns_default_missing_fields():
+    cols = CandidateColumns.from_candidates(
+        [{"location": {"lat": 1.0, "lon": 2.0}, "es_score": None}]
+    )
+    assert cols.es_scores[0] == 0 and cols.popularity[0] == 0